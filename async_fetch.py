@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Asyncio download of city responses over one pooled HTTP client.
+
+AsyncFetcher runs an event loop in a background thread and hands out a
+concurrent.futures.Future per city, so a caller can start analyzing a city
+(e.g. in a process pool) as soon as its download lands in the cache while
+the others are still in flight.
+
+Requests are spread over every configured endpoint (OVERPASS_URLS: mirrors
+or a local instance). Each endpoint gets its own slot count and minimum
+spacing between requests; a 429/5xx answer, a timeout or a connection error
+puts that endpoint on an exponentially growing cooldown (or whatever its
+Retry-After asks for) and the request is retried on the next endpoint; any
+other HTTP error fails the city at once. Cache writes (gzip, and the
+eviction a commit may trigger) run in the loop's executor, off the loop
+thread.
+
+Needs aiohttp (pip install aiohttp); without it callers fall back to the
+thread-based FetchScheduler.
+"""
+import time
+import asyncio
+import threading
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from overpass_cache import default_cache
+from find_duplicate_intersections import (BACKOFF, OVERPASS_TIMEOUT, RETRY_STATUSES, build_city_query,
+                                          is_city_cached, overpass_endpoints, retry_after_seconds, retry_delay)
+
+class _Retryable(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Endpoint:
+    def __init__(self, url, slots, min_interval):
+        self.url = url
+        self.slots = asyncio.Semaphore(slots)
+        self.min_interval = min_interval
+        self.next_start = 0.0
+        self.failures = 0
+
+    async def wait_turn(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self.next_start)
+        self.next_start = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def cool_down(self, backoff, retry_after=None):
+        delay = retry_delay(self.failures, backoff, retry_after)
+        self.failures += 1
+        self.next_start = max(self.next_start, asyncio.get_running_loop().time() + delay)
+
+class AsyncFetcher:
+    def __init__(self, endpoints=None, per_endpoint=2, concurrency=None, min_interval=2.0, retries=4,
+                 backoff=BACKOFF, timeout=OVERPASS_TIMEOUT[1]):
+        if aiohttp is None:
+            raise RuntimeError("AsyncFetcher needs aiohttp (pip install aiohttp)")
+        self.urls = list(endpoints or overpass_endpoints())
+        # Total requests in flight; defaults to per_endpoint on every endpoint
+        self.concurrency = concurrency or per_endpoint * len(self.urls)
+        self.per_endpoint = per_endpoint
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.loop = None
+        self._next = 0
+
+    def __enter__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _open(self):
+        self.endpoints = [_Endpoint(url, self.per_endpoint, self.min_interval) for url in self.urls]
+        self.limit = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_endpoint)
+        timeout = aiohttp.ClientTimeout(total=self.timeout, sock_connect=OVERPASS_TIMEOUT[0])
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def submit(self, city):
+        """Future resolving to the seconds spent downloading city (0 if it was cached)"""
+        return asyncio.run_coroutine_threadsafe(self.fetch(city), self.loop)
+
+    def _pick_endpoint(self):
+        # The endpoint that can start soonest, round-robin among equals
+        n = len(self.endpoints)
+        order = [self.endpoints[(self._next + k) % n] for k in range(n)]
+        self._next = (self._next + 1) % n
+        return min(order, key=lambda e: e.next_start)
+
+    async def fetch(self, city):
+        """Download city's response into the cache, retrying across endpoints.
+
+        Returns the seconds spent in the downloads themselves; waiting for a
+        slot, an endpoint's turn or a cooldown is not counted.
+        """
+        if is_city_cached(city):
+            return 0.0
+        query = build_city_query(city)
+        cache = default_cache()
+        key = cache.key(query, city)
+        seconds = 0.0
+        for attempt in range(self.retries + 1):
+            endpoint = self._pick_endpoint()
+            try:
+                async with self.limit, endpoint.slots:
+                    await endpoint.wait_turn()
+                    start = time.perf_counter()
+                    try:
+                        await self._download(endpoint.url, query, key)
+                    finally:
+                        seconds += time.perf_counter() - start
+                endpoint.failures = 0
+                return seconds
+            except (_Retryable, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as e:
+                endpoint.cool_down(self.backoff, getattr(e, 'retry_after', None))
+                if attempt == self.retries:
+                    # An expired copy is better than nothing; the worker reads it with allow_stale
+                    if cache.age(key) is not None:
+                        return seconds
+                    raise
+
+    async def _download(self, url, query, key):
+        loop = asyncio.get_running_loop()
+        async with self.session.post(url, data={'data': query}) as response:
+            if response.status in RETRY_STATUSES:
+                raise _Retryable(f"{url}: HTTP {response.status}",
+                                 retry_after_seconds(response.headers.get('Retry-After')))
+            response.raise_for_status()
+            fp = await loop.run_in_executor(None, default_cache().writer, key)
+            try:
+                async for chunk in response.content.iter_chunked(1 << 16):
+                    await loop.run_in_executor(None, fp.write, chunk)
+            except BaseException:
+                await loop.run_in_executor(None, fp.close, False)
+                raise
+            await loop.run_in_executor(None, fp.close)
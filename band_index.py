@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""All-thresholds index of a city: any distance band without re-analysis.
+
+For a street pair, the answer to a [min_distance, max_distance] query is its
+largest intersection-pair distance that is <= max_distance, if that one is
+>= min_distance. So per street pair we keep every intersection-pair distance
+sorted ascending (ties ordered so the first pair in loop order wins, as in
+the kernel), and a band query is one binary search per street pair - no
+Overpass, no graph, no haversines.
+
+Street pairs with so many shared nodes that their table would exceed
+MAX_GROUP_PAIRS entries keep only their points; the kernel answers those
+from the stored coordinates at query time.
+
+The index is tied to the cached Overpass response it was built from and is
+rebuilt once that response expires or is refreshed.
+"""
+import os
+import time
+
+import numpy as np
+
+from distance_kernel import EARTH_RADIUS, _batches, farthest_pairs_flat
+from find_duplicate_intersections import candidate_pairs, city_fetched_at, collect_results, load_city_graph
+from overpass_cache import default_cache
+
+INDEX_DIR = os.environ.get("BAND_INDEX_DIR", ".band_index")
+INDEX_VERSION = 1
+MAX_GROUP_PAIRS = 1 << 16  # about 360 shared nodes
+CHUNK_SIZE = 1_000_000
+
+class BandIndex:
+    def __init__(self, names, pairs, lons, lats, offsets, table_offsets, distances, first, second, fetched_at=None):
+        self.names = names
+        self.pairs = pairs
+        self.lons, self.lats, self.offsets = lons, lats, offsets
+        # Street pair g's sorted distances are distances[table_offsets[g]:table_offsets[g + 1]]
+        self.table_offsets = table_offsets
+        self.distances = distances
+        self.first, self.second = first, second
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def build(cls, graph, fetched_at=None):
+        pairs, lons, lats, offsets = candidate_pairs(graph)
+        counts = np.diff(offsets)
+        tabled = counts * (counts - 1) // 2 <= MAX_GROUP_PAIRS
+        sizes = np.where(tabled, counts * (counts - 1) // 2, 0)
+        table_offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=table_offsets[1:])
+
+        rlons, rlats = np.radians(lons), np.radians(lats)
+        cos_lats = np.cos(rlats)
+        distances = np.empty(table_offsets[-1], dtype=np.float64)
+        first = np.empty(table_offsets[-1], dtype=np.int32)
+        second = np.empty(table_offsets[-1], dtype=np.int32)
+        done = 0
+        # Batches list each group's pairs in loop order, groups in order
+        for group_ids, i, j in _batches(offsets, np.flatnonzero(tabled).tolist(), CHUNK_SIZE):
+            a = (np.sin((rlats[j] - rlats[i]) / 2) ** 2
+                 + cos_lats[i] * cos_lats[j] * np.sin((rlons[j] - rlons[i]) / 2) ** 2)
+            d = 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS
+            # Within a group: ascending distance, and among equal distances the
+            # earliest pair last, so the rightmost hit of a search is the kernel's pick
+            order = np.lexsort((-np.arange(len(d)), d, group_ids))
+            n = len(d)
+            distances[done:done + n] = d[order]
+            first[done:done + n] = (i - offsets[group_ids])[order]
+            second[done:done + n] = (j - offsets[group_ids])[order]
+            done += n
+        return cls(np.array(graph.street_names, dtype=str), pairs, lons, lats, offsets,
+                   table_offsets, distances, first, second, fetched_at)
+
+    def farthest_pairs(self, min_distance=0, max_distance=None):
+        """Same answers as farthest_pairs_flat() on this city's candidate pairs"""
+        counts = np.diff(self.offsets)
+        sizes = np.diff(self.table_offsets)
+        best = [None] * len(self.pairs)
+        tabled = np.flatnonzero(sizes)
+        if len(tabled):
+            # Each table is sorted, so the entries within max_distance are a prefix of it
+            within = np.ones(len(self.distances), dtype=np.int64) if max_distance is None \
+                else (self.distances <= max_distance).astype(np.int64)
+            last = self.table_offsets[tabled] + np.add.reduceat(within, self.table_offsets[tabled]) - 1
+            hit = last >= self.table_offsets[tabled]
+            hit[hit] = self.distances[last[hit]] >= min_distance
+            for g, k in zip(tabled[hit].tolist(), last[hit].tolist()):
+                best[g] = (int(self.first[k]), int(self.second[k]))
+        untabled = np.flatnonzero((sizes == 0) & (counts >= 2))
+        if len(untabled):
+            sub_offsets = np.zeros(len(untabled) + 1, dtype=np.int64)
+            np.cumsum(counts[untabled], out=sub_offsets[1:])
+            points = np.concatenate([np.arange(self.offsets[g], self.offsets[g + 1]) for g in untabled])
+            found = farthest_pairs_flat(self.lons[points], self.lats[points], sub_offsets, min_distance, max_distance)
+            for g, pair in zip(untabled.tolist(), found):
+                best[g] = pair
+        return best
+
+    def results(self, min_distance=0, max_distance=None):
+        best = self.farthest_pairs(min_distance, max_distance)
+        return collect_results(self.names.tolist(), self.pairs, self.lons, self.lats, self.offsets, best)
+
+def index_path(city_name, index_dir=INDEX_DIR):
+    return os.path.join(index_dir, f"{city_name}.npz")
+
+def save_index(city_name, index, index_dir=INDEX_DIR):
+    os.makedirs(index_dir, exist_ok=True)
+    path = index_path(city_name, index_dir)
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, version=INDEX_VERSION, fetched_at=index.fetched_at or 0.0, names=index.names,
+                 pairs=index.pairs, lons=index.lons, lats=index.lats, offsets=index.offsets,
+                 table_offsets=index.table_offsets, distances=index.distances,
+                 first=index.first, second=index.second)
+    os.replace(path + '.tmp', path)
+
+def load_index(city_name, index_dir=INDEX_DIR):
+    """The city's index, or None if it is missing or older than its cached response"""
+    try:
+        with np.load(index_path(city_name, index_dir)) as f:
+            if int(f['version']) != INDEX_VERSION:
+                return None
+            index = BandIndex(*(f[name] for name in ['names', 'pairs', 'lons', 'lats', 'offsets',
+                                                      'table_offsets', 'distances', 'first', 'second']),
+                              fetched_at=float(f['fetched_at']))
+    except FileNotFoundError:
+        return None
+    cache = default_cache()
+    current = city_fetched_at(city_name)
+    if current is not None and current != index.fetched_at:
+        return None
+    if cache.ttl is not None and time.time() - index.fetched_at > cache.ttl:
+        return None
+    return index
+
+def precompute_city(city_name, allow_stale=False, index_dir=INDEX_DIR):
+    """Build and persist a city's index from its (cached) Overpass response"""
+    graph = load_city_graph(city_name, allow_stale=allow_stale)
+    index = BandIndex.build(graph, city_fetched_at(city_name))
+    save_index(city_name, index, index_dir)
+    return index
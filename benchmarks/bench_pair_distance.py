@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Micro-benchmark: NumPy pair-distance kernel vs. the original nested loop.
+
+Groups of HULL_MIN_POINTS or more points take the convex hull path, so a
+larger max_points exercises it more.
+
+Usage: python -m benchmarks.bench_pair_distance [street_pairs] [max_points]
+"""
+import sys
+import time
+import random
+
+from find_duplicate_intersections import haversine
+from distance_kernel import farthest_pairs
+
+def reference_farthest_pairs(groups, min_distance=0, max_distance=None):
+    """The original pure-Python loop, kept as the correctness/speed baseline"""
+    best = []
+    for locations in groups:
+        found, best_distance = None, None
+        for i in range(len(locations)):
+            for j in range(i + 1, len(locations)):
+                lon1, lat1 = locations[i]
+                lon2, lat2 = locations[j]
+                distance = haversine(lon1, lat1, lon2, lat2)
+                if distance >= min_distance and (max_distance is None or distance <= max_distance):
+                    if found is None or distance > best_distance:
+                        found, best_distance = (i, j), distance
+        best.append(found)
+    return best
+
+def make_groups(n_pairs, max_points, seed=0):
+    # Mostly small groups with a long tail, like real street pairs
+    rnd = random.Random(seed)
+    groups = []
+    for _ in range(n_pairs):
+        k = min(max_points, 2 + int(rnd.paretovariate(1.2)))
+        lon, lat = 34.8 + rnd.random() * 0.1, 32.0 + rnd.random() * 0.1
+        groups.append([(lon + rnd.gauss(0, 0.01), lat + rnd.gauss(0, 0.01)) for _ in range(k)])
+    return groups
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    max_points = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    groups = make_groups(n_pairs, max_points)
+    combos = sum(len(g) * (len(g) - 1) // 2 for g in groups)
+    print(f"{n_pairs} street pairs, {combos} point pairs")
+
+    for bounds in [(150, None), (200, 1000)]:
+        expected, t_loop = timed(reference_farthest_pairs, groups, *bounds)
+        actual, t_kernel = timed(farthest_pairs, groups, *bounds)
+        status = "OK" if actual == expected else "MISMATCH"
+        print(f"bounds={bounds}: loop {t_loop:.3f}s | numpy {t_kernel:.3f}s | x{t_loop / t_kernel:.1f} | {status}")
+
+if __name__ == "__main__":
+    main()
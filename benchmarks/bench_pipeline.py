@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Per-stage time and peak memory of the whole pipeline on synthetic cities.
+
+Stages: parse (streaming JSON decode), index (StreetGraph build), pairs
+(street pair enumeration + similar-name filter), distances (farthest pair
+search + result dicts) and export (CSV/JSON/Parquet/HTML). Everything runs
+offline on payloads from benchmarks.synthetic.
+
+Results are compared against benchmarks/baselines.json; a stage counts as a
+regression when it is more than --tolerance slower (or bigger) than its
+baseline and the difference is above the noise floor. Times only compare
+on the machine that recorded the baselines; re-record them with --save
+when switching machines. Peak memory and result counts are portable.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--scale small|medium|large] [--scenario NAME ...]
+    python -m benchmarks.bench_pipeline --save     (record the current numbers as baselines)
+    python -m benchmarks.bench_pipeline --check    (exit 1 on regressions)
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+
+from benchmarks.synthetic import grid_city, long_street_city, organic_city, overpass_body
+from distance_kernel import farthest_pairs_flat
+from find_duplicate_intersections import (candidate_pairs, collect_results, export_to_csv, export_to_html,
+                                          export_to_json, export_to_parquet)
+from overpass_stream import iter_elements
+from street_graph import StreetGraph
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines.json")
+STAGES = ['parse', 'index', 'pairs', 'distances', 'export']
+SCALES = {'small': 1, 'medium': 2, 'large': 4}
+SCENARIOS = {
+    'grid': lambda s: grid_city(size=int(100 * s ** 0.5)),
+    'organic': lambda s: organic_city(size=int(150 * s ** 0.5), streets=600 * s),
+    'long_streets': lambda s: long_street_city(size=int(300 * s ** 0.5), cross_streets=1500 * s),
+}
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.02
+MIN_BYTES = 1 << 20
+
+def run_stages(body, min_distance, max_distance, out_dir, stage_hook):
+    """Run the pipeline once; stage_hook(name) returns a context manager wrapping each stage"""
+    with stage_hook('parse'):
+        elements = list(iter_elements(io.BytesIO(body)))
+    with stage_hook('index'):
+        graph = StreetGraph.from_elements(elements)
+    with stage_hook('pairs'):
+        pairs, lons, lats, offsets = candidate_pairs(graph)
+    with stage_hook('distances'):
+        best = farthest_pairs_flat(lons, lats, offsets, min_distance, max_distance)
+        results = collect_results(graph.street_names, pairs, lons, lats, offsets, best)
+    with stage_hook('export'), redirect_stdout(io.StringIO()):
+        results.sort(key=lambda x: x['distance'], reverse=True)
+        export_to_csv(results, 'bench', out_dir)
+        export_to_json(results, 'bench', out_dir)
+        export_to_parquet(results, 'bench', out_dir)
+        if results:
+            export_to_html(results, 'bench', out_dir)
+    return len(elements), len(results)
+
+class _Timer:
+    def __init__(self, times, name):
+        self.times, self.name = times, name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.times[self.name] = time.perf_counter() - self.start
+
+class _PeakMemory:
+    def __init__(self, peaks, name):
+        self.peaks, self.name = peaks, name
+
+    def __enter__(self):
+        self.base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def __exit__(self, *exc):
+        self.peaks[self.name] = tracemalloc.get_traced_memory()[1] - self.base
+
+def measure(body, min_distance, max_distance, repeat):
+    """Best-of-repeat stage times, then one traced run for per-stage peak memory"""
+    seconds = {stage: float('inf') for stage in STAGES}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for _ in range(repeat):
+            times = {}
+            counts = run_stages(body, min_distance, max_distance, out_dir, lambda name: _Timer(times, name))
+            for stage in STAGES:
+                seconds[stage] = min(seconds[stage], times[stage])
+        peaks = {}
+        tracemalloc.start()
+        run_stages(body, min_distance, max_distance, out_dir, lambda name: _PeakMemory(peaks, name))
+        tracemalloc.stop()
+    return {'elements': counts[0], 'results': counts[1], 'seconds': seconds, 'peak_bytes': peaks}
+
+def compare(current, baseline, tolerance):
+    """Lines describing each stage against its baseline, and the list of regressions"""
+    lines, regressions = [], []
+    for stage in STAGES:
+        t, t0 = current['seconds'][stage], baseline['seconds'][stage]
+        m, m0 = current['peak_bytes'][stage], baseline['peak_bytes'][stage]
+        flags = []
+        if t > t0 * (1 + tolerance) and t - t0 > MIN_SECONDS:
+            flags.append('SLOWER')
+        if m > m0 * (1 + tolerance) and m - m0 > MIN_BYTES:
+            flags.append('BIGGER')
+        if flags:
+            regressions.append(stage)
+        lines.append(f"  {stage:10} {t:8.3f}s (x{t / t0 if t0 else float('inf'):4.2f}) "
+                     f"| peak {m / 2 ** 20:7.1f} MiB (x{m / m0 if m0 else float('inf'):4.2f}) {' '.join(flags)}")
+    return lines, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmark on synthetic cities")
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument('--min-distance', type=float, default=150)
+    parser.add_argument('--max-distance', type=float, default=None)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=0.5)
+    parser.add_argument('--save', action='store_true', help="store the results as the new baselines")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 on regressions")
+    args = parser.parse_args()
+
+    try:
+        with open(BASELINES, 'r', encoding='utf-8') as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    all_regressions = []
+    for name in args.scenario or list(SCENARIOS):
+        key = f"{name}/{args.scale}/{args.min_distance:g}-{args.max_distance or 0:g}"
+        body = overpass_body(SCENARIOS[name](SCALES[args.scale]))
+        current = measure(body, args.min_distance, args.max_distance, args.repeat)
+        print(f"{key}: {current['elements']} elements, {current['results']} results, "
+              f"{len(body) / 2 ** 20:.1f} MiB payload")
+        baseline = baselines.get(key)
+        if baseline is None:
+            for stage in STAGES:
+                print(f"  {stage:10} {current['seconds'][stage]:8.3f}s "
+                      f"| peak {current['peak_bytes'][stage] / 2 ** 20:7.1f} MiB")
+        else:
+            lines, regressions = compare(current, baseline, args.tolerance)
+            print("\n".join(lines))
+            if current['results'] != baseline['results']:
+                print(f"  ! results changed: {baseline['results']} -> {current['results']}")
+            all_regressions += [f"{key} {stage}" for stage in regressions]
+        if args.save:
+            baselines[key] = current
+
+    if args.save:
+        with open(BASELINES, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"baselines saved to {BASELINES}")
+    if all_regressions:
+        print("regressions: " + ", ".join(all_regressions))
+        if args.check:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Build time and peak RSS of the street graph: dict/set structures vs. StreetGraph.
+
+Each structure is built in its own subprocess. The child loads the payload,
+resets the kernel's RSS high-water mark (Linux, see
+instrumentation.reset_peak_rss) and reports how far VmHWM rose above the
+RSS it had before the build, so the numbers are resident memory of the
+build itself rather than Python allocations, and one build cannot inherit
+the other's peak.
+
+Usage:
+    python -m benchmarks.bench_street_graph [grid_size]
+    python -m benchmarks.bench_street_graph --city ירושלים   (uses the Overpass cache)
+"""
+import sys
+import json
+import time
+import subprocess
+from collections import defaultdict
+
+from benchmarks.synthetic import grid_city
+from instrumentation import peak_rss, reset_peak_rss
+from street_graph import StreetGraph
+
+def build_dicts(data):
+    """The original nodes / node_to_streets / street_pairs construction"""
+    nodes = {e['id']: (e['lon'], e['lat']) for e in data['elements'] if e['type'] == 'node'}
+    ways = [e for e in data['elements'] if e['type'] == 'way' and 'name' in e.get('tags', {})]
+    node_to_streets = defaultdict(set)
+    for way in ways:
+        for node_id in way['nodes']:
+            if node_id in nodes:
+                node_to_streets[node_id].add(way['tags']['name'])
+    street_pairs = defaultdict(list)
+    for node_id, streets in node_to_streets.items():
+        if len(streets) >= 2:
+            for s1 in streets:
+                for s2 in streets:
+                    if s1 < s2:
+                        street_pairs[(s1, s2)].append(nodes[node_id])
+    return nodes, node_to_streets, street_pairs
+
+def build_graph(data):
+    graph = StreetGraph.from_elements(data['elements'])
+    return graph, graph.street_pairs()
+
+BUILDERS = {'dict/set': build_dicts, 'StreetGraph': build_graph}
+
+def current_rss():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+def load(source):
+    if source.startswith('city:'):
+        from find_duplicate_intersections import get_city_data
+        return get_city_data(source[len('city:'):])
+    return grid_city(int(source))
+
+def measure(builder, source):
+    """Runs in the child: time and RSS growth of one build, as a dict"""
+    data = load(source)
+    reset = reset_peak_rss()
+    before = current_rss()
+    start = time.perf_counter()
+    result = BUILDERS[builder](data)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+    del result
+    return {'elements': len(data['elements']), 'seconds': elapsed, 'peak_rss': peak,
+            'build_rss': peak - before if reset else None}
+
+def run_child(builder, source):
+    out = subprocess.run([sys.executable, '-m', 'benchmarks.bench_street_graph', '--child', builder, source],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        print(json.dumps(measure(sys.argv[2], sys.argv[3])))
+        return
+    if len(sys.argv) > 2 and sys.argv[1] == '--city':
+        label, source = sys.argv[2], f"city:{sys.argv[2]}"
+    else:
+        size = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+        label, source = f"grid {size}x{size}", str(size)
+    for k, builder in enumerate(BUILDERS):
+        m = run_child(builder, source)
+        if k == 0:
+            print(f"{label}: {m['elements']} elements")
+        build = f"build {m['build_rss'] / 2 ** 20:8.1f} MiB | " if m['build_rss'] is not None else ""
+        print(f"{builder:12} | {m['seconds']:7.3f}s | {build}peak RSS {m['peak_rss'] / 2 ** 20:8.1f} MiB")
+
+if __name__ == "__main__":
+    main()
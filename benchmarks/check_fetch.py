@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Offline check that downloads survive a flaky Overpass.
+
+Two stub endpoints (benchmarks.overpass_stub) answer a share of requests
+with 429/504, and a third configured endpoint refuses connections. A set of
+cities is fetched through each downloader into an empty cache:
+
+- scheduler: FetchScheduler on a thread pool (overpass_post's retries).
+- async: AsyncFetcher (skipped without aiohttp).
+
+Every city must end up in the cache, the stubs must have seen more
+requests than there are cities (failed requests were retried) and both
+must have answered (requests failed over from one endpoint to another).
+
+Usage: python -m benchmarks.check_fetch [--check NAME ...] [--fail-rate 0.5]   (exit 1 on a failure)
+"""
+import os
+import sys
+import socket
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import overpass_cache
+from benchmarks.overpass_stub import serve
+from find_duplicate_intersections import is_city_cached
+
+CITIES = [f"עיר {k}" for k in range(8)]
+# Small waits so the check runs in seconds; the stubs' Retry-After (1s) still applies
+BACKOFF = 0.05
+
+def _dead_url():
+    """An endpoint nothing listens on"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/api/interpreter"
+
+def fetch_scheduler():
+    from fetch_scheduler import FetchScheduler
+    scheduler = FetchScheduler(min_interval=0, retries=6, backoff=BACKOFF)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(scheduler.fetch, CITIES))
+
+def fetch_async():
+    from async_fetch import AsyncFetcher
+    with AsyncFetcher(per_endpoint=2, min_interval=0, retries=12, backoff=BACKOFF) as fetcher:
+        for future in [fetcher.submit(city) for city in CITIES]:
+            future.result()
+
+CHECKS = {'scheduler': fetch_scheduler, 'async': fetch_async}
+
+def run_check(fetch, fail_rate):
+    """Returns (requests the stubs saw, problems)"""
+    stubs = [serve(fail_rate=fail_rate, seed=seed) for seed in (1, 2)]
+    previous = os.environ.get('OVERPASS_URLS')
+    os.environ['OVERPASS_URLS'] = ",".join([_dead_url()] + [url for _, url in stubs])
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            overpass_cache._default_cache = overpass_cache.OverpassCache(tmp)
+            problems = []
+            try:
+                fetch()
+            except Exception as e:
+                problems.append(f"fetch failed: {e!r}")
+            missing = [city for city in CITIES if not is_city_cached(city)]
+            if missing:
+                problems.append(f"not cached: {', '.join(missing)}")
+    finally:
+        overpass_cache._default_cache = None
+        if previous is None:
+            del os.environ['OVERPASS_URLS']
+        else:
+            os.environ['OVERPASS_URLS'] = previous
+        for server, _ in stubs:
+            server.shutdown()
+            server.server_close()
+
+    handlers = [server.RequestHandlerClass for server, _ in stubs]
+    seen = sum(h.requests_seen for h in handlers)
+    if not any(h.failures_sent for h in handlers):
+        problems.append("the stubs never failed a request; raise --fail-rate")
+    elif seen <= len(CITIES):
+        problems.append(f"{seen} requests for {len(CITIES)} cities: failed requests were not retried")
+    idle = [k for k, h in enumerate(handlers) if not h.requests_seen]
+    if idle:
+        problems.append(f"stub {idle} never got a request: no failover")
+    return seen, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retry and failover check against stub endpoints")
+    parser.add_argument('--check', action='append', choices=CHECKS, help="check to run (repeatable; default: all)")
+    parser.add_argument('--fail-rate', type=float, default=0.5, help="share of requests each stub answers 429/504")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.check or list(CHECKS):
+        if name == 'async':
+            from async_fetch import aiohttp
+            if aiohttp is None:
+                print(f"{name}: skipped (aiohttp is not installed)")
+                continue
+        seen, problems = run_check(CHECKS[name], args.fail_rate)
+        print(f"{name}: {len(CITIES)} cities, {seen} requests, {'OK' if not problems else 'FAILED'}")
+        for problem in problems:
+            print(f"  ! {problem}")
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
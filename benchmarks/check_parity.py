@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Offline checks that alternative input paths give the same answers.
+
+- extract: a small generated .osm XML extract read by osm_extract (the
+  iterparse path when pyosmium is missing) against the same streets as an
+  Overpass JSON response, and its municipal boundary against the Overpass
+  "out geom" boundary assembled by municipal_boundaries.
+- national: cities cut out of one streamed country response by
+  municipal_boundaries.partition_by_city against the same cities cut out
+  of the parsed element list the way an Overpass area query would.
+- incremental: run_all_cities --incremental output files after ways were
+  deleted, moved and added against a plain run on the same data (they must
+  be byte-identical), with and without --geometric.
+- geometric: --geometric analysis through run_all_cities (plain and
+  --incremental) against the library call, on a city whose only duplicate
+  meets once at a shared node and once at a near-touch without one.
+- unified: an incremental create_unified_results rebuild after one city
+  changed against a --full rebuild (byte-identical), with cities whose
+  results tie on distance.
+
+Everything runs on synthetic data from benchmarks.synthetic.
+
+Usage: python -m benchmarks.check_parity [--check NAME ...]   (exit 1 on a mismatch)
+"""
+import io
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from contextlib import redirect_stdout
+import xml.etree.ElementTree as ET
+
+from benchmarks.synthetic import organic_city, overpass_body
+from find_duplicate_intersections import analyze_city_data, analyze_graph, find_duplicate_intersections
+from geometric_intersections import DEFAULT_TOLERANCE
+from municipal_boundaries import BoundaryIndex, assemble_rings, partition_by_city
+from osm_extract import load_extract, load_extract_boundaries
+from overpass_stream import iter_elements
+
+CITY = 'עיר לדוגמה'
+
+def _sorted_results(results):
+    return sorted((r['street1'], r['street2'], round(r['distance'], 6)) for r in results)
+
+def _boundary(data, way_id, node_id):
+    """A rectangle around data's nodes as a relation of two open ways, one drawn backwards"""
+    lons = [e['lon'] for e in data['elements'] if e['type'] == 'node']
+    lats = [e['lat'] for e in data['elements'] if e['type'] == 'node']
+    west, east, south, north = min(lons) - 0.001, max(lons) + 0.001, min(lats) - 0.001, max(lats) + 0.001
+    corners = [(west, south), (east, south), (east, north), (west, north)]
+    nodes = [{'type': 'node', 'id': node_id + k, 'lon': lon, 'lat': lat} for k, (lon, lat) in enumerate(corners)]
+    ids = [n['id'] for n in nodes]
+    ways = [{'type': 'way', 'id': way_id, 'nodes': ids[:3], 'tags': {}},
+            {'type': 'way', 'id': way_id + 1, 'nodes': [ids[0], ids[3], ids[2]], 'tags': {}}]
+    relation = {'type': 'relation', 'id': 1, 'members': [{'type': 'way', 'ref': w['id'], 'role': 'outer'}
+                                                         for w in ways],
+                'tags': {'type': 'boundary', 'boundary': 'administrative', 'admin_level': '8', 'name': CITY}}
+    return nodes, ways, relation
+
+def _write_osm_xml(path, nodes, ways, relations):
+    root = ET.Element('osm', version='0.6', generator='check_parity')
+    for n in sorted(nodes, key=lambda n: n['id']):
+        ET.SubElement(root, 'node', id=str(n['id']), lat=repr(n['lat']), lon=repr(n['lon']))
+    for w in sorted(ways, key=lambda w: w['id']):
+        elem = ET.SubElement(root, 'way', id=str(w['id']))
+        for ref in w['nodes']:
+            ET.SubElement(elem, 'nd', ref=str(ref))
+        for k, v in w['tags'].items():
+            ET.SubElement(elem, 'tag', k=k, v=v)
+    for r in relations:
+        elem = ET.SubElement(root, 'relation', id=str(r['id']))
+        for m in r['members']:
+            ET.SubElement(elem, 'member', type=m['type'], ref=str(m['ref']), role=m['role'])
+        for k, v in r['tags'].items():
+            ET.SubElement(elem, 'tag', k=k, v=v)
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+def check_extract():
+    data = organic_city(size=40, streets=80)
+    street_nodes = [e for e in data['elements'] if e['type'] == 'node']
+    street_ways = [e for e in data['elements'] if e['type'] == 'way']
+    # Unnamed and non-highway ways must be skipped by the extract reader, as Overpass skips them
+    street_ways.append({'type': 'way', 'id': 900001, 'nodes': [street_nodes[0]['id'], street_nodes[1]['id']],
+                        'tags': {'highway': 'service'}})
+    street_ways.append({'type': 'way', 'id': 900002, 'nodes': [street_nodes[2]['id'], street_nodes[3]['id']],
+                        'tags': {'waterway': 'stream', 'name': 'נחל'}})
+    b_nodes, b_ways, relation = _boundary(data, way_id=800001, node_id=800001)
+
+    expected = analyze_city_data({'elements': list(iter_elements(io.BytesIO(overpass_body(data))))})
+    # "out geom" gives each member way its coordinates inline
+    coords = {n['id']: (n['lon'], n['lat']) for n in b_nodes}
+    expected_rings = assemble_rings([[coords[n] for n in w['nodes']] for w in b_ways])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic.osm')
+        _write_osm_xml(path, street_nodes + b_nodes, street_ways + b_ways, [relation])
+        results = analyze_city_data(load_extract(path))
+        boundaries = load_extract_boundaries(path, [CITY, 'עיר אחרת'])
+
+    problems = []
+    if _sorted_results(results) != _sorted_results(expected):
+        problems.append(f"results differ: extract {len(results)}, overpass {len(expected)}")
+    if boundaries != {CITY: expected_rings}:
+        problems.append(f"boundaries differ: extract {boundaries}, overpass {expected_rings}")
+    return len(expected), problems
+
+def _area_query(data, index, city):
+    """The elements an Overpass area query for city returns: ways with a node inside, then their nodes"""
+    coords = {e['id']: e for e in data['elements'] if e['type'] == 'node'}
+    ways = [e for e in data['elements'] if e['type'] == 'way'
+            and any(n in coords and city in index.locate(coords[n]['lon'], coords[n]['lat']) for n in e['nodes'])]
+    nodes = list({n: coords[n] for w in ways for n in w['nodes'] if n in coords}.values())
+    return {'elements': ways + nodes}
+
+def check_national():
+    data = organic_city(size=60, streets=150)
+    lons = [e['lon'] for e in data['elements'] if e['type'] == 'node']
+    lats = [e['lat'] for e in data['elements'] if e['type'] == 'node']
+    west, east, south, north = min(lons), max(lons), min(lats), max(lats)
+    # Two overlapping halves (streets near the seam belong to both) and a city with no streets
+    mid, overlap = (west + east) / 2, (east - west) / 20
+    boxes = {'מערב': (west - 1, mid + overlap), 'מזרח': (mid - overlap, east + 1), 'ריקה': (east + 1, east + 2)}
+    boundaries = {city: [[(w, south - 1), (e, south - 1), (e, north + 1), (w, north + 1), (w, south - 1)]]
+                  for city, (w, e) in boxes.items()}
+    index = BoundaryIndex(boundaries)
+
+    graphs = dict(partition_by_city(iter_elements(io.BytesIO(overpass_body(data))), index))
+    problems = []
+    total = 0
+    for city in boundaries:
+        expected = analyze_city_data(_area_query(data, index, city))
+        results = analyze_graph(graphs[city]) if city in graphs else []
+        total += len(expected)
+        if results != expected:
+            problems.append(f"{city}: partition found {len(results)} results, area query {len(expected)}")
+    return total, problems
+
+def _near_touch_city(origin=(34.78, 32.05)):
+    """Two streets sharing one node; 500 m east the second one ends 2 m short of the first"""
+    lon0, lat0 = origin
+    dlon, dlat = 1 / 94300, 1 / 111320  # about a meter each at this latitude
+    points = {1: (0, 0), 2: (250, 0), 3: (500, 0), 4: (750, 0),
+              5: (0, 100), 6: (500, 100), 7: (500, 2)}
+    nodes = [{'type': 'node', 'id': n, 'lon': lon0 + x * dlon, 'lat': lat0 + y * dlat} for n, (x, y) in points.items()]
+    ways = [{'type': 'way', 'id': 1, 'nodes': [1, 2, 3, 4], 'tags': {'highway': 'residential', 'name': 'הרצל'}},
+            {'type': 'way', 'id': 2, 'nodes': [1, 5, 6, 7], 'tags': {'highway': 'residential', 'name': 'ביאליק'}}]
+    return {'elements': ways + nodes}
+
+def check_geometric():
+    from run_all_cities import analyze_city
+
+    problems = []
+    total = 0
+    cwd = os.getcwd()
+    for name, data in [('near_touch', _near_touch_city()), ('organic', organic_city(size=40, streets=80))]:
+        expected = find_duplicate_intersections(CITY, data=data, touch_tolerance=DEFAULT_TOLERANCE)
+        total += len(expected)
+        if name == 'near_touch' and len(expected) != 1:
+            problems.append(f"{name}: library found {len(expected)} results, expected 1")
+        for incremental in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                # The incremental state and results store live under the working directory
+                os.chdir(tmp)
+                try:
+                    with redirect_stdout(io.StringIO()):
+                        item = analyze_city(CITY, tmp, data=data, incremental=incremental,
+                                            touch_tolerance=DEFAULT_TOLERANCE)
+                    json_file = os.path.join(tmp, CITY, f"{CITY}_intersections.json")
+                    results = []
+                    if os.path.exists(json_file):
+                        with open(json_file, 'r', encoding='utf-8') as f:
+                            results = json.load(f)
+                finally:
+                    os.chdir(cwd)
+            path = 'incremental' if incremental else 'plain'
+            if item['count'] != len(expected) or _sorted_results(results) != _sorted_results(expected):
+                problems.append(f"{name}: run_all_cities ({path}) found {item['count']} results, "
+                                f"library {len(expected)}")
+    return total, problems
+
+def _run_city(data, tmp, **options):
+    """analyze_city in tmp (incremental state lives under the working directory); returns its output files"""
+    from run_all_cities import analyze_city
+
+    cwd = os.getcwd()
+    os.chdir(tmp)
+    try:
+        with redirect_stdout(io.StringIO()):
+            analyze_city(CITY, tmp, data=data, **options)
+    finally:
+        os.chdir(cwd)
+    outputs = {}
+    for suffix in ('json', 'csv'):
+        path = os.path.join(tmp, CITY, f"{CITY}_intersections.{suffix}")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                outputs[suffix] = f.read()
+    return outputs
+
+def _edit_city(data, seed=1):
+    """data with some ways deleted, some nodes moved and a way added"""
+    rnd = random.Random(seed)
+    ways = [e for e in data['elements'] if e['type'] == 'way']
+    nodes = [dict(e) for e in data['elements'] if e['type'] == 'node']
+    # Deleting early ways changes the order in which the remaining nodes first appear
+    ways = [w for i, w in enumerate(ways) if not (i < len(ways) // 4 and rnd.random() < 0.3)]
+    for node in rnd.sample(nodes, len(nodes) // 50):
+        node['lon'] += rnd.uniform(-1, 1) * 1e-4
+    ways.append({'type': 'way', 'id': 990001, 'nodes': [n['id'] for n in rnd.sample(nodes, 5)],
+                 'tags': {'highway': 'residential', 'name': 'רחוב חדש'}})
+    return {'elements': ways + nodes}
+
+def check_incremental():
+    before = organic_city(size=40, streets=80)
+    after = _edit_city(before)
+    problems = []
+    total = 0
+    for tolerance in (None, DEFAULT_TOLERANCE):
+        with tempfile.TemporaryDirectory() as inc, tempfile.TemporaryDirectory() as full:
+            _run_city(before, inc, incremental=True, touch_tolerance=tolerance)
+            got = _run_city(after, inc, incremental=True, touch_tolerance=tolerance)
+            expected = _run_city(after, full, touch_tolerance=tolerance)
+        total += expected['json'].count(b'"street1"')
+        for suffix in ('json', 'csv'):
+            if got.get(suffix) != expected.get(suffix):
+                problems.append(f"touch_tolerance={tolerance}: incremental {suffix} differs from a full run")
+    return total, problems
+
+def _unify(results_dir, full=False):
+    from create_unified_results import create_unified_results
+
+    with redirect_stdout(io.StringIO()):
+        create_unified_results(Path(results_dir), full=full)
+    return {suffix: (Path(results_dir) / f"all_cities_unified.{suffix}").read_bytes() for suffix in ('json', 'csv')}
+
+def check_unified():
+    from run_all_cities import save_city_results
+
+    city = organic_city(size=30, streets=60)
+    results = analyze_city_data(city)
+    problems = []
+    with tempfile.TemporaryDirectory() as tmp, redirect_stdout(io.StringIO()):
+        # The same streets in several cities: every result ties with its copies
+        for name in ('אבו גוש', 'בית שמש', 'גבעתיים'):
+            save_city_results(name, results, tmp)
+        _unify(tmp)
+        save_city_results('בית שמש', analyze_city_data(_edit_city(city)), tmp)
+        got = _unify(tmp)
+        expected = _unify(tmp, full=True)
+    total = expected['json'].count(b'"street1"')
+    for suffix in ('json', 'csv'):
+        if got[suffix] != expected[suffix]:
+            problems.append(f"incremental all_cities_unified.{suffix} differs from a --full rebuild")
+    return total, problems
+
+CHECKS = {'extract': check_extract, 'national': check_national, 'incremental': check_incremental,
+          'geometric': check_geometric, 'unified': check_unified}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline parity checks between input paths")
+    parser.add_argument('--check', action='append', choices=CHECKS, help="check to run (repeatable; default: all)")
+    args = parser.parse_args()
+
+    failed = False
+    for name in args.check or list(CHECKS):
+        count, problems = CHECKS[name]()
+        print(f"{name}: {count} results, {'OK' if not problems else 'MISMATCH'}")
+        for problem in problems:
+            print(f"  ! {problem}")
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
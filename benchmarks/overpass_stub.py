@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""A local stand-in for an Overpass endpoint, for offline and failure testing.
+
+Answers every POST with a synthetic organic_city() payload (seeded from the
+query, so a city always gets the same streets), optionally after a delay,
+and can inject 429 / 504 answers to exercise the retry and backoff paths.
+
+Usage:
+    python -m benchmarks.overpass_stub [--port 8765] [--delay 0.5] [--fail-rate 0.3]
+    OVERPASS_URLS=http://127.0.0.1:8765/api/interpreter python run_all_cities.py --async-fetch --workers 0
+"""
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from benchmarks.synthetic import organic_city, overpass_body
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    fail_rate = 0.0
+    streets = 300
+    rnd = random.Random(0)
+    lock = threading.Lock()
+    requests_seen = 0
+    failures_sent = 0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        query = parse_qs(self.rfile.read(length).decode('utf-8')).get('data', [''])[0]
+        cls = type(self)
+        with cls.lock:
+            cls.requests_seen += 1
+            fail = cls.rnd.random() < cls.fail_rate
+            cls.failures_sent += fail
+        time.sleep(cls.delay)
+        if fail:
+            status = cls.rnd.choice([429, 504])
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '1')
+            self.end_headers()
+            return
+        seed = int(hashlib.sha256(query.encode('utf-8')).hexdigest()[:8], 16)
+        body = overpass_body(organic_city(size=80, streets=cls.streets, seed=seed))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=0, delay=0.0, fail_rate=0.0, seed=0):
+    """Start a stub server in a background thread; returns (server, endpoint URL)"""
+    handler = type('Handler', (StubHandler,), {'delay': delay, 'fail_rate': fail_rate,
+                                              'rnd': random.Random(seed), 'lock': threading.Lock()})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/interpreter"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub Overpass endpoint")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before answering")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="share of requests answered 429/504")
+    args = parser.parse_args()
+    server, url = serve(args.port, args.delay, args.fail_rate)
+    print(f"stub Overpass endpoint at {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
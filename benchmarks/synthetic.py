@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Synthetic Overpass-shaped payloads for offline benchmarks.
+
+Three layouts, each a plain {'elements': [...]} dict like get_city_data()
+returns (ways first, then only the nodes they reference):
+
+- grid_city: a regular street grid, every pair of streets meets once.
+- organic_city: winding streets that wander over a jittered lattice and
+  cross each other irregularly, some under near-duplicate names.
+- long_street_city: a few very long streets crossed by many short ones and
+  by each other many times, which makes street pairs with many shared
+  nodes (the convex hull / grid paths of the distance search).
+"""
+import json
+import random
+
+STREET_BASES = ['הרצל', 'ז\'בוטינסקי', 'ויצמן', 'בן גוריון', 'רוטשילד', 'אלנבי', 'ביאליק', 'סוקולוב',
+                'הנביאים', 'יפו', 'העצמאות', 'הגפן', 'התאנה', 'הזית', 'הרימון', 'האלה', 'Main Street']
+NAME_PREFIXES = ['', 'רחוב ', 'שדרות ', 'דרך ']
+
+def grid_city(size=100, spacing=0.001, seed=0, origin=(34.78, 32.05)):
+    """A size x size street grid with one named way per row/column.
+
+    Rows and columns get split into several ways with shared names, and
+    nodes are jittered slightly, roughly like a real city grid.
+    """
+    rnd = random.Random(seed)
+    lon0, lat0 = origin
+    node_id = 1
+    grid = {}
+    nodes = []
+    for x in range(size):
+        for y in range(size):
+            grid[(x, y)] = node_id
+            nodes.append({'type': 'node', 'id': node_id,
+                          'lon': lon0 + x * spacing + rnd.uniform(-1, 1) * spacing * 0.05,
+                          'lat': lat0 + y * spacing + rnd.uniform(-1, 1) * spacing * 0.05})
+            node_id += 1
+
+    ways = []
+    way_id = 1
+    for line in range(size):
+        for axis, name in (('x', f"רחוב {line}"), ('y', f"שדרות {line} צפון")):
+            cells = [(line, k) if axis == 'x' else (k, line) for k in range(size)]
+            # Split each street into a few ways, as OSM usually does
+            cuts = sorted(rnd.sample(range(1, size - 1), min(3, size - 2)))
+            for start, end in zip([0] + cuts, cuts + [size - 1]):
+                ways.append({'type': 'way', 'id': way_id, 'nodes': [grid[c] for c in cells[start:end + 1]],
+                             'tags': {'highway': 'residential', 'name': name}})
+                way_id += 1
+    return {'elements': ways + nodes}
+
+class _Lattice:
+    """Jittered lattice nodes, created on first use"""
+    def __init__(self, rnd, spacing, jitter, origin):
+        self.rnd = rnd
+        self.spacing = spacing
+        self.jitter = jitter
+        self.origin = origin
+        self.ids = {}
+        self.nodes = []
+
+    def node(self, x, y):
+        node_id = self.ids.get((x, y))
+        if node_id is None:
+            node_id = self.ids[(x, y)] = len(self.ids) + 1
+            self.nodes.append({'type': 'node', 'id': node_id,
+                               'lon': self.origin[0] + (x + self.rnd.uniform(-1, 1) * self.jitter) * self.spacing,
+                               'lat': self.origin[1] + (y + self.rnd.uniform(-1, 1) * self.jitter) * self.spacing})
+        return node_id
+
+def _street_name(rnd, k):
+    return f"{rnd.choice(NAME_PREFIXES)}{rnd.choice(STREET_BASES)} {k}"
+
+def _ways(streets, rnd, max_way_nodes=40):
+    """Split (name, node ids) streets into OSM-style ways of bounded length"""
+    ways = []
+    for name, node_ids in streets:
+        start = 0
+        while start < len(node_ids) - 1:
+            end = min(len(node_ids) - 1, start + rnd.randint(max_way_nodes // 2, max_way_nodes))
+            ways.append({'type': 'way', 'id': len(ways) + 1, 'nodes': node_ids[start:end + 1],
+                         'tags': {'highway': 'residential', 'name': name}})
+            start = end
+    return ways
+
+def _walk(lattice, rnd, size, steps, persistence):
+    """A self-avoiding random walk over the lattice.
+
+    At the edge or on its own path the walk tries to turn; it stops only
+    when boxed in or after steps steps.
+    """
+    x, y = rnd.randrange(size), rnd.randrange(size)
+    dx, dy = rnd.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
+    seen = {(x, y)}
+    path = [lattice.node(x, y)]
+    for _ in range(steps):
+        if rnd.random() > persistence:
+            dx, dy = rnd.choice([(dy, dx), (-dy, -dx)])
+        for dx, dy in [(dx, dy)] + rnd.sample([(dy, dx), (-dy, -dx)], 2):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < size and 0 <= ny < size and (nx, ny) not in seen:
+                break
+        else:
+            break
+        x, y = nx, ny
+        seen.add((x, y))
+        path.append(lattice.node(x, y))
+    return path
+
+def _bounce(lattice, rnd, size, steps):
+    """A staircase line of random slope that reflects off the lattice edges,
+    crossing itself and other bouncing streets over and over"""
+    x, y = rnd.randrange(size), rnd.randrange(size)
+    sx, sy = rnd.choice([-1, 1]), rnd.choice([-1, 1])
+    slope, rise = rnd.uniform(0.3, 0.9), 0.0
+    path = [lattice.node(x, y)]
+    for _ in range(steps):
+        if not 0 <= x + sx < size:
+            sx = -sx
+        x += sx
+        path.append(lattice.node(x, y))
+        rise += slope
+        if rise >= 1:
+            rise -= 1
+            if not 0 <= y + sy < size:
+                sy = -sy
+            y += sy
+            path.append(lattice.node(x, y))
+    return path
+
+def organic_city(size=150, streets=600, steps=120, spacing=0.0008, seed=0, origin=(34.78, 32.05)):
+    """Winding streets over a size x size lattice; about 1 in 8 reuses another street's name
+    with a different prefix, so the similar-name filter has work to do."""
+    rnd = random.Random(seed)
+    lattice = _Lattice(rnd, spacing, 0.3, origin)
+    named = []
+    for k in range(streets):
+        path = _walk(lattice, rnd, size, steps, persistence=0.8)
+        if len(path) < 2:
+            continue
+        if named and rnd.random() < 0.125:
+            base = named[rnd.randrange(len(named))][0].split(' ', 1)[-1]
+            name = f"{rnd.choice(NAME_PREFIXES)}{base}"
+        else:
+            name = _street_name(rnd, k)
+        named.append((name, path))
+    return {'elements': _ways(named, rnd) + lattice.nodes}
+
+def long_street_city(size=300, long_streets=8, long_steps=4000, cross_streets=1500, cross_length=30,
+                     spacing=0.0005, seed=0, origin=(34.78, 32.05)):
+    """A few long bouncing streets plus many short straight streets crossing them"""
+    rnd = random.Random(seed)
+    lattice = _Lattice(rnd, spacing, 0.2, origin)
+    named = []
+    for k in range(long_streets):
+        named.append((f"דרך {rnd.choice(STREET_BASES)} {k}", _bounce(lattice, rnd, size, long_steps)))
+    for k in range(cross_streets):
+        x, y = rnd.randrange(size), rnd.randrange(size)
+        if rnd.random() < 0.5:
+            cells = [(x, min(y + i, size - 1)) for i in range(cross_length)]
+        else:
+            cells = [(min(x + i, size - 1), y) for i in range(cross_length)]
+        path = [lattice.node(cx, cy) for cx, cy in dict.fromkeys(cells)]
+        if len(path) >= 2:
+            named.append((_street_name(rnd, long_streets + k), path))
+    return {'elements': _ways(named, rnd) + lattice.nodes}
+
+def overpass_body(data):
+    """Encode a payload the way Overpass sends it (JSON bytes)"""
+    return json.dumps({'version': 0.6, 'generator': 'synthetic', 'elements': data['elements']},
+                      ensure_ascii=False).encode('utf-8')
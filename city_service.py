@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Local service that keeps parsed city graphs warm between queries.
+
+`serve` starts a localhost HTTP server holding a memory-bounded LRU of
+StreetGraphs (plus each city's candidate street pairs), so a query for a
+city it has seen only runs the distance search. `query` is a thin client:
+it imports nothing beyond the standard library, asks the service, and only
+falls back to loading the analysis code in-process when no service answers.
+
+A warm graph is kept for as long as the cached Overpass response it was
+built from is still the one on disk; once a run or a fetch replaces that
+response, the next query reloads the graph. An expired response keeps being
+served, as loading with allow_stale would.
+
+Usage:
+    python city_service.py serve [--port 8767] [--max-memory 1024] [--preload CITY ...]
+    python city_service.py query ירושלים [150] [1000] [--geometric [METERS]] [--json]
+    python city_service.py stats
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+from urllib.parse import parse_qs, urlencode, urlparse
+from urllib.request import urlopen
+
+SERVICE_URL = os.environ.get("CITY_SERVICE_URL", "http://127.0.0.1:8767")
+DEFAULT_MAX_MEMORY = 1024  # MiB of graph arrays kept warm
+GEOMETRIC_TOLERANCE = 3.0  # same default as geometric_intersections, without importing it
+
+class UnknownCity(LookupError):
+    pass
+
+def _nbytes(*arrays):
+    return sum(a.nbytes for a in arrays)
+
+class _Entry:
+    def __init__(self, graph, candidates, fetched_at):
+        self.graph = graph
+        self.candidates = candidates
+        # mtime of the cached response the graph was built from
+        self.fetched_at = fetched_at
+        names = sum(len(name.encode('utf-8')) + 64 for name in graph.street_names)
+        self.nbytes = names + _nbytes(graph.node_ids, graph.lons, graph.lats, graph.offsets, graph.members,
+                                      graph.way_ids, graph.way_streets, graph.way_offsets, graph.way_nodes,
+                                      graph.way_levels, *candidates)
+
+class GraphCache:
+    """LRU of warm city graphs, bounded by the size of their arrays"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # city -> [lock, queries holding or waiting for it]; only cities being queried right now
+        self.loading = {}
+
+    def get(self, city):
+        """(entry, warm) for city, loading it if it is missing or its response was replaced"""
+        from find_duplicate_intersections import city_fetched_at
+        with self.lock:
+            slot = self.loading.setdefault(city, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            # One load per city at a time; queries for other cities go on meanwhile
+            with slot[0]:
+                with self.lock:
+                    entry = self.entries.get(city)
+                if entry is not None:
+                    fetched_at = city_fetched_at(city)
+                    if fetched_at is not None and fetched_at == entry.fetched_at:
+                        with self.lock:
+                            if self.entries.get(city) is entry:
+                                self.entries.move_to_end(city)
+                            self.hits += 1
+                        return entry, True
+                with self.lock:
+                    self.misses += 1
+                entry = self._load(city)
+                with self.lock:
+                    old = self.entries.pop(city, None)
+                    if old is not None:
+                        self.nbytes -= old.nbytes
+                    self.entries[city] = entry
+                    self.nbytes += entry.nbytes
+                    # Always keep the newest entry, even if it alone is over the budget
+                    while self.nbytes > self.max_bytes and len(self.entries) > 1:
+                        _, evicted = self.entries.popitem(last=False)
+                        self.nbytes -= evicted.nbytes
+                return entry, False
+        finally:
+            with self.lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self.loading[city]
+
+    def _load(self, city):
+        from find_duplicate_intersections import candidate_pairs, city_fetched_at, load_city_graph
+        graph = load_city_graph(city, allow_stale=True)
+        if not len(graph.street_names):
+            # Overpass answers an unknown area with no elements at all
+            raise UnknownCity(f"לא נמצאו רחובות עבור '{city}'; האם זה שם של רשות מקומית?")
+        return _Entry(graph, candidate_pairs(graph), city_fetched_at(city))
+
+    def stats(self):
+        with self.lock:
+            return {'cities': list(self.entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+def analyze(cache, city, min_distance=150, max_distance=None, touch_tolerance=None):
+    from distance_kernel import farthest_pairs_flat
+    from find_duplicate_intersections import analyze_graph, collect_results, sorted_results
+    entry, warm = cache.get(city)
+    if touch_tolerance is not None:
+        results = analyze_graph(entry.graph, min_distance, max_distance, touch_tolerance=touch_tolerance)
+    else:
+        pairs, lons, lats, offsets = entry.candidates
+        best = farthest_pairs_flat(lons, lats, offsets, min_distance, max_distance)
+        results = collect_results(entry.graph.street_names, pairs, lons, lats, offsets, best)
+    return sorted_results(results), warm
+
+def _query_args(args):
+    geometric = args.get('geometric')
+    return {
+        'min_distance': float(args.get('min', 150)),
+        'max_distance': float(args['max']) if args.get('max') else None,
+        'touch_tolerance': float(geometric or GEOMETRIC_TOLERANCE) if geometric is not None else None,
+    }
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    cache = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        args = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        if url.path == '/stats':
+            return self._send(200, self.cache.stats())
+        if url.path != '/analyze':
+            return self._send(404, {'error': 'not found'})
+        try:
+            options = _query_args(args)
+            start = time.perf_counter()
+            results, warm = analyze(self.cache, args['city'], **options)
+        except (KeyError, ValueError) as e:
+            return self._send(400, {'error': f"bad query: {e}"})
+        except UnknownCity as e:
+            return self._send(404, {'error': str(e)})
+        except Exception as e:
+            return self._send(500, {'error': str(e)})
+        self._send(200, {'city': args['city'], 'warm': warm, 'seconds': round(time.perf_counter() - start, 4),
+                         'results': results})
+
+    def _send(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host='127.0.0.1', port=8767, max_memory=DEFAULT_MAX_MEMORY, preload=()):
+    cache = GraphCache(max_memory * 2 ** 20)
+    for city in preload:
+        print(f"טוען את {city}...")
+        cache.get(city)
+    handler = type('Handler', (_ServiceHandler,), {'cache': cache})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"השירות פועל בכתובת http://{host}:{server.server_address[1]}/ (עד {max_memory} MiB של גרפים)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def query(city, min_distance=150, max_distance=None, touch_tolerance=None, url=SERVICE_URL):
+    """Ask the service; returns the response dict, or None if no service is running"""
+    params = {'city': city, 'min': min_distance}
+    if max_distance is not None:
+        params['max'] = max_distance
+    if touch_tolerance is not None:
+        params['geometric'] = touch_tolerance
+    try:
+        with urlopen(f"{url}/analyze?{urlencode(params)}") as response:
+            return json.load(response)
+    except URLError as e:
+        # An HTTP error still means a service answered
+        if hasattr(e, 'code'):
+            try:
+                error = json.load(e).get('error')
+            except ValueError:
+                # Not a JSON body: a proxy or some other server on the port
+                raise RuntimeError(f"HTTP {e.code}") from None
+            raise RuntimeError(error) from None
+        return None
+
+def _print_results(results, city, limit=20):
+    print(f"נמצאו {len(results)} תוצאות ב{city}")
+    for r in results[:limit]:
+        print(f"{r['distance']:6.0f} מ' | {r['street1']} ⚬ {r['street2']} | "
+              f"{r['location1'][0]:.6f},{r['location1'][1]:.6f} - {r['location2'][0]:.6f},{r['location2'][1]:.6f}")
+    if len(results) > limit:
+        print(f"... ועוד {len(results) - limit} תוצאות")
+
+def main():
+    parser = argparse.ArgumentParser(description="שירות מקומי לשאילתות חוזרות על ערים")
+    parser.add_argument('--url', default=SERVICE_URL)
+    sub = parser.add_subparsers(dest='command', required=True)
+    srv = sub.add_parser('serve', help="הפעלת השירות")
+    srv.add_argument('--host', default='127.0.0.1')
+    srv.add_argument('--port', type=int, default=8767)
+    srv.add_argument('--max-memory', type=int, default=DEFAULT_MAX_MEMORY, metavar='MIB')
+    srv.add_argument('--preload', nargs='*', default=[], metavar='CITY')
+    q = sub.add_parser('query', help="ניתוח עיר דרך השירות")
+    q.add_argument('city')
+    q.add_argument('min_distance', nargs='?', type=float, default=150)
+    q.add_argument('max_distance', nargs='?', type=float)
+    q.add_argument('--geometric', nargs='?', type=float, const=GEOMETRIC_TOLERANCE, metavar='METERS')
+    q.add_argument('--json', action='store_true', help="פלט JSON מלא")
+    sub.add_parser('stats', help="ערים טעונות ושימוש בזיכרון")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.host, args.port, args.max_memory, args.preload)
+    elif args.command == 'stats':
+        try:
+            with urlopen(f"{args.url}/stats") as response:
+                print(json.dumps(json.load(response), ensure_ascii=False, indent=2))
+        except URLError:
+            print(f"השירות לא פועל ב-{args.url}")
+            sys.exit(1)
+    else:
+        try:
+            response = query(args.city, args.min_distance, args.max_distance, args.geometric, args.url)
+            if response is None:
+                print(f"השירות לא פועל ב-{args.url}, מנתח בתהליך הזה", file=sys.stderr)
+                results, _ = analyze(GraphCache(0), args.city, args.min_distance, args.max_distance, args.geometric)
+            else:
+                results = response['results']
+        except (RuntimeError, UnknownCity) as e:
+            print(f"✗ {e}", file=sys.stderr)
+            sys.exit(1)
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False))
+        else:
+            _print_results(results, args.city)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Columnar (Parquet) storage of results.
+
+One row per result with flat float64 coordinate columns; street and city
+names are dictionary-encoded, so a city's file holds each street name once.
+Downstream analytics can read just the columns they need with read_table()
+instead of parsing the indented JSON.
+
+Needs pyarrow (pip install pyarrow); without it the Parquet exports are
+skipped and everything falls back to the JSON files.
+"""
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+COLUMNS = ['city', 'street1', 'street2', 'distance', 'lat1', 'lon1', 'lat2', 'lon2']
+BATCH_SIZE = 65536  # rows per row group when writing
+# Rows decoded to Python objects at a time when reading; the unified merge holds one batch per city
+READ_BATCH_SIZE = 4096
+
+def available():
+    return pa is not None
+
+def results_table(results, city=None):
+    """Arrow table of results; city (if given) is used instead of each result's 'city'"""
+    if city is not None:
+        cities = pa.DictionaryArray.from_arrays(pa.array([0] * len(results), pa.int32()), pa.array([city]))
+    else:
+        cities = pa.array([r['city'] for r in results], pa.string()).dictionary_encode()
+    return pa.table({
+        'city': cities,
+        'street1': pa.array([r['street1'] for r in results], pa.string()).dictionary_encode(),
+        'street2': pa.array([r['street2'] for r in results], pa.string()).dictionary_encode(),
+        'distance': pa.array([r['distance'] for r in results], pa.float64()),
+        'lat1': pa.array([r['location1'][0] for r in results], pa.float64()),
+        'lon1': pa.array([r['location1'][1] for r in results], pa.float64()),
+        'lat2': pa.array([r['location2'][0] for r in results], pa.float64()),
+        'lon2': pa.array([r['location2'][1] for r in results], pa.float64()),
+    })
+
+def write_results(results, path, city=None):
+    pq.write_table(results_table(results, city), path, compression='zstd', row_group_size=BATCH_SIZE)
+
+class ResultsWriter:
+    """Writes a stream of results to one Parquet file, a row group per BATCH_SIZE results"""
+    def __init__(self, path, city=None, batch_size=BATCH_SIZE):
+        self.path = path
+        self.city = city
+        self.batch_size = batch_size
+        self.batch = []
+        self.writer = None
+
+    def write(self, result):
+        self.batch.append(result)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        table = results_table(self.batch, self.city)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+        self.writer.write_table(table)
+        self.batch = []
+
+    def close(self):
+        # An empty stream still gets a file with the schema
+        if self.batch or self.writer is None:
+            self._flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_table(path, columns=None, filters=None):
+    """Read a results file as an Arrow table (optionally a column/row subset)"""
+    return pq.read_table(path, columns=columns, filters=filters)
+
+def read_sort_keys(path):
+    """(-distance, street1, street2) of every row, from just those columns"""
+    table = pq.read_table(path, columns=['distance', 'street1', 'street2'])
+    distances = table.column('distance').to_pylist()
+    return [(-d, a, b) for d, a, b in zip(distances, table.column('street1').to_pylist(),
+                                          table.column('street2').to_pylist())]
+
+def iter_results(path, with_city=False):
+    """Yield results in the same dict shape the JSON exports use"""
+    # Batch by batch, without pre-buffering whole column chunks, so memory does not grow with the file
+    parquet_file = pq.ParquetFile(path, pre_buffer=False, buffer_size=1 << 16)
+    for batch in parquet_file.iter_batches(batch_size=READ_BATCH_SIZE):
+        cols = {name: batch.column(name).to_pylist() for name in COLUMNS}
+        for i in range(batch.num_rows):
+            result = {
+                'street1': cols['street1'][i],
+                'street2': cols['street2'][i],
+                'distance': cols['distance'][i],
+                'location1': [cols['lat1'][i], cols['lon1'][i]],
+                'location2': [cols['lat2'][i], cols['lon2'][i]],
+            }
+            if with_city:
+                result['city'] = cols['city'][i]
+            yield result
@@ -2,69 +2,242 @@
 import os
 import json
 import csv
+import heapq
+import shutil
+import hashlib
+import argparse
 from pathlib import Path
+from overpass_stream import iter_json_array
+from map_tiles import OFFLINE_CALLBACK, TileWriter
+from find_duplicate_intersections import sorted_results
+import columnar
+from results_store import ResultsStore
 
-def create_unified_results():
-    results_dir = Path("duplicate_intersections_results")
-    all_results = []
+MANIFEST_NAME = ".unified_manifest.json"
+MANIFEST_VERSION = 2  # bumped when the unified order changes, forcing a full rebuild
+UNIFIED_FILES = ["all_cities_unified.json", "all_cities_unified.csv", "all_cities_unified.html", "tiles/index.json"]
+SITE_DIR = Path("docs")  # GitHub Pages
+CSV_HEADER = ['עיר', 'רחוב 1', 'רחוב 2', 'מרחק (מטר)', 'קו רוחב 1', 'קו אורך 1', 'קו רוחב 2', 'קו אורך 2']
+
+class _HashingReader:
+    """Binary file wrapper that hashes everything read through it"""
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.sha256.update(data)
+        return data
+
+def _prefer_parquet(json_file):
+    """The Parquet twin of a JSON results file, if it can be read and is not stale"""
+    parquet_file = json_file.with_suffix('.parquet')
+    if not columnar.available() or not parquet_file.exists():
+        return json_file
+    if json_file.exists() and parquet_file.stat().st_mtime_ns < json_file.stat().st_mtime_ns:
+        return json_file
+    return parquet_file
+
+def _iter_results_file(path, with_city=False):
+    if path.suffix == '.parquet':
+        return columnar.iter_results(path, with_city=with_city)
+    return _iter_json_file(path)
+
+def _iter_json_file(path):
+    with open(path, 'rb') as f:
+        yield from iter_json_array(f)
+
+def _merge_key(result):
+    """Unified order: sorted_results() order, with the city breaking distance ties first"""
+    return (-result['distance'], result['city'], result['street1'], result['street2'])
+
+def _scan_city_file(path):
+    """Content hash, result count and whether the file is in sorted_results() order"""
+    if path.suffix == '.parquet':
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(chunk)
+        # Only the sort columns need decoding
+        keys = columnar.read_sort_keys(path)
+    else:
+        with open(path, 'rb') as f:
+            reader = _HashingReader(f)
+            keys = [(-r['distance'], r['street1'], r['street2']) for r in iter_json_array(reader)]
+            reader.read()
+        sha256 = reader.sha256
+    st = os.stat(path)
+    return {'source': path.name, 'sha256': sha256.hexdigest(), 'count': len(keys),
+            'sorted': all(a <= b for a, b in zip(keys, keys[1:])),
+            'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+def _sort_city_file(path, city):
+    results = sorted_results(_iter_results_file(path))
+    if path.suffix == '.parquet':
+        columnar.write_results(results, path, city=city)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+def _iter_city_results(path, city):
+    for result in _iter_results_file(path):
+        result['city'] = city
+        yield result
+
+def _iter_unified_results(path, skip_cities):
+    for result in _iter_results_file(path, with_city=True):
+        if result['city'] not in skip_cities:
+            yield result
+
+class _JsonArrayWriter:
+    """Writes a JSON array item by item, byte-identical to json.dump(..., indent=2)"""
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, item):
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+        self.f.write(('[\n  ' if self.count == 0 else ',\n  ') + body)
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n]' if self.count else '[]')
+
+def load_manifest(results_dir):
+    try:
+        with open(results_dir / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+def create_unified_results(results_dir=Path("duplicate_intersections_results"), full=False):
+    """Merge per-city results into the unified JSON/CSV/HTML (and Parquet).
+
+    A manifest of per-city file stats and hashes lets a rebuild re-read only
+    the cities that changed. Their sorted streams are k-way merged with the
+    previous unified results (minus changed/removed cities), and the outputs
+    are written as the merge proceeds. Parquet files are read instead of the
+    JSON ones whenever pyarrow is installed and they are up to date.
+    """
+    manifest = load_manifest(results_dir)
+    incremental = (not full and manifest is not None
+                   and all((results_dir / name).exists() for name in UNIFIED_FILES))
+    known = manifest['cities'] if incremental else {}
     
-    # Collect all results from city directories
-    for city_dir in results_dir.iterdir():
-        if city_dir.is_dir():
-            json_file = city_dir / f"{city_dir.name}_intersections.json"
-            if json_file.exists():
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    city_results = json.load(f)
-                    for result in city_results:
-                        result['city'] = city_dir.name
-                        all_results.append(result)
+    cities, changed = {}, []
+    for city_dir in sorted(results_dir.iterdir()):
+        if not city_dir.is_dir():
+            continue
+        source = _prefer_parquet(city_dir / f"{city_dir.name}_intersections.json")
+        if not source.exists():
+            continue
+        city = city_dir.name
+        old = known.get(city)
+        st = source.stat()
+        if (old and old.get('source') == source.name
+                and old['mtime_ns'] == st.st_mtime_ns and old['size'] == st.st_size):
+            cities[city] = old
+            continue
+        entry = _scan_city_file(source)
+        if not entry['sorted']:
+            # The merge needs every city stream in sorted_results() order
+            _sort_city_file(source, city)
+            entry = _scan_city_file(source)
+        cities[city] = entry
+        if not old or old['sha256'] != entry['sha256']:
+            changed.append(city)
+    removed = set(known) - set(cities)
+    update_results_store(results_dir, cities)
     
-    # Sort by distance (descending)
-    all_results.sort(key=lambda x: x['distance'], reverse=True)
+    if incremental and not changed and not removed:
+        if cities != known:
+            _save_manifest(results_dir, cities)
+        print("✓ הקבצים המאוחדים מעודכנים, אין שינויים")
+        return
     
-    # Save unified JSON
-    with open(results_dir / "all_cities_unified.json", 'w', encoding='utf-8') as f:
-        json.dump(all_results, f, ensure_ascii=False, indent=2)
+    streams = []
+    if incremental:
+        previous = _prefer_parquet(results_dir / "all_cities_unified.json")
+        streams.append(_iter_unified_results(previous, set(changed) | removed))
+    for city in changed:
+        streams.append(_iter_city_results(results_dir / city / cities[city]['source'], city))
+    # A full rebuild merges the same way, so ties come out alike either way
+    merged = heapq.merge(*streams, key=_merge_key)
     
-    # Save unified CSV
-    with open(results_dir / "all_cities_unified.csv", 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(['עיר', 'רחוב 1', 'רחוב 2', 'מרחק (מטר)', 'קו רוחב 1', 'קו אורך 1', 'קו רוחב 2', 'קו אורך 2'])
-        for r in all_results:
+    # Every output is written as the merge streams through; nothing holds all results
+    json_tmp = results_dir / "all_cities_unified.json.tmp"
+    csv_tmp = results_dir / "all_cities_unified.csv.tmp"
+    parquet_tmp = results_dir / "all_cities_unified.parquet.tmp"
+    tiles = TileWriter(results_dir)
+    parquet = columnar.ResultsWriter(parquet_tmp) if columnar.available() else None
+    total, result_cities = 0, set()
+    with open(json_tmp, 'w', encoding='utf-8') as jf, open(csv_tmp, 'w', newline='', encoding='utf-8') as cf:
+        json_writer = _JsonArrayWriter(jf)
+        writer = csv.writer(cf)
+        writer.writerow(CSV_HEADER)
+        for r in merged:
+            json_writer.write(r)
             writer.writerow([
                 r['city'], r['street1'], r['street2'], f"{r['distance']:.0f}",
                 r['location1'][0], r['location1'][1], r['location2'][0], r['location2'][1]
             ])
+            if parquet:
+                parquet.write(r)
+            tiles.add(r)
+            total += 1
+            result_cities.add(r['city'])
+        json_writer.close()
+    os.replace(json_tmp, results_dir / "all_cities_unified.json")
+    os.replace(csv_tmp, results_dir / "all_cities_unified.csv")
+    if parquet:
+        parquet.close()
+        os.replace(parquet_tmp, results_dir / "all_cities_unified.parquet")
     
     # Create unified HTML with all cities
-    create_unified_html(all_results, results_dir)
+    if total:
+        create_unified_html(tiles.close(), results_dir)
+    else:
+        tiles.discard()
+    _save_manifest(results_dir, cities)
     
-    print(f"✓ נוצרו קבצים מאוחדים עם {len(all_results)} תוצאות מ-{len(set(r['city'] for r in all_results))} ערים")
+    print(f"✓ נוצרו קבצים מאוחדים עם {total} תוצאות מ-{len(result_cities)} ערים"
+          f" ({len(changed)} ערים עודכנו)")
     print(f"  - all_cities_unified.json")
     print(f"  - all_cities_unified.csv")
     print(f"  - all_cities_unified.html")
 
-def create_unified_html(results, results_dir):
-    if not results:
-        return
-    
-    center_lat = sum(r['location1'][0] + r['location2'][0] for r in results) / (2 * len(results))
-    center_lon = sum(r['location1'][1] + r['location2'][1] for r in results) / (2 * len(results))
-    
-    # Group by city for the list
-    cities = {}
-    for r in results:
-        if r['city'] not in cities:
-            cities[r['city']] = []
-        cities[r['city']].append(r)
-    
+def update_results_store(results_dir, cities):
+    """Bring the SQLite store in line with the per-city files (by their manifest hashes)"""
+    with ResultsStore.for_results_dir(results_dir) as store:
+        stored = store.city_hashes()
+        store.remove_cities(set(stored) - set(cities))
+        updated = [city for city, entry in cities.items() if stored.get(city) != entry['sha256']]
+        for city in updated:
+            entry = cities[city]
+            store.replace_city(city, _iter_results_file(results_dir / city / entry['source']), entry['sha256'])
+    if updated:
+        print(f"✓ מאגר השאילתות עודכן ({len(updated)} ערים)")
+
+def _save_manifest(results_dir, cities):
+    with open(results_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'cities': cities}, f, ensure_ascii=False, indent=2)
+
+def create_unified_html(index, results_dir):
+    """Write the unified map page for a tile index (see map_tiles.TileWriter)"""
+    # The page only embeds the tile index (counts); the results themselves are loaded per map tile
+    index_json = json.dumps(index, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
     html = f"""<!DOCTYPE html>
 <html dir="rtl">
 <head>
     <meta charset="utf-8">
     <title>מפגשי רחובות כפולים - כל הערים בישראל</title>
     <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.css"/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css"/>
     <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+    <script src="https://unpkg.com/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"></script>
     <style>
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         body {{ font-family: Arial, sans-serif; }}
@@ -87,86 +260,204 @@ def create_unified_html(results, results_dir):
         .item-streets {{ font-size: 13px; margin: 3px 0; }}
         .item-distance {{ font-size: 11px; color: #666; }}
         .item.active .item-distance {{ color: #ecf0f1; }}
+        .tile-count {{ background: rgba(231, 76, 60, 0.8); color: white; border-radius: 50%; text-align: center; font-weight: bold; font-size: 12px; }}
     </style>
 </head>
 <body>
     <div id="info">
         <h1>מפגשי רחובות כפולים בישראל</h1>
-        <p class="stats">נמצאו {len(results)} תוצאות ב-{len(cities)} ערים | לחץ על עיר להרחבה ועל תוצאה להתמקדות במפה</p>
+        <p class="stats">נמצאו {index['total']} תוצאות ב-{len(index['cities'])} ערים | לחץ על עיר להרחבה ועל תוצאה להתמקדות במפה</p>
     </div>
     <div id="container">
         <div id="list"></div>
         <div id="map"></div>
     </div>
     <script>
-        const citiesData = {json.dumps(cities, ensure_ascii=False)};
-        
-        const map = L.map('map').setView([{center_lat}, {center_lon}], 8);
+        const map = L.map('map').setView([{index['center'][0]}, {index['center'][1]}], 8);
         L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
             attribution: '© OpenStreetMap'
         }}).addTo(map);
         
-        const markers = {{}};
-        let globalIndex = 0;
+        const overview = L.layerGroup();
+        const cluster = L.markerClusterGroup();
+        const lines = L.layerGroup();
+        const loaded = {{}};   // tile key -> {{layers, keys}}, or a bare token while the fetch is in flight
+        const markers = {{}};  // "cityIndex#num" -> first marker of a result
+        const index = {index_json};
+        index.tileSet = new Set(index.tiles.map(([x, y]) => `${{x}}/${{y}}`));
+        let pendingFocus = null;
+        // Browsers block fetch() on pages opened from disk; tiles are then loaded as tiles/{{z}}/{{x}}/{{y}}.js
+        // scripts, one per tile in view, which hand their records to {OFFLINE_CALLBACK}()
+        const offline = location.protocol === 'file:';
+        const tileWaiters = {{}};  // tile key -> resolve functions of the pending getTile() calls
+        window.{OFFLINE_CALLBACK} = (key, records) => {{
+            (tileWaiters[key] || []).forEach(resolve => resolve(records));
+            delete tileWaiters[key];
+        }};
         
-        Object.entries(citiesData).forEach(([city, cityResults]) => {{
-            cityResults.forEach(item => {{
-                globalIndex++;
-                const idx = globalIndex;
-                const m1 = L.marker([item.location1[0], item.location1[1]]).addTo(map)
-                    .bindPopup(`<b>${{city}}</b><br>${{item.street1}} ⚬ ${{item.street2}}<br>מיקום 1<br>מרחק: ${{item.distance.toFixed(0)}}m`);
-                const m2 = L.marker([item.location2[0], item.location2[1]]).addTo(map)
-                    .bindPopup(`<b>${{city}}</b><br>${{item.street1}} ⚬ ${{item.street2}}<br>מיקום 2<br>מרחק: ${{item.distance.toFixed(0)}}m`);
-                const line = L.polyline([[item.location1[0], item.location1[1]], [item.location2[0], item.location2[1]]], 
-                    {{color: 'red', weight: 2, opacity: 0.5}}).addTo(map);
-                
-                markers[idx] = [m1, m2, item];
+        function getTile(key) {{
+            if (!offline) return fetch(`tiles/${{index.zoom}}/${{key}}.json`).then(r => r.json());
+            return new Promise(resolve => {{
+                (tileWaiters[key] = tileWaiters[key] || []).push(resolve);
+                const script = document.createElement('script');
+                script.src = `tiles/${{index.zoom}}/${{key}}.js`;
+                script.onload = script.onerror = () => script.remove();
+                document.head.appendChild(script);
             }});
-        }});
+        }}
+        
+        function getCityResults(cityIdx, city) {{
+            if (offline) {{
+                // Only the city's own tiles; their records carry each result's position in its city's list
+                const keys = index.cities[cityIdx][2].map(t => `${{index.tiles[t][0]}}/${{index.tiles[t][1]}}`);
+                return Promise.all(keys.map(getTile)).then(tiles => {{
+                    const records = tiles.flat().filter(r => r[0] === cityIdx);
+                    records.sort((a, b) => a[1] - b[1]);
+                    return records.map(([, , street1, street2, distance, lat1, lon1, lat2, lon2]) =>
+                        ({{street1, street2, distance, location1: [lat1, lon1], location2: [lat2, lon2]}}));
+                }});
+            }}
+            const name = encodeURIComponent(city);
+            return fetch(`${{name}}/${{name}}_intersections.json`).then(r => r.json());
+        }}
         
-        const list = document.getElementById('list');
-        let itemIndex = 0;
+        function tileOf(lat, lon, zoom) {{
+            const n = 1 << zoom;
+            const x = Math.floor((lon + 180) / 360 * n);
+            const y = Math.floor((1 - Math.asinh(Math.tan(lat * Math.PI / 180)) / Math.PI) / 2 * n);
+            return [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];
+        }}
+        
+        function visibleTiles() {{
+            const bounds = map.getBounds().pad(0.25);
+            const [x0, y0] = tileOf(bounds.getNorth(), bounds.getWest(), index.zoom);
+            const [x1, y1] = tileOf(bounds.getSouth(), bounds.getEast(), index.zoom);
+            const keys = new Set();
+            for (let x = x0; x <= x1; x++) {{
+                for (let y = y0; y <= y1; y++) {{
+                    if (index.tileSet.has(`${{x}}/${{y}}`)) keys.add(`${{x}}/${{y}}`);
+                }}
+            }}
+            return keys;
+        }}
+        
+        function loadTile(key) {{
+            const token = {{}};
+            loaded[key] = token;
+            getTile(key).then(records => {{
+                if (loaded[key] !== token) return;
+                const layers = [];
+                const keys = [];
+                records.forEach(([cityIdx, num, street1, street2, distance, lat1, lon1, lat2, lon2]) => {{
+                    const city = index.cities[cityIdx][0];
+                    const label = `<b>${{city}} #${{num}}</b><br>${{street1}} ⚬ ${{street2}}`;
+                    const m1 = L.marker([lat1, lon1]).bindPopup(`${{label}}<br>מיקום 1<br>מרחק: ${{distance.toFixed(0)}}m`);
+                    const m2 = L.marker([lat2, lon2]).bindPopup(`${{label}}<br>מיקום 2<br>מרחק: ${{distance.toFixed(0)}}m`);
+                    const line = L.polyline([[lat1, lon1], [lat2, lon2]], {{color: 'red', weight: 2, opacity: 0.5}});
+                    layers.push(m1, m2, line);
+                    markers[`${{cityIdx}}#${{num}}`] = m1;
+                    keys.push(`${{cityIdx}}#${{num}}`);
+                }});
+                cluster.addLayers(layers.filter(l => l instanceof L.Marker));
+                layers.filter(l => l instanceof L.Polyline).forEach(l => lines.addLayer(l));
+                loaded[key] = {{layers, keys}};
+                focusPending();
+            }});
+        }}
         
-        Object.entries(citiesData).forEach(([city, cityResults]) => {{
-            const cityGroup = document.createElement('div');
-            cityGroup.className = 'city-group';
-            
-            const cityHeader = document.createElement('div');
-            cityHeader.className = 'city-header';
-            cityHeader.textContent = `${{city}} (${{cityResults.length}})`;
-            
-            const cityItems = document.createElement('div');
-            cityItems.className = 'city-items';
-            
-            cityResults.forEach(item => {{
-                itemIndex++;
-                const idx = itemIndex;
-                const div = document.createElement('div');
-                div.className = 'item';
-                div.innerHTML = `
-                    <div class="item-num">#${{idx}}</div>
-                    <div class="item-streets">${{item.street1}} ⚬ ${{item.street2}}</div>
-                    <div class="item-distance">מרחק: ${{item.distance.toFixed(0)}} מטר</div>
-                `;
-                div.onclick = () => {{
-                    document.querySelectorAll('.item').forEach(el => el.classList.remove('active'));
-                    div.classList.add('active');
-                    const midLat = (item.location1[0] + item.location2[0]) / 2;
-                    const midLon = (item.location1[1] + item.location2[1]) / 2;
-                    map.setView([midLat, midLon], 16);
-                    markers[idx][0].openPopup();
+        function unloadTile(key) {{
+            const tile = loaded[key];
+            delete loaded[key];
+            if (!tile.layers) return;
+            cluster.removeLayers(tile.layers.filter(l => l instanceof L.Marker));
+            tile.layers.filter(l => l instanceof L.Polyline).forEach(l => lines.removeLayer(l));
+            tile.keys.forEach(k => delete markers[k]);
+        }}
+        
+        function update() {{
+            if (map.getZoom() < index.detail_zoom) {{
+                map.removeLayer(cluster);
+                map.removeLayer(lines);
+                overview.addTo(map);
+                return;
+            }}
+            map.removeLayer(overview);
+            cluster.addTo(map);
+            lines.addTo(map);
+            // Only the tiles around the viewport stay in memory
+            const wanted = visibleTiles();
+            Object.keys(loaded).forEach(key => {{ if (!wanted.has(key)) unloadTile(key); }});
+            wanted.forEach(key => {{ if (!(key in loaded)) loadTile(key); }});
+        }}
+        
+        function focusPending() {{
+            const marker = pendingFocus && markers[pendingFocus];
+            if (!marker) return;
+            pendingFocus = null;
+            cluster.zoomToShowLayer(marker, () => marker.openPopup());
+        }}
+        
+        function buildList() {{
+            const list = document.getElementById('list');
+            index.cities.forEach(([city, count], cityIdx) => {{
+                const cityGroup = document.createElement('div');
+                cityGroup.className = 'city-group';
+                
+                const cityHeader = document.createElement('div');
+                cityHeader.className = 'city-header';
+                cityHeader.textContent = `${{city}} (${{count}})`;
+                
+                const cityItems = document.createElement('div');
+                cityItems.className = 'city-items';
+                let filled = false;
+                
+                cityHeader.onclick = () => {{
+                    cityItems.classList.toggle('open');
+                    if (filled) return;
+                    filled = true;
+                    getCityResults(cityIdx, city).then(cityResults => {{
+                        cityResults.forEach((item, i) => {{
+                            const num = i + 1;
+                            const div = document.createElement('div');
+                            div.className = 'item';
+                            div.innerHTML = `
+                                <div class="item-num">#${{num}}</div>
+                                <div class="item-streets">${{item.street1}} ⚬ ${{item.street2}}</div>
+                                <div class="item-distance">מרחק: ${{item.distance.toFixed(0)}} מטר</div>
+                            `;
+                            div.onclick = () => {{
+                                document.querySelectorAll('.item').forEach(el => el.classList.remove('active'));
+                                div.classList.add('active');
+                                const midLat = (item.location1[0] + item.location2[0]) / 2;
+                                const midLon = (item.location1[1] + item.location2[1]) / 2;
+                                pendingFocus = `${{cityIdx}}#${{num}}`;
+                                map.setView([midLat, midLon], 16);
+                                focusPending();
+                            }};
+                            cityItems.appendChild(div);
+                        }});
+                    }});
                 }};
-                cityItems.appendChild(div);
+                
+                cityGroup.appendChild(cityHeader);
+                cityGroup.appendChild(cityItems);
+                list.appendChild(cityGroup);
+            }});
+        }}
+        
+        function start() {{
+            index.tiles.forEach(([x, y, count, lat, lon]) => {{
+                const size = 24 + 4 * Math.min(Math.floor(Math.log2(count)), 8);
+                L.marker([lat, lon], {{
+                    icon: L.divIcon({{className: 'tile-count', html: `<div style="line-height:${{size}}px">${{count}}</div>`, iconSize: [size, size]}})
+                }}).on('click', () => map.setView([lat, lon], index.detail_zoom)).addTo(overview);
             }});
-            
-            cityHeader.onclick = () => {{
-                cityItems.classList.toggle('open');
-            }};
-            
-            cityGroup.appendChild(cityHeader);
-            cityGroup.appendChild(cityItems);
-            list.appendChild(cityGroup);
-        }});
+            buildList();
+            map.on('moveend', update);
+            update();
+        }}
+        
+        start();
     </script>
 </body>
 </html>"""
@@ -174,5 +465,57 @@ def create_unified_html(results, results_dir):
     with open(results_dir / "all_cities_unified.html", 'w', encoding='utf-8') as f:
         f.write(html)
 
+def publish_site(results_dir=Path("duplicate_intersections_results"), site_dir=SITE_DIR):
+    """Copy the unified map and everything it loads into site_dir (GitHub Pages).
+
+    The page becomes site_dir/index.html, next to a copy of the tiles and of
+    each city's results JSON (for the city lists), so the site works from
+    any static host.
+    """
+    html = results_dir / "all_cities_unified.html"
+    tiles = results_dir / "tiles"
+    if not html.exists() or not (tiles / "index.json").exists():
+        print(f"✗ אין מפה מאוחדת ב-{results_dir}, יש להריץ קודם create_unified_results.py")
+        return
+    site_dir.mkdir(parents=True, exist_ok=True)
+    with open(tiles / "index.json", 'r', encoding='utf-8') as f:
+        cities = [entry[0] for entry in json.load(f)['cities']]
+
+    # Swap the tiles in whole, so tiles that no longer exist don't linger
+    tmp_dir, old_dir = site_dir / "tiles.tmp", site_dir / "tiles.old"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(tiles, tmp_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if (site_dir / "tiles").exists():
+        os.rename(site_dir / "tiles", old_dir)
+    os.rename(tmp_dir, site_dir / "tiles")
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    missing = []
+    for city in cities:
+        source = results_dir / city / f"{city}_intersections.json"
+        if not source.exists():
+            missing.append(city)
+            continue
+        (site_dir / city).mkdir(exist_ok=True)
+        shutil.copy2(source, site_dir / city / source.name)
+    # Cities that no longer have results
+    for city_dir in site_dir.iterdir():
+        if (city_dir.is_dir() and city_dir.name not in cities
+                and [p.name for p in city_dir.iterdir()] == [f"{city_dir.name}_intersections.json"]):
+            shutil.rmtree(city_dir)
+    shutil.copyfile(html, site_dir / "index.html")
+
+    print(f"✓ המפה פורסמה ל-{site_dir} ({len(cities) - len(missing)} ערים)")
+    if missing:
+        print(f"  ! חסרים קובצי תוצאות עבור: {', '.join(missing)}")
+
 if __name__ == "__main__":
-    create_unified_results()
+    parser = argparse.ArgumentParser(description="יצירת קבצי תוצאות מאוחדים לכל הערים")
+    parser.add_argument('--full', action='store_true', help="בנייה מלאה מאפס")
+    parser.add_argument('--publish', nargs='?', const=str(SITE_DIR), metavar='DIR',
+                        help=f"העתקת המפה, האריחים ותוצאות הערים לתיקיית האתר (ברירת מחדל: {SITE_DIR})")
+    args = parser.parse_args()
+    create_unified_results(full=args.full)
+    if args.publish:
+        publish_site(site_dir=Path(args.publish))
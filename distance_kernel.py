@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Batched NumPy search for the farthest intersection pair of each street pair.
+
+All street pairs of a city are flattened into one coordinate array with
+per-pair offsets. Every i<j combination inside each segment is evaluated in
+bulk, distances outside [min_distance, max_distance] are masked out, and a
+segmented argmax picks the winner per street pair - the first maximal (i, j)
+in loop order, exactly as the original nested loop did.
+
+Street pairs with many shared nodes first go through a convex hull +
+rotating calipers step in a local projected plane, which narrows the points
+that can possibly form the farthest pair down to a handful; only those are
+then compared exactly with haversine.
+
+Distance bounds prune before any pair is evaluated: a street pair whose
+bounding box cannot hold two points min_distance apart is skipped, and a
+large street pair whose bounding box reaches past max_distance is searched
+on a spatial grid, visiting only cell pairs that can hold a point pair inside
+[min_distance, max_distance], best candidates first, until no remaining
+cell pair can beat the best pair found.
+"""
+from functools import lru_cache
+from math import asin, cos, sin, sqrt
+
+import numpy as np
+
+EARTH_RADIUS = 6371000
+CHUNK_SIZE = 1_000_000  # point pairs evaluated per batch
+HULL_MIN_POINTS = 48  # below this the all-pairs batch is cheaper than the hull
+GRID_REACH = 3  # grid cells per max_distance in the bounded search
+GRID_BATCH = 1 << 14  # point pairs per step of the bounded search
+
+@lru_cache(maxsize=512)
+def _triu(k):
+    # Row-major i<j order, same as the nested range() loops
+    return np.triu_indices(k, 1)
+
+def flatten_groups(groups):
+    """Turn a list of [(lon, lat), ...] groups into flat lon/lat arrays + offsets"""
+    counts = np.fromiter((len(g) for g in groups), dtype=np.int64, count=len(groups))
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = np.array([p for g in groups for p in g], dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1], offsets
+
+def _batches(offsets, selected, chunk_size):
+    """Yield (group indices, i, j) batches of roughly chunk_size point pairs"""
+    group_ids, first, second, size = [], [], [], 0
+    for g in selected:
+        k = int(offsets[g + 1] - offsets[g])
+        if k < 2:
+            continue
+        i, j = _triu(k)
+        group_ids.append(np.full(len(i), g, dtype=np.int64))
+        first.append(i + offsets[g])
+        second.append(j + offsets[g])
+        size += len(i)
+        if size >= chunk_size:
+            yield np.concatenate(group_ids), np.concatenate(first), np.concatenate(second)
+            group_ids, first, second, size = [], [], [], 0
+    if group_ids:
+        yield np.concatenate(group_ids), np.concatenate(first), np.concatenate(second)
+
+def _haversine_rad(lon1, lat1, lon2, lat2):
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * asin(sqrt(a)) * EARTH_RADIUS
+
+def _cross(ox, oy, ax, ay, bx, by):
+    return (ax - ox) * (by - oy) - (ay - oy) * (bx - ox)
+
+def _convex_hull(x, y):
+    """Andrew's monotone chain; returns indices of the hull in CCW order"""
+    order = sorted(range(len(x)), key=lambda i: (x[i], y[i]))
+    if len(order) < 3:
+        return order
+
+    def half(points):
+        chain = []
+        for p in points:
+            while len(chain) >= 2 and _cross(x[chain[-2]], y[chain[-2]], x[chain[-1]], y[chain[-1]], x[p], y[p]) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain
+
+    lower = half(order)
+    upper = half(reversed(order))
+    return lower[:-1] + upper[:-1]
+
+def _rotating_calipers(hx, hy):
+    """Farthest pair of a convex polygon (hull coordinates in CCW order)"""
+    n = len(hx)
+    if n < 3:
+        return 0, n - 1
+    best, pair = -1.0, (0, 1)
+    j = 1
+    for i in range(n):
+        ni = (i + 1) % n
+        # Advance the opposite caliper while it moves away from edge (i, ni)
+        while (abs(_cross(hx[i], hy[i], hx[ni], hy[ni], hx[(j + 1) % n], hy[(j + 1) % n]))
+               > abs(_cross(hx[i], hy[i], hx[ni], hy[ni], hx[j], hy[j]))):
+            j = (j + 1) % n
+        for a in (i, ni):
+            d = (hx[a] - hx[j]) ** 2 + (hy[a] - hy[j]) ** 2
+            if d > best:
+                best, pair = d, (a, j)
+    return pair
+
+def _extent_bounds(lons, lats, offsets):
+    """Upper bound on the distance between any two points of each group.
+
+    Haversine grows with |dlat|, |dlon| and the cosines of both latitudes, so
+    plugging in the bounding box extents and the largest cosine inside the
+    box bounds every pair in it. Groups with fewer than two points get 0
+    (their box is a single point).
+    """
+    counts = np.diff(offsets)
+    bounds = np.zeros(len(counts))
+    if not (counts >= 2).any():
+        return bounds
+    lons, lats = np.radians(lons), np.radians(lats)
+    # reduceat runs each segment up to the next start, so only non-empty
+    # groups may be used as starts
+    nonempty = np.flatnonzero(counts > 0)
+    starts = offsets[nonempty]
+    lat_lo, lat_hi = np.minimum.reduceat(lats, starts), np.maximum.reduceat(lats, starts)
+    lon_lo, lon_hi = np.minimum.reduceat(lons, starts), np.maximum.reduceat(lons, starts)
+    cos_max = np.where((lat_lo <= 0) & (lat_hi >= 0), 1.0, np.maximum(np.cos(lat_lo), np.cos(lat_hi)))
+    a = np.sin((lat_hi - lat_lo) / 2) ** 2 + cos_max ** 2 * np.sin((lon_hi - lon_lo) / 2) ** 2
+    bounds[nonempty] = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0))) * EARTH_RADIUS
+    return bounds
+
+def _diameter_candidates(lons, lats):
+    """Indices (in input order) of the only points that can form the farthest pair.
+
+    Points are projected onto a local equirectangular plane, where the
+    diameter comes from the convex hull and rotating calipers. The projection
+    distorts distances by at most a factor of (1 +/- eps), so any pair that
+    could beat the calipers' pair under haversine must be at least
+    H / (1 + eps) apart in the plane. A point's farthest partner is always a
+    hull vertex, which makes that an O(k * h) filter.
+    """
+    lons, lats = np.radians(lons), np.radians(lats)
+    lat0 = (lats.min() + lats.max()) / 2
+    x = lons * np.cos(lat0) * EARTH_RADIUS
+    y = lats * EARTH_RADIUS
+
+    unique = {}
+    for i, p in enumerate(zip(x.tolist(), y.tolist())):
+        unique.setdefault(p, i)
+    ids = list(unique.values())
+    hull = [ids[h] for h in _convex_hull([x[i] for i in ids], [y[i] for i in ids])]
+    a, b = _rotating_calipers([x[i] for i in hull], [y[i] for i in hull])
+    a, b = hull[a], hull[b]
+    h_star = _haversine_rad(lons[a], lats[a], lons[b], lats[b])
+
+    planar = np.hypot(x[a] - x[b], y[a] - y[b])
+    eps = (2 * np.abs(np.cos(lats) / np.cos(lat0) - 1).max()
+           + 2 * (planar / EARTH_RADIUS) ** 2 + 1e-9)
+    threshold = h_star / (1 + eps)
+
+    hx, hy = x[hull], y[hull]
+    reach = np.sqrt(((x[:, None] - hx[None, :]) ** 2 + (y[:, None] - hy[None, :]) ** 2).max(axis=1))
+    return np.flatnonzero(reach >= threshold)
+
+def _farthest_pair_grid(lons, lats, min_distance, max_distance, extent, chunk_size):
+    """Farthest pair of one group within [min_distance, max_distance], or None.
+
+    Points are bucketed into square cells of a local equirectangular plane,
+    GRID_REACH cells per max_distance (widened by the projection error eps,
+    as in _diameter_candidates). A cell pair is only visited if the gap and
+    span between its two boxes allow a point pair inside the band; visited
+    cell pairs are sorted by their distance upper bound, and the search stops
+    once that bound falls below the best distance found. Ties go to the first
+    (i, j) in loop order, like the exhaustive search.
+    """
+    lons, lats = np.radians(lons), np.radians(lats)
+    lat0 = (lats.min() + lats.max()) / 2
+    x = lons * np.cos(lat0) * EARTH_RADIUS
+    y = lats * EARTH_RADIUS
+    eps = (2 * np.abs(np.cos(lats) / np.cos(lat0) - 1).max()
+           + 2 * (extent / EARTH_RADIUS) ** 2 + 1e-9)
+    cell = max_distance * (1 + eps) / GRID_REACH
+
+    cx = ((x - x.min()) // cell).astype(np.int64)
+    cy = ((y - y.min()) // cell).astype(np.int64)
+    width = int(cy.max()) + 2 * GRID_REACH + 1
+    keys = cx * width + cy
+    order = np.argsort(keys, kind='stable')
+    cell_keys, cell_starts = np.unique(keys[order], return_index=True)
+    cell_ends = np.r_[cell_starts[1:], len(order)]
+
+    # Cell pairs (c1 <= c2 by key) within GRID_REACH cells of each other
+    first, second, gap, span = [], [], [], []
+    for dx in range(GRID_REACH + 1):
+        for dy in range(-GRID_REACH, GRID_REACH + 1):
+            if dx == 0 and dy < 0:
+                continue
+            target = cell_keys + dx * width + dy
+            pos = np.searchsorted(cell_keys, target)
+            pos[pos == len(cell_keys)] = 0
+            hit = np.flatnonzero(cell_keys[pos] == target)
+            ax, ay = max(dx - 1, 0), max(abs(dy) - 1, 0)
+            first.append(hit)
+            second.append(pos[hit])
+            gap.append(np.full(len(hit), np.hypot(ax, ay) * cell))
+            span.append(np.full(len(hit), np.hypot(dx + 1, abs(dy) + 1) * cell))
+    first, second = np.concatenate(first), np.concatenate(second)
+    gap, span = np.concatenate(gap), np.concatenate(span)
+    # Planar distances are within a factor (1 +/- eps) of the true ones
+    keep = (gap <= max_distance * (1 + eps)) & (span >= min_distance * (1 - eps))
+    first, second = first[keep], second[keep]
+    upper = np.minimum(span[keep] / (1 - eps), max_distance)
+    by_bound = np.argsort(-upper, kind='stable')
+
+    first, second = first[by_bound], second[by_bound]
+    upper = upper[by_bound]
+
+    # Point pairs of each cell pair, enumerated as na * nb (row, column)
+    # combinations; same-cell pairs keep only row < column
+    sizes = cell_ends - cell_starts
+    na, nb = sizes[first], sizes[second]
+    ends = np.cumsum(na * nb)
+    cos_lats = np.cos(lats)
+    batch_size = min(chunk_size, GRID_BATCH)
+    best_d, best = -1.0, None
+    start = 0
+    while start < len(first) and upper[start] >= best_d:
+        # Small batches keep best_d, and with it the cut-off, current
+        done = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, done + batch_size, side='right')), start + 1)
+        cp = np.repeat(np.arange(start, stop), na[start:stop] * nb[start:stop])
+        local = np.arange(done, done + len(cp)) - (ends[cp] - na[cp] * nb[cp])
+        row, col = local // nb[cp], local % nb[cp]
+        i = order[cell_starts[first[cp]] + row]
+        j = order[cell_starts[second[cp]] + col]
+        keep = (first[cp] != second[cp]) | (row < col)
+        i, j = i[keep], j[keep]
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        start = stop
+
+        h = (np.sin((lats[j] - lats[i]) / 2) ** 2
+             + cos_lats[i] * cos_lats[j] * np.sin((lons[j] - lons[i]) / 2) ** 2)
+        d = 2 * np.arcsin(np.sqrt(h)) * EARTH_RADIUS
+        valid = (d >= min_distance) & (d <= max_distance) & (d >= best_d)
+        if not valid.any():
+            continue
+        i, j, d = i[valid], j[valid], d[valid]
+        top = np.flatnonzero(d == d.max())
+        k = top[np.lexsort((j[top], i[top]))[0]]
+        candidate = (int(i[k]), int(j[k]))
+        if d[k] > best_d or candidate < best:
+            best_d, best = d[k], candidate
+    return best
+
+def farthest_pairs(groups, min_distance=0, max_distance=None, chunk_size=CHUNK_SIZE):
+    """For each group of (lon, lat) points, find the farthest pair within the bounds.
+
+    Returns a list aligned with groups holding (i, j) local indices of the
+    winning points, or None when no pair of the group is within bounds.
+    """
+    return farthest_pairs_flat(*flatten_groups(groups), min_distance, max_distance, chunk_size)
+
+def farthest_pairs_flat(lons, lats, offsets, min_distance=0, max_distance=None, chunk_size=CHUNK_SIZE):
+    """farthest_pairs() on flat degree arrays; group g is [offsets[g], offsets[g + 1])"""
+    n_groups = len(offsets) - 1
+    counts = np.diff(offsets)
+    best = [None] * n_groups
+    extent = _extent_bounds(lons, lats, offsets)
+    # Groups that cannot hold two points min_distance apart are never searched
+    live = (counts >= 2) & (extent >= min_distance)
+    large = live & (counts >= HULL_MIN_POINTS)
+    exhaustive = np.flatnonzero(live & (counts < HULL_MIN_POINTS)).tolist()
+    if max_distance is not None:
+        # Large groups that may reach past max_distance go straight to the grid
+        banded = np.flatnonzero(large & (extent > max_distance)).tolist()
+        large &= extent <= max_distance
+    else:
+        banded = []
+    large = np.flatnonzero(large).tolist()
+
+    # The unbounded diameter of a large group comes from a few hull candidates
+    candidates = [_diameter_candidates(lons[offsets[g]:offsets[g + 1]], lats[offsets[g]:offsets[g + 1]])
+                  for g in large]
+    if large:
+        picked = np.concatenate([cand + offsets[g] for g, cand in zip(large, candidates)])
+        cand_offsets = np.zeros(len(large) + 1, dtype=np.int64)
+        np.cumsum([len(c) for c in candidates], out=cand_offsets[1:])
+        diameters = _farthest_pairs_all(lons[picked], lats[picked], cand_offsets, range(len(large)),
+                                        0, None, chunk_size)
+    else:
+        diameters = []
+    for g, cand, found in zip(large, candidates, diameters):
+        i, j = int(cand[found[0]]), int(cand[found[1]])
+        o = offsets[g]
+        distance = _haversine_rad(*np.radians([lons[o + i], lats[o + i], lons[o + j], lats[o + j]]))
+        if distance >= min_distance:
+            best[g] = (i, j)
+    for g in banded:
+        best[g] = _farthest_pair_grid(lons[offsets[g]:offsets[g + 1]], lats[offsets[g]:offsets[g + 1]],
+                                      min_distance, max_distance, extent[g], chunk_size)
+
+    found = _farthest_pairs_all(lons, lats, offsets, exhaustive, min_distance, max_distance, chunk_size)
+    for g in exhaustive:
+        best[g] = found[g]
+    return best
+
+def _farthest_pairs_all(lons, lats, offsets, selected, min_distance, max_distance, chunk_size):
+    best = [None] * (len(offsets) - 1)
+    lons, lats = np.radians(lons), np.radians(lats)
+    cos_lats = np.cos(lats)
+
+    for group_ids, first, second in _batches(offsets, selected, chunk_size):
+        a = (np.sin((lats[second] - lats[first]) / 2) ** 2
+             + cos_lats[first] * cos_lats[second] * np.sin((lons[second] - lons[first]) / 2) ** 2)
+        d = 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS
+        valid = d >= min_distance
+        if max_distance is not None:
+            valid &= d <= max_distance
+        if not valid.any():
+            continue
+        group_ids, first, second, d = group_ids[valid], first[valid], second[valid], d[valid]
+
+        # Segmented argmax: group ids are sorted, so each group is a contiguous run
+        starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+        seg_max = np.maximum.reduceat(d, starts)
+        seg_of = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(d)]))
+        hits = np.flatnonzero(d == seg_max[seg_of])
+        _, first_hit = np.unique(seg_of[hits], return_index=True)
+        for idx in hits[first_hit]:
+            g = int(group_ids[idx])
+            # A group never spans two batches, so this is its final answer
+            best[g] = (int(first[idx] - offsets[g]), int(second[idx] - offsets[g]))
+    return best
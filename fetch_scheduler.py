@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Polite, bounded scheduling of Overpass downloads.
+
+Concurrency is bounded by the caller's thread pool; the scheduler spaces
+requests at least min_interval seconds apart across all threads; retries,
+backoff and endpoint failover are overpass_post's. Cities already in the cache skip the
+queue entirely. Responses go straight to the cache; analysis workers read
+them from there.
+"""
+import time
+import threading
+
+from overpass_cache import default_cache
+from find_duplicate_intersections import BACKOFF, RETRIES, _requests, build_city_query, fetch_to_cache, is_city_cached
+
+class FetchScheduler:
+    def __init__(self, min_interval=2.0, retries=RETRIES, backoff=BACKOFF):
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def fetch(self, city):
+        """Make sure the city's response is in the on-disk cache.
+
+        The body is streamed to disk unparsed; worker processes parse it
+        from there. If the download fails for good but an expired copy
+        exists, that copy is left for the worker to use; errors other than
+        HTTP ones propagate. Returns the seconds spent downloading, not
+        counting the wait for this city's turn (0 if it was cached).
+        """
+        if is_city_cached(city):
+            return 0.0
+        self._wait_turn()
+        start = time.perf_counter()
+        try:
+            fetch_to_cache(build_city_query(city), city, retries=self.retries, backoff=self.backoff)
+        except _requests().RequestException:
+            cache = default_cache()
+            if cache.age(cache.key(build_city_query(city), city)) is None:
+                raise
+        return time.perf_counter() - start
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
+import os
 import sys
 import json
 import csv
-import requests
-from collections import defaultdict
+import time
+import random
 from math import radians, cos, sin, asin, sqrt
+from overpass_cache import default_cache
+from overpass_stream import iter_elements
+# numpy and the analysis modules built on it are imported where they're used: they take
+# ~100 ms to load, which fetching, cache checks and the usage message don't need
 
 def haversine(lon1, lat1, lon2, lat2):
     lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
@@ -13,10 +18,93 @@ def haversine(lon1, lat1, lon2, lat2):
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     return 2 * asin(sqrt(a)) * 6371000
 
-def get_city_data(city_name):
-    overpass_url = "http://overpass-api.de/api/interpreter"
-    query = f"""
-    [out:json];
+OVERPASS_URL = "http://overpass-api.de/api/interpreter"
+# (connect, read) seconds; Overpass may legitimately think for minutes
+OVERPASS_TIMEOUT = (10, float(os.environ.get("OVERPASS_TIMEOUT", 300)))
+# Overpass answers 429 when we're over our slot quota and 504 when it's overloaded
+RETRY_STATUSES = (429, 502, 503, 504)
+# Rounds over all endpoints per request, and the base of the exponential wait between rounds
+RETRIES = 3
+BACKOFF = 5.0
+
+SNAPSHOT_SUFFIX = ".sgraph"
+
+_session = None
+_session_pid = None
+
+def overpass_endpoints():
+    """Overpass endpoints to use, in order of preference (OVERPASS_URLS, comma separated)"""
+    urls = [url.strip() for url in os.environ.get("OVERPASS_URLS", "").split(",") if url.strip()]
+    return urls or [OVERPASS_URL]
+
+def _requests():
+    # requests/urllib3 are slow to import and only needed on a cache miss
+    import requests
+    return requests
+
+def http_session():
+    """A pooled session (per process).
+
+    It makes one attempt per request: overpass_post does the retrying, and
+    another retry layer here would multiply its attempts and sleeps.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        requests = _requests()
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(max_retries=0, pool_maxsize=8)
+        _session = requests.Session()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+        _session_pid = os.getpid()
+    return _session
+
+def retry_after_seconds(value):
+    """A Retry-After header in seconds, or None (the HTTP-date form is ignored)"""
+    return float(value) if value and value.isdigit() else None
+
+def retry_delay(attempt, backoff=BACKOFF, retry_after=None):
+    """Seconds to wait before retry number attempt + 1: exponential with jitter, at least Retry-After"""
+    delay = backoff * (2 ** attempt + random.random())
+    return max(delay, retry_after) if retry_after is not None else delay
+
+def overpass_post(query, stream=False, retries=RETRIES, backoff=BACKOFF):
+    """POST a query, failing over across endpoints and retrying with backoff.
+
+    Each round tries the endpoints in order. A 429/5xx answer, a timeout or
+    a connection error moves on to the next endpoint; when a whole round
+    fails we wait retry_delay() and start another. Any other HTTP error
+    (400 for a bad query, 403, 404) is raised at once.
+    """
+    requests = _requests()
+    for attempt in range(retries + 1):
+        error, retry_after = None, None
+        for url in overpass_endpoints():
+            try:
+                response = http_session().post(url, data={"data": query}, stream=stream, timeout=OVERPASS_TIMEOUT)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                error = requests.HTTPError(f"{url}: HTTP {response.status_code}", response=response)
+                seconds = retry_after_seconds(response.headers.get('Retry-After'))
+                if seconds is not None:
+                    retry_after = max(retry_after or 0, seconds)
+                response.close()
+                continue
+            response.raise_for_status()
+            return response
+        if attempt < retries:
+            time.sleep(retry_delay(attempt, backoff, retry_after))
+    raise error
+
+def build_city_query(city_name, bbox=None):
+    settings = "[out:json]"
+    if bbox:
+        # bbox is (south, west, north, east), as Overpass expects
+        settings += "[bbox:{},{},{},{}]".format(*bbox)
+    return f"""
+    {settings};
     area["name"="{city_name}"]["admin_level"~"^(7|8)$"]["boundary"="administrative"]->.city;
     (
       way(area.city)["highway"]["name"];
@@ -25,90 +113,284 @@ def get_city_data(city_name):
     >;
     out skel qt;
     """
-    response = requests.post(overpass_url, data={"data": query})
-    return response.json()
 
-def are_similar_names(name1, name2):
-    """Check if two street names are essentially the same (just different order/spelling)"""
-    # Normalize: lowercase, remove common prefixes/suffixes, split to words
-    def normalize(name):
-        name = name.lower()
-        # Remove common prefixes
-        for prefix in ['רחוב ', 'שדרות ', 'דרך ', 'רח\' ', 'שד\' ']:
-            if name.startswith(prefix):
-                name = name[len(prefix):]
-        return set(name.split())
+def is_city_cached(city_name, bbox=None):
+    cache = default_cache()
+    return cache.is_fresh(cache.key(build_city_query(city_name, bbox), city_name, bbox))
+
+def is_runtime_error(meta):
+    """Overpass reports timeouts/out-of-memory as a 200 with a remark; such answers must not be cached"""
+    return 'runtime error' in meta.get('remark', '')
+
+def _fetch_or_stale(fetch, key, label, errors=()):
+    """Call fetch(), falling back to key's expired cache entry if it fails.
+
+    Returns (fetch's result, None), or (None, a stream of the expired body)
+    when a RequestException (or one of errors) is covered by an expired copy.
+    Without a copy the error propagates.
+    """
+    try:
+        return fetch(), None
+    except (_requests().RequestException, *errors):
+        # Refresh failed - an expired copy is better than nothing
+        fp = default_cache().open(key, allow_stale=True)
+        if fp is None:
+            raise
+        print(f"⚠ משתמש בנתונים שמורים ישנים עבור {label}")
+        return None, fp
+
+def overpass_query(query, label=None, bbox=None, use_cache=True, refresh=False):
+    if not use_cache:
+        return overpass_post(query).json()
     
-    words1 = normalize(name1)
-    words2 = normalize(name2)
+    cache = default_cache()
+    key = cache.key(query, label, bbox)
+    if not refresh:
+        body = cache.get(key)
+        if body is not None:
+            return json.loads(body)
     
-    # If one set is subset of the other, they're similar
-    if words1.issubset(words2) or words2.issubset(words1):
-        return True
+    def fetch():
+        response = overpass_post(query)
+        return response, response.json()
+    fetched, stale = _fetch_or_stale(fetch, key, label, (ValueError,))
+    if stale is not None:
+        with stale:
+            return json.load(stale)
     
-    # If they share most words (>70%), they're similar
-    if len(words1) > 0 and len(words2) > 0:
-        common = len(words1 & words2)
-        similarity = common / max(len(words1), len(words2))
-        if similarity > 0.7:
-            return True
+    response, data = fetched
+    if not is_runtime_error(data):
+        cache.put(key, response.content)
+    return data
+
+def get_city_data(city_name, bbox=None, use_cache=True, refresh=False):
+    return overpass_query(build_city_query(city_name, bbox), city_name, bbox, use_cache, refresh)
+
+def fetch_to_cache(query, label=None, bbox=None, retries=RETRIES, backoff=BACKOFF):
+    """Stream a query's response body straight into the cache without parsing it"""
+    cache = default_cache()
+    key = cache.key(query, label, bbox)
+    with overpass_post(query, stream=True, retries=retries, backoff=backoff) as response, cache.writer(key) as fp:
+        for chunk in response.iter_content(1 << 16):
+            fp.write(chunk)
+    return key
+
+def open_overpass_stream(query, label=None, bbox=None, refresh=False, allow_stale=False):
+    """Return (cache_key, binary stream of the response body), fetching on a miss"""
+    cache = default_cache()
+    key = cache.key(query, label, bbox)
+    if not refresh:
+        fp = cache.open(key, allow_stale=allow_stale)
+        if fp is not None:
+            return key, fp
     
-    return False
+    import instrumentation
+
+    def fetch():
+        with instrumentation.stage('fetch'):
+            fetch_to_cache(query, label, bbox)
+    _, stale = _fetch_or_stale(fetch, key, label)
+    return key, stale if stale is not None else cache.open(key, allow_stale=True)
+
+def snapshot_path(key):
+    # Kept next to the cached response, so the cache evicts and discards it with the response
+    return default_cache().companion_path(key, SNAPSHOT_SUFFIX)
+
+def _fetched_at(cache, key):
+    try:
+        return os.stat(cache.path(key)).st_mtime
+    except FileNotFoundError:
+        return None
+
+def city_fetched_at(city_name, bbox=None):
+    """When the city's cached response was fetched (its mtime), or None if it is not cached"""
+    cache = default_cache()
+    return _fetched_at(cache, cache.key(build_city_query(city_name, bbox), city_name, bbox))
 
-def find_duplicate_intersections(city_name, min_distance=150, max_distance=None):
+def _open_snapshot(key, allow_stale=False):
+    """The graph snapshot of a cached response, if it was taken from the entry that is cached now"""
+    from street_graph import StreetGraph
+    cache = default_cache()
+    fetched_at = _fetched_at(cache, key)
+    if fetched_at is None or not (allow_stale or cache.is_fresh(key)):
+        return None
+    loaded = StreetGraph.load(snapshot_path(key))
+    if loaded is None or loaded[1].get('fetched_at') != fetched_at:
+        return None
+    # Mark the response as recently used, as reading it would have
+    cache.touch(key)
+    return loaded[0]
+
+def load_city_graph(city_name, bbox=None, refresh=False, allow_stale=False):
+    """A city's StreetGraph: mapped from its snapshot, or built in one streaming pass over its response.
+
+    A snapshot is written after every build, so later runs (and parallel
+    workers) on the same cached response skip parsing altogether.
+    """
+    import instrumentation
+    from street_graph import StreetGraph
+    query = build_city_query(city_name, bbox)
+    if not refresh:
+        with instrumentation.stage('index'):
+            graph = _open_snapshot(default_cache().key(query, city_name, bbox), allow_stale)
+        if graph is not None:
+            return graph
+    key, fp = open_overpass_stream(query, city_name, bbox, refresh, allow_stale)
+    meta = {}
+    with fp, instrumentation.stage('index'):
+        # Parsing and graph building interleave; the element iterator's share is 'parse'
+        graph = StreetGraph.from_elements(instrumentation.timed_iter(iter_elements(fp, meta), 'parse', 'elements'))
+    if is_runtime_error(meta):
+        default_cache().discard(key)
+    else:
+        fetched_at = _fetched_at(default_cache(), key)
+        if fetched_at is not None:
+            with instrumentation.stage('index'):
+                default_cache().save_companion(key, SNAPSHOT_SUFFIX,
+                                               lambda path: graph.save(path, fetched_at=fetched_at))
+    return graph
+
+def are_similar_names(name1, name2):
+    """Check if two street names are essentially the same (just different order/spelling)"""
+    from street_names import name_tokens, tokens_similar
+    return tokens_similar(name_tokens(name1), name_tokens(name2))
+
+def find_duplicate_intersections(city_name, min_distance=150, max_distance=None, data=None, allow_stale=False,
+                                 touch_tolerance=None):
+    if data is not None:
+        return analyze_city_data(data, min_distance, max_distance, touch_tolerance)
     print(f"מוריד נתונים עבור {city_name}...")
-    data = get_city_data(city_name)
-    
-    nodes = {e['id']: (e['lon'], e['lat']) for e in data['elements'] if e['type'] == 'node'}
-    ways = [e for e in data['elements'] if e['type'] == 'way' and 'name' in e.get('tags', {})]
-    
-    node_to_streets = defaultdict(set)
-    for way in ways:
-        street_name = way['tags']['name']
-        for node_id in way['nodes']:
-            if node_id in nodes:
-                node_to_streets[node_id].add(street_name)
-    
-    street_pairs = defaultdict(list)
-    for node_id, streets in node_to_streets.items():
-        if len(streets) >= 2:
-            for s1 in streets:
-                for s2 in streets:
-                    if s1 < s2:
-                        pair = (s1, s2)
-                        street_pairs[pair].append(nodes[node_id])
+    return analyze_graph(load_city_graph(city_name, allow_stale=allow_stale), min_distance, max_distance,
+                         touch_tolerance=touch_tolerance)
+
+def analyze_city_data(data, min_distance=150, max_distance=None, touch_tolerance=None):
+    return analyze_graph(build_graph(data), min_distance, max_distance, touch_tolerance=touch_tolerance)
+
+def build_graph(data):
+    """StreetGraph of an already parsed {'elements': [...]} payload"""
+    import instrumentation
+    from street_graph import StreetGraph
+    instrumentation.count('elements', len(data['elements']))
+    with instrumentation.stage('index'):
+        return StreetGraph.from_elements(data['elements'])
+
+def analyze_graph(graph, min_distance=150, max_distance=None, streets=None, touch_tolerance=None,
+                  point_orders=None):
+    """Find duplicate intersections in a StreetGraph.
+
+    If streets (an iterable of street ids) is given, only street pairs that
+    involve at least one of them are analyzed. If touch_tolerance (meters)
+    is given, streets that cross or nearly touch without a shared node meet
+    there too (see geometric_intersections).
+
+    point_orders is for incremental runs: a {(street1, street2): digest}
+    dict of results carried over from an earlier run. Those pairs are
+    analyzed again, even outside streets, when their meeting points no
+    longer come in the same order. On return it also holds the digest of
+    every pair that has a result.
+    """
+    import instrumentation
+    from distance_kernel import farthest_pairs_flat
+    instrumentation.count('nodes', len(graph))
+    instrumentation.count('ways', len(graph.way_ids))
+    instrumentation.count('streets', len(graph.street_names))
+    hits = None
+    if touch_tolerance is not None:
+        from geometric_intersections import find_geometric_intersections
+        with instrumentation.stage('geometry'):
+            hits = find_geometric_intersections(graph, touch_tolerance)
+        instrumentation.count('geometric_hits', len(hits[0]))
+    with instrumentation.stage('pairs'):
+        pairs, lons, lats, offsets = candidate_pairs(graph, streets, hits, touch_tolerance, point_orders)
+    instrumentation.count('street_pairs', len(pairs))
+    instrumentation.count('intersections', len(lons))
+    with instrumentation.stage('distances'):
+        # Keep only the intersection with maximum distance for each street pair
+        best = farthest_pairs_flat(lons, lats, offsets, min_distance, max_distance)
+        results = collect_results(graph.street_names, pairs, lons, lats, offsets, best)
+    if point_orders is not None:
+        for r, p in zip(results, [p for p, found in enumerate(best) if found is not None]):
+            point_orders[r['street1'], r['street2']] = points_digest(lons[offsets[p]:offsets[p + 1]],
+                                                                     lats[offsets[p]:offsets[p + 1]])
+    instrumentation.count('results', len(results))
+    return results
+
+def candidate_pairs(graph, streets=None, hits=None, touch_tolerance=None, point_orders=None):
+    """Street pairs that meet at least twice and whose names are not similar.
+
+    Returns (pairs, lons, lats, offsets): the meeting points of pair p are
+    lons/lats[offsets[p]:offsets[p + 1]] - its shared nodes in order of
+    first appearance, then any geometric hits (from
+    find_geometric_intersections) not already there. With streets, pairs
+    in point_orders whose points digest differs are kept too (see
+    analyze_graph).
+    """
+    import numpy as np
+    from street_names import NameIndex
+    pairs, pair_offsets, pair_nodes = graph.street_pairs()
+    lons, lats = graph.lons[pair_nodes], graph.lats[pair_nodes]
+    if hits is not None:
+        from geometric_intersections import merge_hits
+        pairs, pair_offsets, lons, lats = merge_hits(pairs, pair_offsets, lons, lats, hits, touch_tolerance)
+    counts = np.diff(pair_offsets)
     
+    keep = counts >= 2
+    if streets is not None:
+        streets = np.fromiter(streets, dtype=np.int64)
+        keep &= np.isin(pairs[:, 0], streets) | np.isin(pairs[:, 1], streets)
+        if point_orders:
+            # Deleting ways changes the order in which the remaining nodes first
+            # appear, which can swap location1/location2 or pick another of
+            # equally distant points; such carried-over pairs are redone
+            street_ids = {name: i for i, name in enumerate(graph.street_names)}
+            n = len(graph.street_names)
+            keys = pairs[:, 0].astype(np.int64) * n + pairs[:, 1]
+            carried = list(point_orders.items())
+            wanted = np.array([street_ids[a] * n + street_ids[b] for (a, b), _ in carried], dtype=np.int64)
+            found = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+            for p, key, (_, digest) in zip(found.tolist(), wanted.tolist(), carried):
+                if len(keys) and keys[p] == key and not keep[p]:
+                    start, end = pair_offsets[p], pair_offsets[p + 1]
+                    keep[p] = points_digest(lons[start:end], lats[start:end]) != digest
+    # Skip if street names are too similar (likely same street with inconsistent naming)
+    keep[keep] = ~NameIndex(graph.street_names).similar_mask(pairs[keep])
+    pairs = pairs[keep]
+    points = np.repeat(keep, counts)
+    offsets = np.zeros(len(pairs) + 1, dtype=np.int64)
+    np.cumsum(counts[keep], out=offsets[1:])
+    return pairs, lons[points], lats[points], offsets
+
+def points_digest(lons, lats):
+    """Short hash of a street pair's meeting points, in order"""
+    import hashlib
+    import numpy as np
+    h = hashlib.blake2b(np.ascontiguousarray(lons).tobytes(), digest_size=8)
+    h.update(np.ascontiguousarray(lats).tobytes())
+    return h.hexdigest()
+
+def sorted_results(results):
+    """Results by descending distance, ties in street pair order (the order analyze_graph returns them in)"""
+    return sorted(results, key=lambda r: (-r['distance'], r['street1'], r['street2']))
+
+def collect_results(names, pairs, lons, lats, offsets, best):
+    """Result dicts for the street pairs that farthest_pairs_flat() found a pair for"""
     results = []
-    seen_pairs = {}  # Track street pairs and keep only the one with max distance
-    
-    for (street1, street2), locations in street_pairs.items():
-        # Skip if street names are too similar (likely same street with inconsistent naming)
-        if are_similar_names(street1, street2):
+    for (a, b), start, found in zip(pairs.tolist(), offsets.tolist(), best):
+        if found is None:
             continue
-            
-        if len(locations) >= 2:
-            for i in range(len(locations)):
-                for j in range(i + 1, len(locations)):
-                    lon1, lat1 = locations[i]
-                    lon2, lat2 = locations[j]
-                    distance = haversine(lon1, lat1, lon2, lat2)
-                    if distance >= min_distance and (max_distance is None or distance <= max_distance):
-                        pair_key = (street1, street2)
-                        # Keep only the intersection with maximum distance for each street pair
-                        if pair_key not in seen_pairs or distance > seen_pairs[pair_key]['distance']:
-                            seen_pairs[pair_key] = {
-                                'street1': street1,
-                                'street2': street2,
-                                'distance': distance,
-                                'location1': (lat1, lon1),
-                                'location2': (lat2, lon2)
-                            }
-    
-    results = list(seen_pairs.values())
+        lon1, lat1 = float(lons[start + found[0]]), float(lats[start + found[0]])
+        lon2, lat2 = float(lons[start + found[1]]), float(lats[start + found[1]])
+        results.append({
+            'street1': names[a],
+            'street2': names[b],
+            'distance': haversine(lon1, lat1, lon2, lat2),
+            'location1': (lat1, lon1),
+            'location2': (lat2, lon2)
+        })
     return results
 
-def export_to_csv(results, city_name):
-    filename = f"{city_name}_intersections.csv"
+def export_to_csv(results, city_name, output_dir='.'):
+    filename = os.path.join(output_dir, f"{city_name}_intersections.csv")
     with open(filename, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
         writer.writerow(['רחוב 1', 'רחוב 2', 'מרחק (מטר)', 'קו רוחב 1', 'קו אורך 1', 'קו רוחב 2', 'קו אורך 2'])
@@ -117,14 +399,22 @@ def export_to_csv(results, city_name):
                            r['location1'][0], r['location1'][1], r['location2'][0], r['location2'][1]])
     print(f"✓ נשמר ל-{filename}")
 
-def export_to_json(results, city_name):
-    filename = f"{city_name}_intersections.json"
+def export_to_json(results, city_name, output_dir='.'):
+    filename = os.path.join(output_dir, f"{city_name}_intersections.json")
     with open(filename, 'w', encoding='utf-8') as f:
         json.dump(results, f, ensure_ascii=False, indent=2)
     print(f"✓ נשמר ל-{filename}")
 
-def export_to_html(results, city_name):
-    filename = f"{city_name}_intersections.html"
+def export_to_parquet(results, city_name, output_dir='.'):
+    import columnar  # pulls in pyarrow
+    if not columnar.available():
+        return
+    filename = os.path.join(output_dir, f"{city_name}_intersections.parquet")
+    columnar.write_results(results, filename, city=city_name)
+    print(f"✓ נשמר ל-{filename}")
+
+def export_to_html(results, city_name, output_dir='.'):
+    filename = os.path.join(output_dir, f"{city_name}_intersections.html")
     center_lat = sum(r['location1'][0] + r['location2'][0] for r in results) / (2 * len(results))
     center_lon = sum(r['location1'][1] + r['location2'][1] for r in results) / (2 * len(results))
     
@@ -147,7 +437,10 @@ def export_to_html(results, city_name):
     <meta charset="utf-8">
     <title>מפגשי רחובות כפולים - {city_name}</title>
     <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.css"/>
+    <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css"/>
     <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+    <script src="https://unpkg.com/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"></script>
     <style>
         * {{ margin: 0; padding: 0; box-sizing: border-box; }}
         body {{ font-family: Arial, sans-serif; }}
@@ -184,13 +477,14 @@ def export_to_html(results, city_name):
             attribution: '© OpenStreetMap'
         }}).addTo(map);
         
+        const cluster = L.markerClusterGroup();
         const markers = {{}};
         const lines = {{}};
         
         data.forEach(item => {{
-            const m1 = L.marker([item.lat1, item.lon1]).addTo(map)
+            const m1 = L.marker([item.lat1, item.lon1])
                 .bindPopup(`<b>#${{item.num}}</b><br>${{item.street1}} ⚬ ${{item.street2}}<br>מיקום 1<br>מרחק: ${{item.distance}}m`);
-            const m2 = L.marker([item.lat2, item.lon2]).addTo(map)
+            const m2 = L.marker([item.lat2, item.lon2])
                 .bindPopup(`<b>#${{item.num}}</b><br>${{item.street1}} ⚬ ${{item.street2}}<br>מיקום 2<br>מרחק: ${{item.distance}}m`);
             const line = L.polyline([[item.lat1, item.lon1], [item.lat2, item.lon2]], 
                 {{color: 'red', weight: 2, opacity: 0.5}}).addTo(map);
@@ -198,6 +492,8 @@ def export_to_html(results, city_name):
             markers[item.num] = [m1, m2];
             lines[item.num] = line;
         }});
+        cluster.addLayers(Object.values(markers).flat());
+        map.addLayer(cluster);
         
         const list = document.getElementById('list');
         data.forEach(item => {{
@@ -214,7 +510,7 @@ def export_to_html(results, city_name):
                 const midLat = (item.lat1 + item.lat2) / 2;
                 const midLon = (item.lon1 + item.lon2) / 2;
                 map.setView([midLat, midLon], 16);
-                markers[item.num][0].openPopup();
+                cluster.zoomToShowLayer(markers[item.num][0], () => markers[item.num][0].openPopup());
             }};
             list.appendChild(div);
         }});
@@ -226,19 +522,7 @@ def export_to_html(results, city_name):
         f.write(html)
     print(f"✓ נשמר ל-{filename}")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("שימוש: python find_duplicate_intersections.py <שם_עיר> [מרחק_מינימלי] [מרחק_מקסימלי]")
-        print("דוגמה: python find_duplicate_intersections.py ירושלים 150 1000")
-        sys.exit(1)
-    
-    city_name = sys.argv[1]
-    min_dist = int(sys.argv[2]) if len(sys.argv) > 2 else 150
-    max_dist = int(sys.argv[3]) if len(sys.argv) > 3 else None
-    
-    results = find_duplicate_intersections(city_name, min_dist, max_dist)
-    results = sorted(results, key=lambda x: x['distance'], reverse=True)
-    
+def print_results(results, city_name, min_dist, max_dist):
     if not results:
         print(f"לא נמצאו מפגשי רחובות כפולים ב-{city_name}")
     else:
@@ -260,9 +544,48 @@ if __name__ == "__main__":
         
         if len(results) > 20:
             print(f"... ועוד {len(results) - 20} תוצאות\n")
-        
-        print("מייצא קבצים...")
-        export_to_csv(results, city_name)
-        export_to_json(results, city_name)
-        export_to_html(results, city_name)
-        print(f"\n✓ סיום! פתח את {city_name}_intersections.html בדפדפן לראות מפה אינטראקטיבית")
+
+def export_results(results, city_name):
+    print("מייצא קבצים...")
+    export_to_csv(results, city_name)
+    export_to_json(results, city_name)
+    export_to_parquet(results, city_name)
+    export_to_html(results, city_name)
+    print(f"\n✓ סיום! פתח את {city_name}_intersections.html בדפדפן לראות מפה אינטראקטיבית")
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    flags = [a for a in sys.argv[1:] if a.startswith('--')]
+    precompute = '--precompute' in flags
+    # --geometric or --geometric=METERS
+    geometric = [a.partition('=')[2] for a in flags if a.split('=')[0] == '--geometric']
+    touch_tolerance = None
+    if geometric:
+        from geometric_intersections import DEFAULT_TOLERANCE
+        touch_tolerance = float(geometric[-1] or DEFAULT_TOLERANCE)
+    if not args:
+        print("שימוש: python find_duplicate_intersections.py <שם_עיר> [מרחק_מינימלי] [מרחק_מקסימלי] [--precompute] [--geometric[=מטרים]]")
+        print("דוגמה: python find_duplicate_intersections.py ירושלים 150 1000")
+        print("--precompute: שמירת אינדקס לכל הספים, כך שטווחי מרחק אחרים ייענו בלי לחשב מחדש")
+        print("--geometric: גם רחובות שנחתכים או כמעט נוגעים בלי צומת משותף (ברירת מחדל: 3 מטר)")
+        sys.exit(1)
+    
+    city_name = args[0]
+    min_dist = int(args[1]) if len(args) > 1 else 150
+    max_dist = int(args[2]) if len(args) > 2 else None
+    
+    from band_index import load_index, precompute_city
+    # The index only knows shared-node intersections
+    index = load_index(city_name) if touch_tolerance is None else None
+    if index is None and precompute and touch_tolerance is None:
+        print(f"מחשב אינדקס לכל הספים עבור {city_name}...")
+        index = precompute_city(city_name)
+    if index is not None:
+        print("עונה מהאינדקס המחושב מראש")
+        results = index.results(min_dist, max_dist)
+    else:
+        results = find_duplicate_intersections(city_name, min_dist, max_dist, touch_tolerance=touch_tolerance)
+    results = sorted_results(results)
+    print_results(results, city_name, min_dist, max_dist)
+    if results:
+        export_results(results, city_name)
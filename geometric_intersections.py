@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Street meetings that OSM doesn't record as a shared node.
+
+Two kinds are found from the way geometry:
+
+- crossings: segments of two streets on the same level that properly cross
+  with no node at the crossing point;
+- near-touches: a way that ends within tolerance meters of another street's
+  segment (a T-junction drawn a little short or long).
+
+Segments are bucketed on a uniform grid in a local equirectangular plane;
+only segments sharing a cell are compared, so the work grows with the number
+of segments and cell occupancy (a sort of all (cell, segment) entries), not
+with the square of the segment count, and a whole country fits in one pass.
+Long segments are indexed as short pieces, so a segment's entries grow with
+its length rather than with the area of its bounding box.
+Each hit is a point with the pair of streets that meet there; merge_hits()
+adds them to the shared-node intersections of those street pairs.
+"""
+import numpy as np
+
+DEFAULT_TOLERANCE = 3.0  # meters
+CELL_SIZE = 25.0  # meters; segment pieces are indexed on every cell their box touches
+PIECE_CELLS = 2  # segments longer than this many cells are indexed in pieces
+METERS_PER_DEGREE = 111320.0
+
+def _segments(graph):
+    """(a, b, street, level, a_end, b_end): node indices of every way segment and whether a/b end the way"""
+    counts = np.diff(graph.way_offsets)
+    ways = np.flatnonzero(counts >= 2)
+    seg_counts = counts[ways] - 1
+    way_of = np.repeat(ways, seg_counts)
+    # Position of each segment inside its way
+    pos = np.arange(len(way_of)) - np.repeat(np.cumsum(seg_counts) - seg_counts, seg_counts)
+    start = graph.way_offsets[way_of] + pos
+    a, b = graph.way_nodes[start], graph.way_nodes[start + 1]
+    return (a, b, graph.way_streets[way_of], graph.way_levels[way_of],
+            pos == 0, pos == seg_counts.repeat(seg_counts) - 1)
+
+def _candidate_segment_pairs(x1, y1, x2, y2, streets, levels, tolerance):
+    """Segment index pairs of different streets on the same level sharing a grid cell"""
+    cell = max(CELL_SIZE, 2 * tolerance)
+    # Cut long segments into pieces at most PIECE_CELLS cells long; a diagonal
+    # segment's box would otherwise cover (length / cell)² cells
+    pieces = np.maximum(1, np.ceil(np.hypot(x2 - x1, y2 - y1) / (PIECE_CELLS * cell))).astype(np.int64)
+    owner = np.repeat(np.arange(len(x1)), pieces)
+    k = np.arange(len(owner)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    t0, t1 = k / pieces[owner], (k + 1) / pieces[owner]
+    dx, dy = (x2 - x1)[owner], (y2 - y1)[owner]
+    px1, py1 = x1[owner] + t0 * dx, y1[owner] + t0 * dy
+    px2, py2 = x1[owner] + t1 * dx, y1[owner] + t1 * dy
+    piece_streets, piece_levels = streets[owner], levels[owner]
+
+    ix0 = np.floor((np.minimum(px1, px2) - tolerance) / cell).astype(np.int64)
+    ix1 = np.floor((np.maximum(px1, px2) + tolerance) / cell).astype(np.int64)
+    iy0 = np.floor((np.minimum(py1, py2) - tolerance) / cell).astype(np.int64)
+    iy1 = np.floor((np.maximum(py1, py2) + tolerance) / cell).astype(np.int64)
+    nx, ny = ix1 - ix0 + 1, iy1 - iy0 + 1
+    # One (cell, piece) entry per covered cell
+    per_seg = nx * ny
+    seg = np.repeat(np.arange(len(owner)), per_seg)
+    k = np.arange(len(seg)) - np.repeat(np.cumsum(per_seg) - per_seg, per_seg)
+    cx = ix0[seg] + k % nx[seg]
+    cy = iy0[seg] + k // nx[seg]
+    if not len(seg):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.lexsort((cy, cx))
+    seg, cx, cy = seg[order], cx[order], cy[order]
+
+    starts = np.flatnonzero(np.r_[True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+    sizes = np.diff(np.r_[starts, len(seg)])
+    firsts, seconds = [], []
+    for d in np.unique(sizes[sizes >= 2]):
+        cells = starts[sizes == d]
+        rows = seg[cells[:, None] + np.arange(d)]
+        i, j = np.triu_indices(int(d), 1)
+        i, j = rows[:, i].ravel(), rows[:, j].ravel()
+        row_cx, row_cy = np.repeat(cx[cells], len(i) // len(cells)), np.repeat(cy[cells], len(i) // len(cells))
+        # A pair that shares several cells is reported only in the corner cell of their overlap
+        keep = ((piece_streets[i] != piece_streets[j]) & (piece_levels[i] == piece_levels[j])
+                & (np.maximum(ix0[i], ix0[j]) == row_cx) & (np.maximum(iy0[i], iy0[j]) == row_cy))
+        firsts.append(owner[i[keep]])
+        seconds.append(owner[j[keep]])
+    if not firsts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    i, j = np.concatenate(firsts), np.concatenate(seconds)
+    # Several pieces of the same two segments can meet; keep each segment pair
+    # once, where it first appeared
+    _, first = np.unique(np.minimum(i, j) * len(x1) + np.maximum(i, j), return_index=True)
+    first.sort()
+    return i[first], j[first]
+
+def _point_segment(px, py, ax, ay, bx, by):
+    """Distance from p to segment ab and the closest point on it"""
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = np.clip(np.divide((px - ax) * dx + (py - ay) * dy, length2,
+                          out=np.zeros_like(length2), where=length2 > 0), 0, 1)
+    cx, cy = ax + t * dx, ay + t * dy
+    return np.hypot(px - cx, py - cy), cx, cy
+
+def find_geometric_intersections(graph, tolerance=DEFAULT_TOLERANCE):
+    """Crossings and near-touches between different streets.
+
+    Returns (pairs, lons, lats): pairs is an (H, 2) array of street ids
+    (a < b) meeting at (lons[h], lats[h]). Segment pairs that share a node
+    are skipped; that meeting is already a shared-node intersection.
+    """
+    a, b, streets, levels, a_end, b_end = _segments(graph)
+    lat0 = float(graph.lats.mean()) if len(graph) else 0.0
+    kx = METERS_PER_DEGREE * np.cos(np.radians(lat0))
+    x, y = graph.lons * kx, graph.lats * METERS_PER_DEGREE
+    x1, y1, x2, y2 = x[a], y[a], x[b], y[b]
+    i, j = _candidate_segment_pairs(x1, y1, x2, y2, streets, levels, tolerance)
+    apart = (a[i] != a[j]) & (a[i] != b[j]) & (b[i] != a[j]) & (b[i] != b[j])
+    i, j = i[apart], j[apart]
+    px1, py1, px2, py2 = x1[i], y1[i], x2[i], y2[i]
+    qx1, qy1, qx2, qy2 = x1[j], y1[j], x2[j], y2[j]
+
+    # Proper crossings: each segment's endpoints lie strictly on both sides of the other
+    d1 = (qx2 - qx1) * (py1 - qy1) - (qy2 - qy1) * (px1 - qx1)
+    d2 = (qx2 - qx1) * (py2 - qy1) - (qy2 - qy1) * (px2 - qx1)
+    d3 = (px2 - px1) * (qy1 - py1) - (py2 - py1) * (qx1 - px1)
+    d4 = (px2 - px1) * (qy2 - py1) - (py2 - py1) * (qx2 - px1)
+    crossing = (d1 * d2 < 0) & (d3 * d4 < 0)
+    t = np.divide(d1, d1 - d2, out=np.zeros_like(d1), where=crossing)
+    hx = np.where(crossing, px1 + t * (px2 - px1), np.nan)
+    hy = np.where(crossing, py1 + t * (py2 - py1), np.nan)
+
+    # Near-touches: a way end close to the other segment; the hit is halfway between them
+    best = np.full(len(i), np.inf)
+    for end, ex, ey, sx1, sy1, sx2, sy2 in [
+            (a_end[i], px1, py1, qx1, qy1, qx2, qy2), (b_end[i], px2, py2, qx1, qy1, qx2, qy2),
+            (a_end[j], qx1, qy1, px1, py1, px2, py2), (b_end[j], qx2, qy2, px1, py1, px2, py2)]:
+        d, cx, cy = _point_segment(ex, ey, sx1, sy1, sx2, sy2)
+        better = end & ~crossing & (d <= tolerance) & (d < best)
+        best[better] = d[better]
+        hx[better] = (ex[better] + cx[better]) / 2
+        hy[better] = (ey[better] + cy[better]) / 2
+
+    hit = ~np.isnan(hx)
+    first, second = streets[i[hit]], streets[j[hit]]
+    pairs = np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1)
+    return pairs, hx[hit] / kx, hy[hit] / METERS_PER_DEGREE
+
+def merge_hits(pairs, pair_offsets, lons, lats, hits, tolerance=DEFAULT_TOLERANCE):
+    """Add geometric hits to the intersection points of each street pair.
+
+    pairs/pair_offsets/lons/lats are street_pairs() points; hits is what
+    find_geometric_intersections() returned. A hit within tolerance of a
+    point its street pair already has is dropped. Existing points keep
+    their order and come before a pair's hits; returns the same four arrays.
+    """
+    hit_pairs, hit_lons, hit_lats = hits
+    if not len(hit_pairs):
+        return pairs, pair_offsets, lons, lats
+    counts = np.diff(pair_offsets)
+    all_a = np.r_[np.repeat(pairs[:, 0], counts), hit_pairs[:, 0]]
+    all_b = np.r_[np.repeat(pairs[:, 1], counts), hit_pairs[:, 1]]
+    all_lons, all_lats = np.r_[lons, hit_lons], np.r_[lats, hit_lats]
+    is_hit = np.r_[np.zeros(len(lons), dtype=bool), np.ones(len(hit_lons), dtype=bool)]
+    # Stable: shared nodes first in their order, then hits
+    order = np.lexsort((all_b, all_a))
+    all_a, all_b, is_hit = all_a[order], all_b[order], is_hit[order]
+    all_lons, all_lats = all_lons[order], all_lats[order]
+
+    starts = np.flatnonzero(np.r_[True, (all_a[1:] != all_a[:-1]) | (all_b[1:] != all_b[:-1])])
+    ends = np.r_[starts[1:], len(all_a)]
+    keep = np.ones(len(all_a), dtype=bool)
+    # Hits sort last in their group, so only groups ending in a hit need checking
+    with_hits = is_hit[ends - 1]
+    for s, e in zip(starts[with_hits].tolist(), ends[with_hits].tolist()):
+        kx = METERS_PER_DEGREE * np.cos(np.radians(all_lats[s]))
+        for h in (s + np.flatnonzero(is_hit[s:e])).tolist():
+            kept = s + np.flatnonzero(keep[s:h])
+            if len(kept) and np.min(np.hypot((all_lons[kept] - all_lons[h]) * kx,
+                                             (all_lats[kept] - all_lats[h]) * METERS_PER_DEGREE)) <= tolerance:
+                keep[h] = False
+    all_a, all_b, all_lons, all_lats = all_a[keep], all_b[keep], all_lons[keep], all_lats[keep]
+    starts = np.flatnonzero(np.r_[True, (all_a[1:] != all_a[:-1]) | (all_b[1:] != all_b[:-1])])
+    merged = np.stack([all_a[starts], all_b[starts]], axis=1).astype(pairs.dtype)
+    return merged, np.r_[starts, len(all_a)].astype(np.int64), all_lons, all_lats
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Incremental re-analysis of a city between runs.
+
+Per city we persist a content hash of every way (its name, node ids and node
+coordinates) and the best result of every street pair. On the next run the
+new graph's way hashes are compared with the stored ones; only street pairs
+that involve a street with an added, removed or changed way (including moved
+nodes) are recomputed, and everything else is carried over. A pair's result
+depends only on where its two streets meet and in which order those points
+come, so unchanged streets on both sides mean an unchanged result as long as
+the order holds. Node order shifts when other ways are deleted, so the state
+also keeps a digest of every result's meeting points in order, and a
+carried-over pair whose points now come in another order is recomputed.
+run_all_cities breaks distance ties by street names, so the output files
+match a full run byte for byte (checked by python -m benchmarks.check_parity
+--check incremental).
+"""
+import os
+import gzip
+import json
+import hashlib
+
+from find_duplicate_intersections import analyze_graph
+
+STATE_DIR = os.environ.get("INCREMENTAL_STATE_DIR", ".incremental_state")
+STATE_VERSION = 4
+
+def way_hashes(graph):
+    """{way_id: (hash, street_name)} for every way in the graph"""
+    hashes = {}
+    names = graph.street_names
+    for w, (way_id, street) in enumerate(zip(graph.way_ids.tolist(), graph.way_streets.tolist())):
+        nodes = graph.way_nodes[graph.way_offsets[w]:graph.way_offsets[w + 1]]
+        h = hashlib.blake2b(names[street].encode('utf-8'), digest_size=16)
+        h.update(graph.node_ids[nodes].tobytes())
+        h.update(graph.lons[nodes].tobytes())
+        h.update(graph.lats[nodes].tobytes())
+        h.update(graph.way_levels[w:w + 1].tobytes())
+        hashes[way_id] = (h.hexdigest(), names[street])
+    return hashes
+
+def state_path(city_name, state_dir=STATE_DIR):
+    return os.path.join(state_dir, f"{city_name}.json.gz")
+
+def load_state(city_name, state_dir=STATE_DIR):
+    try:
+        with gzip.open(state_path(city_name, state_dir), 'rt', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    return state if state.get('version') == STATE_VERSION else None
+
+def save_state(city_name, state, state_dir=STATE_DIR):
+    os.makedirs(state_dir, exist_ok=True)
+    path = state_path(city_name, state_dir)
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+def _as_result(r):
+    return dict(r, location1=tuple(r['location1']), location2=tuple(r['location2']))
+
+def incremental_analyze(city_name, graph, min_distance=150, max_distance=None, state_dir=STATE_DIR,
+                        touch_tolerance=None):
+    """Analyze a city's graph, reusing the previous run's state.
+
+    Returns (results, changed); changed is False when no way differs from
+    the stored state, so the city's outputs don't need to be rewritten.
+    """
+    hashes = way_hashes(graph)
+    state = load_state(city_name, state_dir)
+    point_orders = {}
+    if (state is None or state['min_distance'] != min_distance or state['max_distance'] != max_distance
+            or state['touch_tolerance'] != touch_tolerance):
+        results = analyze_graph(graph, min_distance, max_distance, touch_tolerance=touch_tolerance,
+                                point_orders=point_orders)
+    else:
+        old_ways = state['ways']
+        affected = set()
+        for way_id, (h, name) in hashes.items():
+            old = old_ways.get(str(way_id))
+            if old is None or old[0] != h:
+                affected.add(name)
+                if old is not None:
+                    affected.add(old[1])
+        for way_id in old_ways.keys() - {str(w) for w in hashes}:
+            affected.add(old_ways[way_id][1])
+        # Reordered ways reorder the nodes too, even when none of them changed
+        if not affected and list(old_ways) == [str(w) for w in hashes]:
+            return [_as_result(r) for r in state['results']], False
+
+        # Streets that disappeared entirely just drop out of the kept results
+        kept = []
+        for r, digest in zip(state['results'], state['orders']):
+            if r['street1'] not in affected and r['street2'] not in affected:
+                kept.append(_as_result(r))
+                point_orders[r['street1'], r['street2']] = digest
+        street_ids = {name: i for i, name in enumerate(graph.street_names)}
+        streets = [street_ids[name] for name in affected if name in street_ids]
+        fresh = analyze_graph(graph, min_distance, max_distance, streets, touch_tolerance, point_orders)
+        redone = {(r['street1'], r['street2']) for r in fresh}
+        results = [r for r in kept if (r['street1'], r['street2']) not in redone] + fresh
+
+    save_state(city_name, {
+        'version': STATE_VERSION,
+        'min_distance': min_distance,
+        'max_distance': max_distance,
+        'touch_tolerance': touch_tolerance,
+        'ways': {str(way_id): list(v) for way_id, v in hashes.items()},
+        'results': results,
+        'orders': [point_orders[r['street1'], r['street2']] for r in results],
+    }, state_dir)
+    return results, True
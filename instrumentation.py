@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Opt-in per-city stage timers, counts and memory.
+
+Library code marks its stages with stage('name') and reports sizes with
+count('name', n); both are no-ops unless a recording() is active in the
+current process, so uninstrumented runs pay nothing. Stage times are
+exclusive: time spent in a nested stage (e.g. 'parse' inside 'index', which
+interleave while streaming) is not counted again in the outer one.
+
+peak_rss is the high-water mark of the resident set while the city ran. On
+Linux the kernel's mark (VmHWM) is reset to the current RSS before each city
+by writing 5 to /proc/self/clear_refs, so a city doesn't inherit the peak of
+an earlier, bigger one in the same worker; elsewhere it is None.
+"""
+import os
+import json
+import time
+import cProfile
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+STAGES = ['fetch', 'parse', 'index', 'incremental', 'geometry', 'pairs', 'distances', 'export']
+
+_current = None
+
+class Recorder:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.counts = {}
+        self.stack = []
+        self.total = 0.0
+        self.peak_rss = None
+
+    def metrics(self):
+        return {
+            'seconds': round(self.total, 4),
+            'stages': {name: round(s, 4) for name, s in self.seconds.items()},
+            'counts': dict(self.counts),
+            'peak_rss': self.peak_rss,
+        }
+
+class _Stage:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.recorder.stack.append(self.name)
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        stack = self.recorder.stack
+        stack.pop()
+        self.recorder.seconds[self.name] += elapsed
+        if stack:
+            self.recorder.seconds[stack[-1]] -= elapsed
+
+def reset_peak_rss():
+    """Reset this process's RSS high-water mark to its current RSS; False where that isn't possible"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    """This process's RSS high-water mark (VmHWM) in bytes, or None without /proc"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+@contextmanager
+def recording():
+    """Record stages, counts and peak RSS inside the block"""
+    global _current
+    recorder, previous = Recorder(), _current
+    _current = recorder
+    measure_peak = reset_peak_rss()
+    start = time.perf_counter()
+    try:
+        yield recorder
+    finally:
+        recorder.total = time.perf_counter() - start
+        if measure_peak:
+            recorder.peak_rss = peak_rss()
+        _current = previous
+
+@contextmanager
+def profiling(path):
+    """Dump a cProfile of the block to path"""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        profiler.dump_stats(path)
+
+def stage(name):
+    return _Stage(_current, name) if _current is not None else nullcontext()
+
+def count(name, value):
+    if _current is not None:
+        _current.counts[name] = value
+
+def timed_iter(iterable, name, count_name=None):
+    """Charge the time spent producing each item to stage name (and count the items)"""
+    if _current is None:
+        return iterable
+    return _timed_iter(_current, iterable, name, count_name)
+
+def _timed_iter(recorder, iterable, name, count_name):
+    it = iter(iterable)
+    n = 0
+    while True:
+        with _Stage(recorder, name):
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+        n += 1
+        yield item
+    if count_name:
+        recorder.counts[count_name] = n
+
+def add_fetch_time(item, seconds):
+    """Fold a fetch timed outside the worker into a city's summary entry"""
+    metrics = item.get('metrics')
+    if metrics is not None:
+        metrics['stages']['fetch'] = round(metrics['stages'].get('fetch', 0.0) + seconds, 4)
+        metrics['seconds'] = round(metrics['seconds'] + seconds, 4)
+
+class RunLog:
+    """Append-only JSONL log: one 'city' record per city and a closing 'summary' record"""
+    def __init__(self, path, **run_info):
+        self.path = path
+        self.run_id = time.strftime('%Y%m%dT%H%M%S')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._write({'event': 'run', **run_info})
+
+    def _write(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'run': self.run_id, 'time': time.time(), **record}, ensure_ascii=False) + "\n")
+
+    def city(self, item):
+        self._write({'event': 'city', **item})
+
+    def summary(self, totals):
+        self._write({'event': 'summary', **totals})
+
+def aggregate(summary):
+    """Per-stage totals over all instrumented cities in a run summary"""
+    stages = defaultdict(float)
+    counts = defaultdict(int)
+    total, peak, cities = 0.0, None, 0
+    for item in summary:
+        metrics = item.get('metrics')
+        if not metrics:
+            continue
+        cities += 1
+        total += metrics['seconds']
+        if metrics['peak_rss'] is not None:
+            peak = max(peak or 0, metrics['peak_rss'])
+        for name, seconds in metrics['stages'].items():
+            stages[name] += seconds
+        for name, n in metrics['counts'].items():
+            counts[name] += n
+    return {'cities': cities, 'seconds': round(total, 4), 'stages': {k: round(v, 4) for k, v in stages.items()},
+            'counts': dict(counts), 'peak_rss': peak}
+
+def work_seconds(item):
+    """A city's instrumented time without its fetch"""
+    metrics = item['metrics']
+    return metrics['seconds'] - metrics['stages'].get('fetch', 0.0)
+
+def slowest(summary, n):
+    """The n instrumented cities of a run summary that took longest apart from fetching"""
+    timed = sorted((item for item in summary if item.get('metrics')), key=work_seconds, reverse=True)
+    return timed[:n]
+
+def profile_path(profile_dir, city):
+    return os.path.join(profile_dir, f"{city}.prof")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Spatially tiled result data for the unified map.
+
+Results are bucketed by the Web Mercator tile (at TILE_ZOOM) of the midpoint
+of their two locations and written as tiles/{z}/{x}/{y}.json, next to a small
+tiles/index.json holding per-tile counts and centroids plus the city list.
+The map page embeds the index, draws per-tile count bubbles when zoomed out
+and fetches only the tiles in view once zoomed in, so the page itself does not
+grow with the number of results. Browsers block fetch() for pages opened from
+disk, so every tile is also written as tiles/{z}/{x}/{y}.js, a script that
+hands the same records to window.offlineTile(key, records); the page then
+adds a script tag per tile in view instead of fetching. The index lists the
+tiles of each city, so a city's results can be gathered from its tiles
+alone.
+
+A tile record is [city_index, num, street1, street2, distance, lat1, lon1,
+lat2, lon2], where num is the result's position (1-based) in its city's
+results file.
+"""
+import os
+import json
+import math
+import shutil
+from collections import defaultdict
+
+TILE_ZOOM = 10
+DETAIL_ZOOM = 11
+FLUSH_RECORDS = 50000  # results buffered before they are appended to their tile files
+OFFLINE_CALLBACK = "offlineTile"
+
+def tile_of(lat, lon, zoom=TILE_ZOOM):
+    n = 1 << zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+class TileWriter:
+    """Buckets a stream of results (with a 'city' key) into tiles under out_dir/tiles.
+
+    Records are buffered per tile and appended to the tile files every
+    FLUSH_RECORDS results, so memory stays bounded by the buffer rather than
+    the number of results. The directory is built next to the old one and
+    swapped in by close(), so tiles of results that no longer exist do not
+    linger.
+    """
+    def __init__(self, out_dir, zoom=TILE_ZOOM, flush_records=FLUSH_RECORDS):
+        self.tiles_dir = os.path.join(out_dir, "tiles")
+        self.tmp_dir = self.tiles_dir + ".tmp"
+        self.zoom = zoom
+        self.flush_records = flush_records
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.city_index = {}
+        self.city_counts = []
+        self.city_tiles = []
+        self.buffers = defaultdict(list)
+        self.buffered = 0
+        # Per tile: [count, sum of latitudes, sum of longitudes]
+        self.sums = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def add(self, r):
+        city = self.city_index.setdefault(r['city'], len(self.city_index))
+        if city == len(self.city_counts):
+            self.city_counts.append(0)
+            self.city_tiles.append(set())
+        self.city_counts[city] += 1
+        (lat1, lon1), (lat2, lon2) = r['location1'], r['location2']
+        tile = tile_of((lat1 + lat2) / 2, (lon1 + lon2) / 2, self.zoom)
+        self.city_tiles[city].add(tile)
+        self.buffers[tile].append([city, self.city_counts[city], r['street1'], r['street2'],
+                                   round(r['distance'], 1), lat1, lon1, lat2, lon2])
+        sums = self.sums[tile]
+        sums[0] += 1
+        sums[1] += lat1 + lat2
+        sums[2] += lon1 + lon2
+        self.buffered += 1
+        if self.buffered >= self.flush_records:
+            self._flush()
+
+    def _tile_path(self, x, y, ext="json"):
+        return os.path.join(self.tmp_dir, str(self.zoom), str(x), f"{y}.{ext}")
+
+    def _flush(self):
+        # Each tile file is a JSON array written in pieces; close() adds the closing bracket
+        for (x, y), records in self.buffers.items():
+            path = self._tile_path(x, y)
+            new = not os.path.exists(path)
+            if new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(('[' if new else ',')
+                        + ','.join(json.dumps(rec, ensure_ascii=False, separators=(',', ':')) for rec in records))
+        self.buffers.clear()
+        self.buffered = 0
+
+    def close(self):
+        """Finish the tile files, write the index and swap the directory in; returns the index"""
+        self._flush()
+        tiles = sorted(self.sums)
+        index_tiles = []
+        for x, y in tiles:
+            count, lat_sum, lon_sum = self.sums[(x, y)]
+            with open(self._tile_path(x, y), 'a', encoding='utf-8') as f:
+                f.write(']')
+            # The same records as a script, for pages opened from disk
+            with open(self._tile_path(x, y), 'r', encoding='utf-8') as f, \
+                    open(self._tile_path(x, y, "js"), 'w', encoding='utf-8') as out:
+                out.write(f'{OFFLINE_CALLBACK}({json.dumps(f"{x}/{y}")},')
+                shutil.copyfileobj(f, out)
+                out.write(');\n')
+            index_tiles.append([x, y, count, round(lat_sum / (2 * count), 5), round(lon_sum / (2 * count), 5)])
+
+        total = sum(self.city_counts)
+        position = {tile: i for i, tile in enumerate(tiles)}
+        index = {
+            'zoom': self.zoom,
+            'detail_zoom': DETAIL_ZOOM,
+            'total': total,
+            'center': [sum(t[2] * t[3] for t in index_tiles) / total, sum(t[2] * t[4] for t in index_tiles) / total]
+                      if total else None,
+            # [name, result count, positions in 'tiles' of the tiles holding its results]
+            'cities': [[city, self.city_counts[i], sorted(position[t] for t in self.city_tiles[i])]
+                       for city, i in self.city_index.items()],
+            'tiles': index_tiles,
+        }
+        with open(os.path.join(self.tmp_dir, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, separators=(',', ':'))
+
+        old_dir = self.tiles_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(self.tiles_dir):
+            os.rename(self.tiles_dir, old_dir)
+        os.rename(self.tmp_dir, self.tiles_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return index
+
+    def discard(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
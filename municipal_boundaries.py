@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""Municipal boundaries and partitioning of a country-wide street dataset.
+
+Instead of one Overpass area query per city, the whole street network is
+loaded once and every way is assigned to the municipalities its nodes fall
+in, using point-in-polygon tests against a grid index of boundary polygons.
+Each city then gets the same ways + nodes it would have got from its own
+area query, as a StreetGraph.
+
+The country response is streamed from the cache and partitioned as it is
+parsed; neither the body nor a list of element dicts is held in memory.
+"""
+from array import array
+from bisect import bisect
+from collections import defaultdict
+from contextlib import contextmanager
+from math import floor
+
+import numpy as np
+
+from find_duplicate_intersections import is_runtime_error, open_overpass_stream, overpass_query
+from overpass_cache import default_cache
+from overpass_stream import iter_elements
+from street_graph import StreetGraph, way_level
+
+# (south, west, north, east) - Israel including Judea and Samaria
+ISRAEL_BBOX = (29.45, 34.2, 33.35, 35.9)
+CELL_SIZE = 0.0025  # degrees, roughly 250 m
+# Parity reference point inside each cell; deliberately off-centre so that it
+# doesn't land exactly on grid-aligned boundary edges
+REF_X, REF_Y = 0.5037, 0.4969
+
+def build_country_query(bbox=ISRAEL_BBOX):
+    return f"""
+    [out:json][timeout:900][maxsize:2147483648];
+    (
+      way["highway"]["name"]({bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]});
+    );
+    out body;
+    >;
+    out skel qt;
+    """
+
+def build_boundaries_query(bbox=ISRAEL_BBOX):
+    return f"""
+    [out:json][timeout:300];
+    relation["boundary"="administrative"]["admin_level"~"^(7|8)$"]["name"]({bbox[0]},{bbox[1]},{bbox[2]},{bbox[3]});
+    out geom;
+    """
+
+@contextmanager
+def country_elements(bbox=ISRAEL_BBOX, refresh=False):
+    """Yield an iterator over the country's elements, streamed from the cache (fetched on a miss)"""
+    key, fp = open_overpass_stream(build_country_query(bbox), 'ישראל', refresh=refresh)
+    meta = {}
+    with fp:
+        yield iter_elements(fp, meta)
+    if is_runtime_error(meta):
+        default_cache().discard(key)
+        raise RuntimeError(f"Overpass: {meta['remark']}")
+
+def assemble_rings(segments):
+    """Join open way geometries (lists of (lon, lat)) into closed rings"""
+    segments = [list(s) for s in segments if len(s) >= 2]
+    rings = []
+    while segments:
+        ring = segments.pop()
+        while ring[0] != ring[-1]:
+            for i, seg in enumerate(segments):
+                if seg[0] == ring[-1]:
+                    ring.extend(seg[1:])
+                elif seg[-1] == ring[-1]:
+                    ring.extend(reversed(seg[:-1]))
+                else:
+                    continue
+                segments.pop(i)
+                break
+            else:
+                # Broken relation (e.g. clipped geometry); close it as-is
+                ring.append(ring[0])
+        if len(ring) >= 4:
+            rings.append(ring)
+    return rings
+
+def get_city_boundaries(city_names, bbox=ISRAEL_BBOX):
+    """Return {city_name: [ring, ...]} for the requested municipalities"""
+    wanted = set(city_names)
+    data = overpass_query(build_boundaries_query(bbox), 'גבולות מוניציפליים')
+    members = defaultdict(list)
+    for e in data['elements']:
+        name = e.get('tags', {}).get('name')
+        if e['type'] != 'relation' or name not in wanted:
+            continue
+        for m in e.get('members', []):
+            if m['type'] == 'way' and m.get('geometry'):
+                members[name].append([(p['lon'], p['lat']) for p in m['geometry'] if p])
+    # Outer and inner rings both go in: the even-odd rule takes care of holes
+    return {name: assemble_rings(segs) for name, segs in members.items()}
+
+def _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+    def orient(px, py, qx, qy, rx, ry):
+        return (qx - px) * (ry - py) - (qy - py) * (rx - px)
+    d1 = orient(cx, cy, dx, dy, ax, ay)
+    d2 = orient(cx, cy, dx, dy, bx, by)
+    d3 = orient(ax, ay, bx, by, cx, cy)
+    d4 = orient(ax, ay, bx, by, dx, dy)
+    return (d1 > 0) != (d2 > 0) and (d3 > 0) != (d4 > 0)
+
+class BoundaryIndex:
+    """Grid index answering "which municipalities contain this point".
+
+    Each grid cell stores, per boundary, either "fully inside" or the
+    even-odd parity at a reference point in the cell plus the boundary edges
+    that pass through the cell. Points in fully-inside cells need no geometry
+    at all; points in edge cells only count crossings between the reference
+    point and the point against the few edges in that cell.
+    """
+    def __init__(self, boundaries, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.names = []
+        self.cells = defaultdict(list)
+        for name, rings in boundaries.items():
+            if rings:
+                self._add(len(self.names), rings)
+                self.names.append(name)
+
+    def _cell(self, lon, lat):
+        return floor(lon / self.cell_size), floor(lat / self.cell_size)
+
+    def _add(self, idx, rings):
+        edges = [(r[i][0], r[i][1], r[i + 1][0], r[i + 1][1]) for r in rings for i in range(len(r) - 1)]
+        lons = [p[0] for r in rings for p in r]
+        lats = [p[1] for r in rings for p in r]
+        min_cx, min_cy = self._cell(min(lons), min(lats))
+        max_cx, max_cy = self._cell(max(lons), max(lats))
+
+        # Conservatively map every edge to all cells its bounding box touches
+        edge_cells = defaultdict(list)
+        for edge in edges:
+            x0, y0 = self._cell(min(edge[0], edge[2]), min(edge[1], edge[3]))
+            x1, y1 = self._cell(max(edge[0], edge[2]), max(edge[1], edge[3]))
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    edge_cells[(cx, cy)].append(edge)
+
+        # A scanline through each row of reference points gives all their parities
+        for cy in range(min_cy, max_cy + 1):
+            y = (cy + REF_Y) * self.cell_size
+            xs = sorted(x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                        for x1, y1, x2, y2 in edges if (y1 > y) != (y2 > y))
+            for cx in range(min_cx, max_cx + 1):
+                x = (cx + REF_X) * self.cell_size
+                inside = bisect(xs, x) % 2 == 1
+                cell_edges = edge_cells.get((cx, cy))
+                if cell_edges:
+                    self.cells[(cx, cy)].append((idx, inside, cell_edges))
+                elif inside:
+                    self.cells[(cx, cy)].append((idx, True, None))
+
+    def locate(self, lon, lat):
+        """Names of all boundaries containing (lon, lat)"""
+        cx, cy = self._cell(lon, lat)
+        found = []
+        for idx, inside, cell_edges in self.cells.get((cx, cy), ()):
+            if cell_edges is not None:
+                ox, oy = (cx + REF_X) * self.cell_size, (cy + REF_Y) * self.cell_size
+                crossings = sum(1 for e in cell_edges if _segments_cross(ox, oy, lon, lat, *e))
+                inside = inside ^ (crossings % 2 == 1)
+            if inside:
+                found.append(self.names[idx])
+        return found
+
+def partition_by_city(elements, index):
+    """Split a stream of elements into one StreetGraph per city; yields (city_name, graph).
+
+    Like an Overpass area query, a city gets every named street with at
+    least one node inside it, together with all nodes of those streets.
+    Elements are consumed as they arrive: nodes are located right away and
+    kept as flat id/coordinate arrays, ways as flat node id arrays, so
+    memory is a few machine words per node. The graphs are built one city
+    at a time once the stream ends.
+    """
+    node_ids, lons, lats, node_places = array('q'), array('d'), array('d'), array('i')
+    # Distinct "which cities contain this node" answers; most nodes share one of a handful
+    places = {(): 0}
+    way_ids, way_levels, way_nodes, way_offsets = array('q'), array('b'), array('q'), array('q', [0])
+    way_names, names = [], {}
+    for e in elements:
+        if e['type'] == 'node':
+            node_ids.append(e['id'])
+            lons.append(e['lon'])
+            lats.append(e['lat'])
+            node_places.append(places.setdefault(tuple(index.locate(e['lon'], e['lat'])), len(places)))
+        elif e['type'] == 'way' and 'name' in e.get('tags', {}):
+            way_ids.append(e['id'])
+            way_levels.append(way_level(e['tags']))
+            way_names.append(names.setdefault(e['tags']['name'], e['tags']['name']))
+            way_nodes.extend(e['nodes'])
+            way_offsets.append(len(way_nodes))
+    if not way_ids or not node_ids:
+        return
+
+    ids = np.frombuffer(node_ids, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    refs = np.frombuffer(way_nodes, dtype=np.int64)
+    offsets = np.frombuffer(way_offsets, dtype=np.int64)
+    # Row in the node arrays of every way member (-1 for nodes the response doesn't have)
+    pos = np.minimum(np.searchsorted(sorted_ids, refs), len(sorted_ids) - 1)
+    rows = np.where(sorted_ids[pos] == refs, order[pos], -1)
+    member_places = np.where(rows >= 0, np.frombuffer(node_places, dtype=np.int32)[rows], 0)
+    member_ways = np.repeat(np.arange(len(way_ids)), np.diff(offsets))
+    place_cities = sorted(places, key=places.get)
+    city_ways = defaultdict(list)
+    # Sorted by way, so each city's ways keep their order in the response
+    for key in np.unique(member_ways[member_places > 0] * len(places) + member_places[member_places > 0]).tolist():
+        way, place = divmod(key, len(places))
+        for city in place_cities[place]:
+            if not city_ways[city] or city_ways[city][-1] != way:
+                city_ways[city].append(way)
+    del pos, member_places, member_ways, node_places, node_ids
+
+    for city, city_way_list in city_ways.items():
+        ways, coords = [], {}
+        for w in city_way_list:
+            start, end = offsets[w], offsets[w + 1]
+            ways.append((way_ids[w], way_names[w], refs[start:end].tolist(), way_levels[w]))
+            for node_id, row in zip(refs[start:end].tolist(), rows[start:end].tolist()):
+                if row >= 0:
+                    coords[node_id] = (lons[row], lats[row])
+        graph = StreetGraph.from_ways(ways, coords)
+        # Not kept alive while the caller works on the graph
+        del ways, coords
+        yield city, graph
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""Load named streets from a local OSM extract instead of the Overpass API.
+
+Produces the same {'elements': [...]} structure that get_city_data returns
+(named highway ways followed by the nodes they reference), so the result can
+be passed straight to find_duplicate_intersections(..., data=...);
+iter_extract() yields the same elements one at a time.
+
+.osm.pbf files need pyosmium (pip install osmium). Plain .osm/.osm.xml
+extracts (optionally .gz/.bz2 compressed) are read with the standard library
+when pyosmium is not installed, streets and municipal boundaries alike.
+"""
+import sys
+import bz2
+import gzip
+import xml.etree.ElementTree as ET
+
+try:
+    import osmium
+except ImportError:
+    osmium = None
+
+def _in_bbox(lon, lat, bbox):
+    south, west, north, east = bbox
+    return south <= lat <= north and west <= lon <= east
+
+def _open_xml(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+def _is_street(tags):
+    return 'highway' in tags and 'name' in tags
+
+def _iter_xml(path, tag):
+    with _open_xml(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event == 'end' and elem.tag in ('node', 'way', 'relation'):
+                if elem.tag == tag:
+                    yield elem
+                # Drop everything parsed so far; memory stays bounded by one element
+                root.clear()
+
+def _load_xml(path):
+    ways = []
+    needed = set()
+    for elem in _iter_xml(path, 'way'):
+        tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+        if _is_street(tags):
+            node_ids = [int(nd.get('ref')) for nd in elem.iter('nd')]
+            ways.append({'type': 'way', 'id': int(elem.get('id')), 'nodes': node_ids, 'tags': tags})
+            needed.update(node_ids)
+
+    # Second pass: coordinates only for nodes that belong to a street
+    coords = {}
+    for elem in _iter_xml(path, 'node'):
+        node_id = int(elem.get('id'))
+        if node_id in needed:
+            coords[node_id] = (float(elem.get('lon')), float(elem.get('lat')))
+    return ways, coords
+
+def _load_osmium(path):
+    ways = []
+    coords = {}
+
+    class StreetHandler(osmium.SimpleHandler):
+        def way(self, w):
+            tags = {t.k: t.v for t in w.tags}
+            if not _is_street(tags):
+                return
+            node_ids = []
+            for n in w.nodes:
+                node_ids.append(n.ref)
+                if n.location.valid():
+                    coords[n.ref] = (n.location.lon, n.location.lat)
+            ways.append({'type': 'way', 'id': w.id, 'nodes': node_ids, 'tags': tags})
+
+    # locations=True resolves way node coordinates in the same single pass
+    StreetHandler().apply_file(path, locations=True, idx='flex_mem')
+    return ways, coords
+
+def _boundary_tags_match(tags, wanted):
+    return (tags.get('boundary') == 'administrative' and tags.get('admin_level') in ('7', '8')
+            and tags.get('name') in wanted)
+
+def _load_boundaries_xml(path, wanted):
+    from municipal_boundaries import assemble_rings
+
+    # Relations come last in an extract, so: relations, then their ways, then those ways' nodes
+    member_ways = {}
+    for elem in _iter_xml(path, 'relation'):
+        tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+        if _boundary_tags_match(tags, wanted):
+            member_ways.setdefault(tags['name'], []).extend(
+                int(m.get('ref')) for m in elem.iter('member') if m.get('type') == 'way')
+    needed_ways = {way_id for ids in member_ways.values() for way_id in ids}
+    way_nodes = {}
+    for elem in _iter_xml(path, 'way'):
+        way_id = int(elem.get('id'))
+        if way_id in needed_ways:
+            way_nodes[way_id] = [int(nd.get('ref')) for nd in elem.iter('nd')]
+    needed_nodes = {node_id for refs in way_nodes.values() for node_id in refs}
+    coords = {}
+    for elem in _iter_xml(path, 'node'):
+        node_id = int(elem.get('id'))
+        if node_id in needed_nodes:
+            coords[node_id] = (float(elem.get('lon')), float(elem.get('lat')))
+
+    # Same assembly as the Overpass boundaries; the even-odd rule takes care of holes
+    boundaries = {}
+    for name, way_ids in member_ways.items():
+        segments = [[coords[n] for n in way_nodes[w] if n in coords] for w in way_ids if w in way_nodes]
+        boundaries[name] = assemble_rings(segments)
+    return boundaries
+
+def load_extract_boundaries(path, city_names):
+    """Return {city_name: [ring, ...]} for admin_level 7/8 boundaries in the extract.
+
+    Rings are lists of (lon, lat). With pyosmium, multipolygons are assembled
+    by osmium; plain XML extracts fall back to the standard library.
+    """
+    wanted = set(city_names)
+    if osmium is None:
+        if path.endswith('.pbf'):
+            raise ImportError("קריאת גבולות מקובץ PBF דורשת את pyosmium: pip install osmium")
+        return _load_boundaries_xml(path, wanted)
+    boundaries = {}
+
+    class BoundaryHandler(osmium.SimpleHandler):
+        def area(self, a):
+            tags = a.tags
+            if not _boundary_tags_match(tags, wanted):
+                return
+            rings = boundaries.setdefault(tags.get('name'), [])
+            for outer in a.outer_rings():
+                rings.append([(n.lon, n.lat) for n in outer])
+                for inner in a.inner_rings(outer):
+                    rings.append([(n.lon, n.lat) for n in inner])
+
+    BoundaryHandler().apply_file(path, locations=True, idx='flex_mem')
+    return boundaries
+
+def iter_extract(path, bbox=None):
+    """Yield named highway ways (and then their nodes) from an OSM extract.
+
+    bbox, if given, is (south, west, north, east); only ways with at least
+    one node inside it are kept.
+    """
+    if osmium is not None:
+        ways, coords = _load_osmium(path)
+    elif path.endswith('.pbf'):
+        raise ImportError("קריאת קבצי PBF דורשת את pyosmium: pip install osmium")
+    else:
+        ways, coords = _load_xml(path)
+
+    if bbox:
+        ways = [w for w in ways
+                if any(n in coords and _in_bbox(*coords[n], bbox) for n in w['nodes'])]
+
+    yield from ways
+    seen = set()
+    for way in ways:
+        for node_id in way['nodes']:
+            if node_id in coords and node_id not in seen:
+                seen.add(node_id)
+                lon, lat = coords[node_id]
+                yield {'type': 'node', 'id': node_id, 'lat': lat, 'lon': lon}
+
+def load_extract(path, bbox=None):
+    """Read named highway ways (and their nodes) from an OSM extract; see iter_extract()"""
+    return {'elements': list(iter_extract(path, bbox))}
+
+if __name__ == "__main__":
+    from find_duplicate_intersections import find_duplicate_intersections, print_results, export_results, sorted_results
+
+    if len(sys.argv) < 3:
+        print("שימוש: python osm_extract.py <קובץ_osm> <שם> [מרחק_מינימלי] [מרחק_מקסימלי]")
+        print("דוגמה: python osm_extract.py israel-and-palestine-latest.osm.pbf ישראל 150 1000")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    name = sys.argv[2]
+    min_dist = int(sys.argv[3]) if len(sys.argv) > 3 else 150
+    max_dist = int(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    print(f"קורא את {path}...")
+    data = load_extract(path)
+    results = find_duplicate_intersections(name, min_dist, max_dist, data=data)
+    results = sorted_results(results)
+    print_results(results, name, min_dist, max_dist)
+    if results:
+        export_results(results, name)
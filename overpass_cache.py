@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""On-disk cache for Overpass API responses.
+
+Entries are gzip-compressed response bodies stored under a content-addressed
+key (normalized query text + city name + bbox). A file's mtime records when
+it was fetched (used for the TTL) and its atime records when it was last
+read (used for LRU eviction once the cache grows past its size bound).
+
+An expired entry is simply fetched again. Overpass has no conditional
+requests (no ETag or If-Modified-Since), and asking it whether anything in
+a city changed since osm3s.timestamp_osm_base costs about as much as the
+query itself, so there is no revalidation step.
+
+Files derived from an entry (e.g. graph snapshots) can be kept next to it as
+companions: they count towards the size bound, are evicted, discarded and
+cleared together with the entry, and are dropped when the entry is rewritten.
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+CACHE_DIR = os.environ.get("OVERPASS_CACHE_DIR", ".overpass_cache")
+DEFAULT_TTL = float(os.environ.get("OVERPASS_CACHE_TTL", 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(os.environ.get("OVERPASS_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Writes between full rescans of the directory, to pick up other processes' writes
+EVICT_EVERY = 64
+# Eviction frees down to this fraction of max_bytes, so the next writes don't rescan right away
+EVICT_TARGET = 0.9
+
+# mkstemp creates files as 0600; entries get the usual umask-derived mode so a shared cache stays readable
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def normalize_query(query):
+    # Indentation and blank lines differ between call sites but not in meaning
+    return "\n".join(line.strip() for line in query.strip().splitlines() if line.strip())
+
+class OverpassCache:
+    def __init__(self, cache_dir=CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # Bytes on disk as of the last scan plus this process's changes since; None until scanned
+        self._total = None
+        self._writes = 0
+        # Fetch threads write concurrently; guards _total, _writes and evict()
+        self._lock = threading.Lock()
+
+    def key(self, query, city_name=None, bbox=None):
+        material = json.dumps([normalize_query(query), city_name, list(bbox) if bbox else None],
+                              ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json.gz")
+
+    def companion_path(self, key, suffix):
+        return os.path.join(self.cache_dir, key[:2], f"{key}{suffix}")
+
+    def save_companion(self, key, suffix, save):
+        """Write a file derived from key's entry by calling save(path)"""
+        path = self.companion_path(key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._commit(path, lambda: save(path))
+
+    def age(self, key):
+        """Seconds since the entry was fetched, or None if it is not cached"""
+        try:
+            return time.time() - os.stat(self.path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, key):
+        age = self.age(key)
+        return age is not None and (self.ttl is None or age <= self.ttl)
+
+    def open(self, key, allow_stale=False):
+        """Open a cached body for streaming reads, or return None on a miss"""
+        path = self.path(key)
+        if not (allow_stale or self.is_fresh(key)):
+            return None
+        try:
+            st = os.stat(path)
+            fp = gzip.open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        # Mark as recently used without touching the fetch time (in ns, so it survives exactly)
+        os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+        return fp
+
+    def touch(self, key):
+        """Mark an entry as recently used (for LRU eviction) without reading it"""
+        path = self.path(key)
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key, allow_stale=False):
+        fp = self.open(key, allow_stale)
+        if fp is None:
+            return None
+        with fp:
+            return fp.read()
+
+    def put(self, key, body):
+        with self.writer(key) as fp:
+            fp.write(body)
+
+    def discard(self, key):
+        """Remove an entry and its companions"""
+        self._remove(key)
+
+    def _remove(self, key, keep_entry=False):
+        subdir = os.path.dirname(self.path(key))
+        try:
+            names = os.listdir(subdir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if _entry_key(name) != key or (keep_entry and name.endswith('.json.gz')):
+                continue
+            path = os.path.join(subdir, name)
+            with self._lock:
+                try:
+                    size = os.stat(path).st_size
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                if self._total is not None:
+                    self._total -= size
+
+    def writer(self, key):
+        """Return a file object that atomically becomes the entry for key on close"""
+        return _AtomicGzipWriter(self, key)
+
+    def _commit(self, path, write):
+        """Call write() to create or replace path, and count the change in size.
+
+        Both happen under the lock, so an evict() walk sees the file either
+        before it changed or after it was counted, never counted twice.
+        """
+        with self._lock:
+            try:
+                replaced_size = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced_size = 0
+            write()
+            now = time.time()
+            os.utime(path, (now, now))
+            if self.max_bytes is None:
+                return
+            size = os.stat(path).st_size
+            self._writes += 1
+            if self._total is not None:
+                self._total += size - replaced_size
+            # Walking the directory is O(entries), so only do it when the running total
+            # says the bound is crossed, or every EVICT_EVERY writes to resync it
+            due = self._total is None or self._total > self.max_bytes or self._writes % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop least recently used entries (with their companions) once the cache is over max_bytes"""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            if os.path.isdir(self.cache_dir):
+                self._evict()
+
+    def _evict(self):
+        # Per key: [atime of the entry (None if it is gone), bytes, paths]
+        entries = {}
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                key = _entry_key(name)
+                if key is None:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = entries.setdefault(key, [None, 0, []])
+                if name.endswith('.json.gz'):
+                    entry[0] = st.st_atime
+                entry[1] += st.st_size
+                entry[2].append(path)
+        total = sum(size for _, size, _ in entries.values())
+        target = self.max_bytes * EVICT_TARGET if total > self.max_bytes else self.max_bytes
+        # Companions whose entry is gone go first, whatever the size
+        for atime, size, paths in sorted(entries.values(), key=lambda e: (e[0] is not None, e[0] or 0)):
+            if atime is not None and total <= target:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+        self._total = total
+
+    def clear(self):
+        with self._lock:
+            self._total = 0
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if _entry_key(name) is not None:
+                    os.remove(os.path.join(root, name))
+
+def _entry_key(name):
+    """The key an entry or companion file belongs to; None for in-progress writes"""
+    if name.endswith('.tmp'):
+        return None
+    return name.split('.', 1)[0]
+
+class _AtomicGzipWriter:
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.final_path = cache.path(key)
+        os.makedirs(os.path.dirname(self.final_path), exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.final_path), suffix='.tmp')
+        self.raw = os.fdopen(fd, 'wb')
+        self.gz = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+
+    def write(self, data):
+        return self.gz.write(data)
+
+    def close(self, commit=True):
+        self.gz.close()
+        self.raw.close()
+        if commit:
+            os.chmod(self.tmp_path, 0o666 & ~_UMASK)
+            self.cache._commit(self.final_path, lambda: os.replace(self.tmp_path, self.final_path))
+            # Companions were derived from the body that was just replaced
+            self.cache._remove(self.key, keep_entry=True)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+_default_cache = None
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OverpassCache()
+    return _default_cache
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Incremental parsing of Overpass JSON responses (and other large JSON arrays).
+
+iter_elements() yields the entries of the top-level "elements" array one at
+a time from a byte stream (an HTTP response or a cached gzip file), so the
+full body and the full parsed element list never have to be in memory at
+once. Only the standard library's JSONDecoder.raw_decode is used; the
+stream is decoded in chunks and each element is decoded as soon as it is
+complete in the buffer.
+"""
+import json
+import codecs
+
+CHUNK_SIZE = 1 << 16
+_WHITESPACE = ' \t\n\r'
+_DELIMITERS = _WHITESPACE + ',:]}'
+_decoder = json.JSONDecoder()
+
+class _Reader:
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buf += self.decoder.decode(b'', final=True)
+            return True
+        # Drop what has been consumed so the buffer stays around one chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character (not consumed), or '' at end of input"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Overpass JSON: expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode one complete JSON value at the current position"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number or literal cut at the buffer edge ("0." of "0.6") still
+            # decodes; only trust it once a delimiter follows
+            if not self.eof and (end == len(self.buf) or self.buf[end] not in _DELIMITERS):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+def _iter_array(reader):
+    reader.expect('[')
+    while True:
+        char = reader.peek()
+        if char == ']':
+            reader.pos += 1
+            return
+        if char == ',':
+            reader.pos += 1
+            continue
+        if char == '':
+            raise ValueError("JSON: unexpected end of input inside an array")
+        yield reader.value()
+
+def iter_json_array(fp, chunk_size=CHUNK_SIZE):
+    """Yield the items of a top-level JSON array from a binary stream"""
+    return _iter_array(_Reader(fp, chunk_size))
+
+def iter_elements(fp, meta=None, chunk_size=CHUNK_SIZE):
+    """Yield Overpass elements from a binary stream.
+
+    Other top-level keys (version, osm3s, remark, ...) are stored in meta if
+    a dict is given; a "remark" after the elements is only there once the
+    generator is exhausted.
+    """
+    reader = _Reader(fp, chunk_size)
+    reader.expect('{')
+    while True:
+        char = reader.peek()
+        if char == '}':
+            return
+        if char == ',':
+            reader.pos += 1
+            continue
+        if char == '':
+            raise ValueError("Overpass JSON: unexpected end of input")
+        key = reader.value()
+        reader.expect(':')
+        if key != 'elements':
+            value = reader.value()
+            if meta is not None:
+                meta[key] = value
+            continue
+        yield from _iter_array(reader)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Indexed SQLite store of all results, for point/area/band lookups.
+
+One row per result with B-tree indexes on city, streets and distance, and
+an R-tree over both intersection locations, so "everything within 2 km of
+here" or "the top pairs in this box between 300 and 800 m" are answered
+from the index instead of by loading the unified JSON.
+
+run_all_cities writes each city as it is exported; create_unified_results
+brings the whole store in line with the per-city files (it keeps the same
+per-file hash as the unified manifest and only re-reads cities whose file
+changed).
+
+Usage:
+    python results_store.py near 31.7767 35.2345 [--radius 2000] [--min 300] [--max 800]
+    python results_store.py top [--city CITY] [--street NAME] [--bbox S,W,N,E] [--min 300] [--max 800]
+    python results_store.py cities
+    python results_store.py serve [--port 8766]
+"""
+import json
+import hashlib
+import sqlite3
+import argparse
+from math import cos, radians
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from find_duplicate_intersections import haversine
+
+STORE_NAME = "results.sqlite"
+# Meters per degree of latitude
+METERS_PER_DEGREE = 111320.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cities (
+    city TEXT PRIMARY KEY,
+    sha256 TEXT,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    city TEXT NOT NULL,
+    street1 TEXT NOT NULL,
+    street2 TEXT NOT NULL,
+    distance REAL NOT NULL,
+    lat1 REAL NOT NULL,
+    lon1 REAL NOT NULL,
+    lat2 REAL NOT NULL,
+    lon2 REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_city ON results (city, distance);
+CREATE INDEX IF NOT EXISTS results_distance ON results (distance);
+CREATE INDEX IF NOT EXISTS results_street1 ON results (street1);
+CREATE INDEX IF NOT EXISTS results_street2 ON results (street2);
+-- Two entries per result: id * 2 for location1, id * 2 + 1 for location2
+CREATE VIRTUAL TABLE IF NOT EXISTS locations USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+"""
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _row_result(row):
+    return {
+        'city': row['city'],
+        'street1': row['street1'],
+        'street2': row['street2'],
+        'distance': row['distance'],
+        'location1': [row['lat1'], row['lon1']],
+        'location2': [row['lat2'], row['lon2']],
+    }
+
+class ResultsStore:
+    def __init__(self, path):
+        # Several worker processes may write cities at once; WAL lets readers carry on meanwhile
+        self.conn = sqlite3.connect(str(path), timeout=60)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def for_results_dir(cls, results_dir):
+        return cls(Path(results_dir) / STORE_NAME)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def city_hashes(self):
+        return {row['city']: row['sha256'] for row in self.conn.execute("SELECT city, sha256 FROM cities")}
+
+    def _delete_city(self, city):
+        self.conn.execute("""DELETE FROM locations WHERE id IN (
+                                 SELECT id * 2 FROM results WHERE city = ?
+                                 UNION ALL SELECT id * 2 + 1 FROM results WHERE city = ?)""", (city, city))
+        self.conn.execute("DELETE FROM results WHERE city = ?", (city,))
+        self.conn.execute("DELETE FROM cities WHERE city = ?", (city,))
+
+    def replace_city(self, city, results, sha256=None):
+        """Replace everything stored for city with results (any iterable of result dicts)"""
+        with self.conn:
+            self._delete_city(city)
+            count = 0
+            for r in results:
+                (lat1, lon1), (lat2, lon2) = r['location1'], r['location2']
+                cur = self.conn.execute(
+                    "INSERT INTO results (city, street1, street2, distance, lat1, lon1, lat2, lon2)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (city, r['street1'], r['street2'], r['distance'], lat1, lon1, lat2, lon2))
+                rid = cur.lastrowid
+                self.conn.executemany("INSERT INTO locations VALUES (?, ?, ?, ?, ?)",
+                                      [(rid * 2, lat1, lat1, lon1, lon1), (rid * 2 + 1, lat2, lat2, lon2, lon2)])
+                count += 1
+            self.conn.execute("INSERT INTO cities (city, sha256, count) VALUES (?, ?, ?)", (city, sha256, count))
+        return count
+
+    def remove_cities(self, cities):
+        with self.conn:
+            for city in cities:
+                self._delete_city(city)
+
+    def cities(self):
+        """[(city, count, max distance)] by descending count"""
+        return [tuple(row) for row in self.conn.execute(
+            """SELECT c.city, c.count, (SELECT max(distance) FROM results r WHERE r.city = c.city)
+               FROM cities c ORDER BY c.count DESC, c.city""")]
+
+    def _filters(self, city=None, street=None, min_distance=None, max_distance=None):
+        clauses, params = [], []
+        if city is not None:
+            clauses.append("r.city = ?")
+            params.append(city)
+        if street is not None:
+            clauses.append("(r.street1 = ? OR r.street2 = ?)")
+            params += [street, street]
+        if min_distance is not None:
+            clauses.append("r.distance >= ?")
+            params.append(min_distance)
+        if max_distance is not None:
+            clauses.append("r.distance <= ?")
+            params.append(max_distance)
+        return clauses, params
+
+    def top(self, city=None, street=None, min_distance=None, max_distance=None, bbox=None, limit=100):
+        """Results by descending distance; bbox=(south, west, north, east) keeps those with a location inside"""
+        clauses, params = self._filters(city, street, min_distance, max_distance)
+        if bbox is not None:
+            south, west, north, east = bbox
+            # The R-tree keeps float32 boxes rounded outwards, so it only preselects
+            clauses.append("""r.id IN (SELECT id / 2 FROM locations
+                                       WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?)""")
+            clauses.append("""((r.lat1 BETWEEN ? AND ? AND r.lon1 BETWEEN ? AND ?)
+                               OR (r.lat2 BETWEEN ? AND ? AND r.lon2 BETWEEN ? AND ?))""")
+            params += [south, north, west, east] + [south, north, west, east] * 2
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.conn.execute(f"SELECT r.* FROM results r {where} ORDER BY r.distance DESC LIMIT ?",
+                                 params + [limit])
+        return [_row_result(row) for row in rows]
+
+    def near(self, lat, lon, radius=2000, city=None, street=None, min_distance=None, max_distance=None, limit=100):
+        """Results with a location within radius meters of (lat, lon), nearest first.
+
+        Each result gets 'nearest': the distance in meters from the point to
+        its closer location.
+        """
+        dlat = radius / METERS_PER_DEGREE
+        dlon = radius / (METERS_PER_DEGREE * max(cos(radians(lat)), 1e-6))
+        clauses, params = self._filters(city, street, min_distance, max_distance)
+        clauses.append("""r.id IN (SELECT id / 2 FROM locations
+                                   WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?)""")
+        params += [lat - dlat, lat + dlat, lon - dlon, lon + dlon]
+        rows = self.conn.execute(f"SELECT r.* FROM results r WHERE {' AND '.join(clauses)}", params)
+        found = []
+        for row in rows:
+            nearest = min(haversine(lon, lat, row['lon1'], row['lat1']), haversine(lon, lat, row['lon2'], row['lat2']))
+            if nearest <= radius:
+                result = _row_result(row)
+                result['nearest'] = round(nearest, 1)
+                found.append(result)
+        found.sort(key=lambda r: r['nearest'])
+        return found[:limit]
+
+def store_city(output_dir, city, results, source):
+    """Record a freshly exported city; source is the file create_unified_results will read it from"""
+    with ResultsStore.for_results_dir(output_dir) as store:
+        store.replace_city(city, results, file_sha256(source))
+
+def drop_city(output_dir, city):
+    """Forget a city that no longer has results"""
+    with ResultsStore.for_results_dir(output_dir) as store:
+        store.remove_cities([city])
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    store_path = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        args = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            with ResultsStore(self.store_path) as store:
+                if url.path == '/near':
+                    body = store.near(float(args['lat']), float(args['lon']), float(args.get('radius', 2000)),
+                                      **_common_args(args))
+                elif url.path == '/top':
+                    bbox = tuple(map(float, args['bbox'].split(','))) if 'bbox' in args else None
+                    body = store.top(bbox=bbox, **_common_args(args))
+                elif url.path == '/cities':
+                    body = [{'city': c, 'count': n, 'max_distance': d} for c, n, d in store.cities()]
+                else:
+                    self.send_error(404)
+                    return
+        except (KeyError, ValueError) as e:
+            self.send_error(400, f"bad query: {e}")
+            return
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def _common_args(args):
+    return {
+        'city': args.get('city'),
+        'street': args.get('street'),
+        'min_distance': float(args['min']) if 'min' in args else None,
+        'max_distance': float(args['max']) if 'max' in args else None,
+        'limit': int(args.get('limit', 100)),
+    }
+
+def serve(store_path, host='127.0.0.1', port=8766):
+    """Answer /near, /top and /cities with JSON (same parameters as the CLI)"""
+    handler = type('Handler', (_QueryHandler,), {'store_path': str(store_path)})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"שרת שאילתות על {store_path} בכתובת http://{host}:{server.server_address[1]}/")
+    print("  /near?lat=..&lon=..&radius=..  /top?city=..&bbox=S,W,N,E  /cities  (+ min, max, street, limit)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def _print_results(results):
+    for r in results:
+        near = f" | {r['nearest']:.0f} מ' מהנקודה" if 'nearest' in r else ""
+        print(f"{r['city']} | {r['street1']} ↔ {r['street2']} | {r['distance']:.0f} מ'{near}")
+    print(f"\n{len(results)} תוצאות")
+
+def main():
+    parser = argparse.ArgumentParser(description="שאילתות על מאגר התוצאות")
+    parser.add_argument('--results-dir', default="duplicate_intersections_results")
+    sub = parser.add_subparsers(dest='command', required=True)
+    near = sub.add_parser('near', help="תוצאות בטווח מנקודה")
+    near.add_argument('lat', type=float)
+    near.add_argument('lon', type=float)
+    near.add_argument('--radius', type=float, default=2000, help="רדיוס במטרים")
+    top = sub.add_parser('top', help="התוצאות הרחוקות ביותר")
+    top.add_argument('--bbox', help="S,W,N,E")
+    for p in (near, top):
+        p.add_argument('--city')
+        p.add_argument('--street')
+        p.add_argument('--min', type=float, dest='min_distance')
+        p.add_argument('--max', type=float, dest='max_distance')
+        p.add_argument('--limit', type=int, default=100)
+    sub.add_parser('cities', help="ערים במאגר")
+    srv = sub.add_parser('serve', help="שרת HTTP מקומי לשאילתות")
+    srv.add_argument('--host', default='127.0.0.1')
+    srv.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    store_path = Path(args.results_dir) / STORE_NAME
+    if not store_path.exists():
+        print(f"לא נמצא מאגר ב-{store_path}; הריצו את run_all_cities.py או create_unified_results.py")
+        return
+    if args.command == 'serve':
+        serve(store_path, args.host, args.port)
+        return
+    with ResultsStore(store_path) as store:
+        if args.command == 'cities':
+            for city, count, max_distance in store.cities():
+                print(f"{city:30} | {count:5} תוצאות | עד {max_distance or 0:.0f} מ'")
+            return
+        common = {'city': args.city, 'street': args.street, 'min_distance': args.min_distance,
+                  'max_distance': args.max_distance, 'limit': args.limit}
+        if args.command == 'near':
+            _print_results(store.near(args.lat, args.lon, args.radius, **common))
+        else:
+            bbox = tuple(map(float, args.bbox.split(','))) if args.bbox else None
+            _print_results(store.top(bbox=bbox, **common))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,22 @@
 #!/usr/bin/env python3
 import os
-import sys
 import time
-from find_duplicate_intersections import find_duplicate_intersections, export_to_csv, export_to_json, export_to_html
+import shutil
+import argparse
+import tempfile
+import instrumentation
+import async_fetch
+import columnar
+import results_store
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from fetch_scheduler import FetchScheduler
+from geometric_intersections import DEFAULT_TOLERANCE
+from find_duplicate_intersections import find_duplicate_intersections, analyze_graph, build_graph, export_to_csv, export_to_json, export_to_parquet, export_to_html, is_city_cached, load_city_graph, sorted_results
+from incremental import incremental_analyze
+from municipal_boundaries import BoundaryIndex, country_elements, get_city_boundaries, partition_by_city
+from osm_extract import iter_extract, load_extract_boundaries
+from street_graph import StreetGraph
 
 # Top 200 Israeli cities and towns
 CITIES = [
@@ -36,55 +50,89 @@ CITIES = [
 # Remove duplicates and keep unique cities
 CITIES = list(dict.fromkeys(CITIES))
 
-def main():
-    output_dir = "duplicate_intersections_results"
-    os.makedirs(output_dir, exist_ok=True)
+def save_city_results(city, results, output_dir):
+    """Export one city's results and return its summary entry"""
+    results = sorted_results(results)
+    city_dir = os.path.join(output_dir, city)
+    if not results:
+        # Drop what an earlier run exported, or the store and the unified files keep the old results
+        with instrumentation.stage('export'):
+            shutil.rmtree(city_dir, ignore_errors=True)
+            results_store.drop_city(output_dir, city)
+        return {'city': city, 'count': 0, 'max_distance': 0}
     
-    print(f"מריץ ניתוח על {len(CITIES)} ערים...")
-    print(f"התוצאות יישמרו ב-{output_dir}/\n")
+    # Save to city-specific subdirectory
+    os.makedirs(city_dir, exist_ok=True)
     
-    summary = []
+    with instrumentation.stage('export'):
+        export_to_csv(results, city, city_dir)
+        export_to_json(results, city, city_dir)
+        export_to_parquet(results, city, city_dir)
+        export_to_html(results, city, city_dir)
+        # Hashed from the file create_unified_results reads, so it won't load this city again
+        suffix = 'parquet' if columnar.available() else 'json'
+        results_store.store_city(output_dir, city, results, os.path.join(city_dir, f"{city}_intersections.{suffix}"))
     
-    for i, city in enumerate(CITIES, 1):
-        print(f"[{i}/{len(CITIES)}] מעבד {city}...", end=" ", flush=True)
-        
-        try:
-            results = find_duplicate_intersections(city, min_distance=150)
-            results = sorted(results, key=lambda x: x['distance'], reverse=True)
-            
-            if results:
-                # Save to city-specific subdirectory
-                city_dir = os.path.join(output_dir, city)
-                os.makedirs(city_dir, exist_ok=True)
-                
-                # Change to city directory for exports
-                original_dir = os.getcwd()
-                os.chdir(city_dir)
-                
-                export_to_csv(results, city)
-                export_to_json(results, city)
-                export_to_html(results, city)
-                
-                os.chdir(original_dir)
-                
-                summary.append({
-                    'city': city,
-                    'count': len(results),
-                    'max_distance': results[0]['distance'] if results else 0
-                })
-                print(f"✓ נמצאו {len(results)} תוצאות")
-            else:
-                print("✗ לא נמצאו תוצאות")
-                summary.append({'city': city, 'count': 0, 'max_distance': 0})
-        
-        except Exception as e:
-            print(f"✗ שגיאה: {e}")
-            summary.append({'city': city, 'count': -1, 'max_distance': 0})
-        
-        # Be nice to OSM servers
-        time.sleep(2)
+    return {
+        'city': city,
+        'count': len(results),
+        'max_distance': results[0]['distance']
+    }
+
+def analyze_city(city, output_dir, min_distance=150, data=None, allow_stale=False, incremental=False,
+                 touch_tolerance=None, instrument=False, graph_path=None):
+    """Find and export one city's results; runs inside a worker process.
+
+    The city's streets come from data, from a StreetGraph snapshot at
+    graph_path, or else from its (cached) Overpass response. With
+    instrument, the summary entry gets a 'metrics' dict (stage times,
+    counts and the city's peak RSS).
+    """
+    if not instrument:
+        return _analyze_city(city, output_dir, min_distance, data, allow_stale, incremental, touch_tolerance,
+                             graph_path)
+    with instrumentation.recording() as recorder:
+        item = _analyze_city(city, output_dir, min_distance, data, allow_stale, incremental, touch_tolerance,
+                             graph_path)
+    item['metrics'] = recorder.metrics()
+    return item
+
+def _analyze_city(city, output_dir, min_distance, data, allow_stale, incremental, touch_tolerance, graph_path=None):
+    graph = None
+    if graph_path is not None:
+        with instrumentation.stage('index'):
+            graph = StreetGraph.load(graph_path)[0]
+    if not incremental:
+        if graph is not None:
+            results = analyze_graph(graph, min_distance, touch_tolerance=touch_tolerance)
+        else:
+            results = find_duplicate_intersections(city, min_distance=min_distance, data=data, allow_stale=allow_stale,
+                                                   touch_tolerance=touch_tolerance)
+        return save_city_results(city, results, output_dir)
     
-    # Print summary
+    if graph is None:
+        graph = load_city_graph(city, allow_stale=allow_stale) if data is None else build_graph(data)
+    with instrumentation.stage('incremental'):
+        results, changed = incremental_analyze(city, graph, min_distance, touch_tolerance=touch_tolerance)
+    json_file = os.path.join(output_dir, city, f"{city}_intersections.json")
+    if changed or (results and not os.path.exists(json_file)):
+        return save_city_results(city, results, output_dir)
+    # Nothing changed since the last run; the existing outputs are still valid
+    results = sorted_results(results)
+    return {
+        'city': city,
+        'count': len(results),
+        'max_distance': results[0]['distance'] if results else 0
+    }
+
+def status_line(item):
+    if item['count'] > 0:
+        return f"✓ נמצאו {item['count']} תוצאות"
+    if item['count'] == 0:
+        return "✗ לא נמצאו תוצאות"
+    return f"✗ שגיאה: {item.get('error', '')}"
+
+def print_summary(summary, output_dir, profiles=()):
     print("\n" + "="*80)
     print("סיכום".center(80))
     print("="*80)
@@ -99,7 +147,254 @@ def main():
         else:
             print(f"{item['city']:30} | שגיאה")
     
+    totals = instrumentation.aggregate(summary)
+    if totals['cities']:
+        print_stage_summary(summary, totals)
+    for path in profiles:
+        print(f"  פרופיל: {path}")
+    
     print(f"\n✓ כל הקבצים נשמרו ב-{output_dir}/")
 
+def print_stage_summary(summary, totals, slowest=10):
+    print("\n" + "-"*80)
+    print(f"זמנים לפי שלב ({totals['cities']} ערים, {totals['seconds']:.1f} שניות עבודה):")
+    for name in instrumentation.STAGES:
+        seconds = totals['stages'].get(name, 0.0)
+        if seconds:
+            print(f"  {name:12} | {seconds:8.2f}s | {100 * seconds / max(totals['seconds'], 1e-9):5.1f}%")
+    counts = totals['counts']
+    print("  " + " | ".join(f"{name}: {counts[name]:,}" for name in
+                            ('elements', 'nodes', 'street_pairs', 'intersections', 'results') if name in counts))
+    if totals['peak_rss'] is not None:
+        print(f"  זיכרון שיא (RSS) של העיר הכבדה ביותר: {totals['peak_rss'] / 2 ** 20:.0f} MiB")
+    
+    print("\nהערים האיטיות ביותר:")
+    for item in instrumentation.slowest(summary, slowest):
+        stages = item['metrics']['stages']
+        top = sorted((name for name in stages if name != 'fetch'), key=stages.get, reverse=True)[:3]
+        peak = item['metrics']['peak_rss']
+        print(f"{item['city']:30} | {instrumentation.work_seconds(item):7.2f}s | "
+              f"fetch {stages.get('fetch', 0.0):7.2f}s | "
+              + ", ".join(f"{name} {stages[name]:.2f}s" for name in top)
+              + (f" | RSS {peak / 2 ** 20:.0f} MiB" if peak is not None else ""))
+
+def start_run(output_dir, mode, run_log=None, profile_top=0):
+    """Set up opt-in instrumentation; returns (analyze_city kwargs, run log, profile dir)"""
+    if run_log is None and not profile_top:
+        return {}, None, None
+    profile_dir = os.path.join(output_dir, "profiles") if profile_top else None
+    log = instrumentation.RunLog(run_log, mode=mode, cities=len(CITIES)) if run_log else None
+    return {'instrument': True}, log, profile_dir
+
+def profile_slowest(summary, profile_dir, n, touch_tolerance=None, graph_paths=None):
+    """Analyze the n slowest cities of a finished run again under cProfile; returns the dump paths.
+
+    Profiling every city would slow them all down and skew which ones rank
+    as slowest, so the run is only timed and the slowest cities are re-run
+    here, one at a time, into a scratch directory. Cities rank by their time
+    without the fetch, which the re-run (reading the cache) doesn't repeat. The re-run is a full
+    analysis (not --incremental) of the same input: the cached response, or
+    the city's graph from graph_paths in a national run.
+    """
+    cities = [item['city'] for item in instrumentation.slowest(summary, n) if item['count'] >= 0]
+    if not cities:
+        return []
+    print(f"\nמריץ פרופיל על {len(cities)} הערים האיטיות ביותר...")
+    paths = []
+    with tempfile.TemporaryDirectory() as scratch:
+        for city in cities:
+            path = instrumentation.profile_path(profile_dir, city)
+            graph_path = graph_paths.get(city) if graph_paths is not None else None
+            # A national run's cities without streets have no snapshot; they must not be fetched
+            data = {'elements': []} if graph_paths is not None and graph_path is None else None
+            with instrumentation.profiling(path):
+                _analyze_city(city, scratch, 150, data, True, False, touch_tolerance, graph_path)
+            paths.append(path)
+    return paths
+
+def finish_run(summary, output_dir, log=None, profile_dir=None, profile_top=0, touch_tolerance=None,
+               graph_paths=None):
+    if log:
+        log.summary(instrumentation.aggregate(summary))
+    profiles = profile_slowest(summary, profile_dir, profile_top, touch_tolerance, graph_paths) if profile_dir else []
+    print_summary(summary, output_dir, profiles)
+
+def main(output_dir="duplicate_intersections_results", incremental=False, run_log=None, profile_top=0,
+         touch_tolerance=None):
+    os.makedirs(output_dir, exist_ok=True)
+    options, log, profile_dir = start_run(output_dir, 'sequential', run_log, profile_top)
+    
+    print(f"מריץ ניתוח על {len(CITIES)} ערים...")
+    print(f"התוצאות יישמרו ב-{output_dir}/\n")
+    
+    summary = []
+    
+    for i, city in enumerate(CITIES, 1):
+        print(f"[{i}/{len(CITIES)}] מעבד {city}...", end=" ", flush=True)
+        cached = is_city_cached(city)
+        
+        try:
+            item = analyze_city(city, output_dir, incremental=incremental, touch_tolerance=touch_tolerance, **options)
+        except Exception as e:
+            item = {'city': city, 'count': -1, 'max_distance': 0, 'error': str(e)}
+        print(status_line(item))
+        summary.append(item)
+        if log:
+            log.city(item)
+        
+        # Be nice to OSM servers (cached cities never hit them)
+        if not cached:
+            time.sleep(2)
+    
+    finish_run(summary, output_dir, log, profile_dir, profile_top, touch_tolerance)
+
+@contextmanager
+def open_fetcher(concurrency, use_async=False):
+    """Yield submit(city) -> Future of the seconds spent downloading city (waits for a turn excluded)"""
+    if use_async and async_fetch.aiohttp is None:
+        print("aiohttp לא מותקן - ההורדות ירוצו ב-threads")
+    elif use_async:
+        with async_fetch.AsyncFetcher(per_endpoint=concurrency) as fetcher:
+            yield fetcher.submit
+        return
+    scheduler = FetchScheduler()
+    with ThreadPoolExecutor(concurrency) as fetchers:
+        yield lambda city: fetchers.submit(scheduler.fetch, city)
+
+def main_parallel(workers=None, fetch_concurrency=2, output_dir="duplicate_intersections_results",
+                  incremental=False, run_log=None, profile_top=0, use_async=False, touch_tolerance=None):
+    """Fetch politely in background threads and analyze cities in a process pool.
+
+    Each city is handed to the pool as soon as its data is available, and
+    results are reported as they complete rather than in CITIES order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    print(f"מריץ ניתוח מקבילי על {len(CITIES)} ערים...")
+    print(f"התוצאות יישמרו ב-{output_dir}/\n")
+    
+    options, log, profile_dir = start_run(output_dir, 'parallel', run_log, profile_top)
+    summary = []
+    # Fetches run here, outside the workers, so their time is added afterwards
+    fetch_seconds = {}
+    
+    with open_fetcher(fetch_concurrency, use_async) as submit_fetch, ProcessPoolExecutor(workers) as pool:
+        pending = {submit_fetch(city): ('fetch', city) for city in CITIES}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, city = pending.pop(future)
+                try:
+                    if stage == 'fetch':
+                        fetch_seconds[city] = future.result()
+                        # The scheduler already refreshed what it could; use whatever is cached
+                        future = pool.submit(analyze_city, city, output_dir, allow_stale=True, incremental=incremental,
+                                             touch_tolerance=touch_tolerance, **options)
+                        pending[future] = ('analyze', city)
+                        continue
+                    item = future.result()
+                    instrumentation.add_fetch_time(item, fetch_seconds.get(city, 0.0))
+                except Exception as e:
+                    item = {'city': city, 'count': -1, 'max_distance': 0, 'error': str(e)}
+                summary.append(item)
+                if log:
+                    log.city(item)
+                print(f"[{len(summary)}/{len(CITIES)}] {city}: {status_line(item)}", flush=True)
+    
+    finish_run(summary, output_dir, log, profile_dir, profile_top, touch_tolerance)
+
+def main_national(extract_path=None, workers=None, output_dir="duplicate_intersections_results",
+                  incremental=False, run_log=None, profile_top=0, touch_tolerance=None):
+    """Load the whole country once and analyze every city from that one graph"""
+    os.makedirs(output_dir, exist_ok=True)
+    options, log, profile_dir = start_run(output_dir, 'national', run_log, profile_top)
+    
+    if extract_path:
+        boundaries = load_extract_boundaries(extract_path, CITIES)
+        print(f"קורא את {extract_path}...")
+        source = nullcontext(iter_extract(extract_path))
+    else:
+        boundaries = get_city_boundaries(CITIES)
+        print("מוריד את רשת הרחובות של כל הארץ...")
+        source = country_elements()
+    
+    summary = []
+    
+    def report(item):
+        summary.append(item)
+        if log:
+            log.city(item)
+        print(f"[{len(summary)}/{len(CITIES)}] {item['city']}: {status_line(item)}", flush=True)
+    
+    for city in CITIES:
+        if city not in boundaries:
+            report({'city': city, 'count': -1, 'max_distance': 0, 'error': 'לא נמצא גבול מוניציפלי'})
+    
+    # Workers get a snapshot path per city rather than pickled element lists
+    with tempfile.TemporaryDirectory(prefix="partitions") as partition_dir, ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        graph_paths = {}
+        
+        def submit(city, **city_input):
+            futures[pool.submit(analyze_city, city, output_dir, incremental=incremental,
+                                touch_tolerance=touch_tolerance, **city_input, **options)] = city
+        
+        print(f"מחלק לפי גבולות של {len(boundaries)} רשויות...")
+        with source as elements:
+            for city, graph in partition_by_city(elements, BoundaryIndex(boundaries)):
+                path = os.path.join(partition_dir, f"{len(futures)}.sgraph")
+                graph.save(path)
+                del graph
+                graph_paths[city] = path
+                submit(city, graph_path=path)
+        for city in CITIES:
+            if city in boundaries and city not in graph_paths:
+                submit(city, data={'elements': []})
+        
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                city = futures.pop(future)
+                try:
+                    item = future.result()
+                except Exception as e:
+                    item = {'city': city, 'count': -1, 'max_distance': 0, 'error': str(e)}
+                report(item)
+        
+        # Still inside the with: profiling re-reads the partition snapshots
+        finish_run(summary, output_dir, log, profile_dir, profile_top, touch_tolerance, graph_paths)
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="ניתוח מפגשי רחובות כפולים בכל הערים")
+    parser.add_argument("--national", nargs="?", const="", metavar="OSM_FILE",
+                        help="טעינה אחת של כל הארץ וחלוקה לפי גבולות ערים (אופציונלית מקובץ OSM מקומי)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="מספר תהליכי ניתוח במקביל (0 = לפי מספר הליבות)")
+    parser.add_argument("--fetch-concurrency", type=int, default=2,
+                        help="מספר הורדות במקביל לכל שרת Overpass")
+    parser.add_argument("--async-fetch", action="store_true",
+                        help="הורדה עם asyncio ו-aiohttp על חיבור משותף (במקום threads)")
+    parser.add_argument("--endpoint", action="append", metavar="URL",
+                        help="כתובת שרת Overpass (ניתן לחזור; ברירת המחדל: OVERPASS_URLS או השרת הציבורי)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="ניתוח מחדש רק של זוגות רחובות שהשתנו מאז הריצה הקודמת")
+    parser.add_argument("--geometric", nargs="?", type=float, const=DEFAULT_TOLERANCE, metavar="METERS",
+                        help="גם רחובות שנחתכים או כמעט נוגעים בלי צומת משותף ב-OSM (ברירת מחדל: 3 מטר)")
+    parser.add_argument("--run-log", nargs="?", const="duplicate_intersections_results/run_log.jsonl", metavar="PATH",
+                        help="מדידת זמנים לפי שלב, ספירות וזיכרון לכל עיר, ורישום שלהן לקובץ JSONL")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="שמירת פרופיל cProfile של N הערים האיטיות ביותר (בתיקייה profiles/)")
+    args = parser.parse_args()
+    if args.endpoint:
+        # Read by overpass_endpoints() here and in the worker processes
+        os.environ["OVERPASS_URLS"] = ",".join(args.endpoint)
+    workers = args.workers or None
+    instrument = {'run_log': args.run_log, 'profile_top': args.profile}
+    options = {'incremental': args.incremental, 'touch_tolerance': args.geometric, **instrument}
+    
+    if args.national is not None:
+        main_national(args.national or None, workers, **options)
+    elif args.workers == 1:
+        main(**options)
+    else:
+        main_parallel(workers, args.fetch_concurrency, use_async=args.async_fetch, **options)
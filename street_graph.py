@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Compact, array-backed street graph.
+
+Replaces the nodes dict / node_to_streets defaultdict(set) / street_pairs
+dict-of-lists structures with a handful of flat arrays:
+
+- street_names: interned names, sorted, so street id order == name order
+  and an (a, b) pair with a < b is the same as the old s1 < s2 pair.
+- node_ids / lons / lats: one row per intersection-candidate node, in order
+  of first appearance in the ways (the old node_to_streets order).
+- offsets / members: CSR membership, the street ids of node i are
+  members[offsets[i]:offsets[i + 1]], sorted and de-duplicated.
+- way_ids / way_streets / way_offsets / way_nodes: the ways themselves, the
+  node indices of way w are way_nodes[way_offsets[w]:way_offsets[w + 1]]
+  (nodes without coordinates are left out).
+- way_levels: vertical level of each way (its layer tag, or +1/-1 for
+  untagged bridges/tunnels); ways on different levels don't meet.
+
+save()/load() keep a graph as a binary snapshot: a fixed header, a JSON
+table of contents, a UTF-8 string table of street names and the arrays,
+each 64-byte aligned. load() maps the file and returns np.frombuffer views
+into it, so opening a snapshot costs about the name decoding, and
+processes that open the same snapshot share its pages.
+"""
+import os
+import json
+import mmap
+import struct
+from array import array
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"SGRAPH"
+SNAPSHOT_VERSION = 1
+# magic, version, table of contents length
+_HEADER = struct.Struct("<6sHI")
+_ALIGN = 64
+ARRAYS = ['node_ids', 'lons', 'lats', 'offsets', 'members', 'way_ids', 'way_streets', 'way_offsets', 'way_nodes',
+          'way_levels']
+
+def way_level(tags):
+    try:
+        return max(-5, min(5, int(tags.get('layer', ''))))
+    except ValueError:
+        pass
+    if tags.get('bridge', 'no') != 'no':
+        return 1
+    if tags.get('tunnel', 'no') != 'no':
+        return -1
+    return 0
+
+class StreetGraph:
+    def __init__(self, street_names, node_ids, lons, lats, offsets, members,
+                 way_ids, way_streets, way_offsets, way_nodes, way_levels=None):
+        self.street_names = street_names
+        self.node_ids = node_ids
+        self.lons = lons
+        self.lats = lats
+        self.offsets = offsets
+        self.members = members
+        self.way_ids = way_ids
+        self.way_streets = way_streets
+        self.way_offsets = way_offsets
+        self.way_nodes = way_nodes
+        self.way_levels = way_levels if way_levels is not None else np.zeros(len(way_ids), dtype=np.int8)
+
+    @classmethod
+    def from_elements(cls, elements):
+        """Build from Overpass-style elements (named ways + nodes, any order)"""
+        coords = {}
+        ways = []
+        for e in elements:
+            if e['type'] == 'node':
+                coords[e['id']] = (e['lon'], e['lat'])
+            elif e['type'] == 'way' and 'name' in e.get('tags', {}):
+                ways.append((e['id'], e['tags']['name'], e['nodes'], way_level(e['tags'])))
+        return cls.from_ways(ways, coords)
+
+    @classmethod
+    def from_ways(cls, ways, coords):
+        """Build from (way_id, street_name, node_ids, level) ways and a {node_id: (lon, lat)} table"""
+        name_ids = {}
+        node_index = {}
+        member_nodes = array('q')
+        member_streets = array('i')
+        way_ids = array('q')
+        way_streets = array('i')
+        way_offsets = array('q', [0])
+        way_levels = array('b')
+        for way_id, name, node_ids, level in ways:
+            street = name_ids.setdefault(name, len(name_ids))
+            way_ids.append(way_id)
+            way_levels.append(level)
+            way_streets.append(street)
+            for node_id in node_ids:
+                if node_id in coords:
+                    member_nodes.append(node_index.setdefault(node_id, len(node_index)))
+                    member_streets.append(street)
+            way_offsets.append(len(member_nodes))
+
+        # Renumber streets so that ids follow name order
+        street_names = sorted(name_ids)
+        remap = np.empty(len(street_names), dtype=np.int32)
+        for new_id, name in enumerate(street_names):
+            remap[name_ids[name]] = new_id
+
+        n_nodes = len(node_index)
+        n_streets = max(len(street_names), 1)
+        nodes = np.frombuffer(member_nodes, dtype=np.int64)
+        streets = remap[np.frombuffer(member_streets, dtype=np.int32)]
+        # One sort de-duplicates (node, street) and lays the CSR rows out
+        keys = np.unique(nodes * n_streets + streets)
+        members = (keys % n_streets).astype(np.int32)
+        offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n_streets, minlength=n_nodes), out=offsets[1:])
+
+        node_ids = np.fromiter(node_index, dtype=np.int64, count=n_nodes)
+        lon_lat = np.array([coords[n] for n in node_index], dtype=np.float64).reshape(-1, 2)
+        return cls(street_names, node_ids, lon_lat[:, 0].copy(), lon_lat[:, 1].copy(), offsets, members,
+                   np.frombuffer(way_ids, dtype=np.int64), remap[np.frombuffer(way_streets, dtype=np.int32)],
+                   np.frombuffer(way_offsets, dtype=np.int64), nodes, np.frombuffer(way_levels, dtype=np.int8))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def save(self, path, **meta):
+        """Write a snapshot (atomically); meta is stored with it and returned by load()"""
+        encoded = [name.encode('utf-8') for name in self.street_names]
+        name_offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+        np.cumsum([len(b) for b in encoded], out=name_offsets[1:])
+        blobs = [('name_offsets', name_offsets), ('names', np.frombuffer(b"".join(encoded), dtype=np.uint8))]
+        blobs += [(name, np.ascontiguousarray(getattr(self, name))) for name in ARRAYS]
+
+        # Offsets are relative to the start of the data area, which is aligned too
+        toc, position = {}, 0
+        for name, a in blobs:
+            toc[name] = [a.dtype.newbyteorder('<').str, len(a), position]
+            position += -(-a.nbytes // _ALIGN) * _ALIGN
+        head = json.dumps({'arrays': toc, 'meta': meta}).encode('utf-8')
+        data_start = -(-(_HEADER.size + len(head)) // _ALIGN) * _ALIGN
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(head)) + head)
+            for name, a in blobs:
+                f.seek(data_start + toc[name][2])
+                f.write(a.astype(toc[name][0], copy=False).tobytes())
+            f.truncate(data_start + position)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """(graph, meta) from a snapshot, or None if it is missing or from another version"""
+        try:
+            with open(path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):  # ValueError: empty file
+            return None
+        if len(buf) < _HEADER.size:
+            return None
+        magic, version, head_len = _HEADER.unpack_from(buf)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+        head = json.loads(bytes(buf[_HEADER.size:_HEADER.size + head_len]))
+        data_start = -(-(_HEADER.size + head_len) // _ALIGN) * _ALIGN
+        arrays = {name: np.frombuffer(buf, dtype=dtype, count=count, offset=data_start + offset)
+                  for name, (dtype, count, offset) in head['arrays'].items()}
+        names, name_offsets = arrays.pop('names'), arrays.pop('name_offsets').tolist()
+        raw = names.tobytes()
+        street_names = [raw[a:b].decode('utf-8') for a, b in zip(name_offsets, name_offsets[1:])]
+        return cls(street_names, *(arrays[name] for name in ARRAYS)), head['meta']
+
+    def street_pairs(self):
+        """Group shared nodes by street pair.
+
+        Returns (pairs, pair_offsets, pair_nodes): pairs is an (P, 2) array of
+        street ids (a < b), and the node indices shared by pair p are
+        pair_nodes[pair_offsets[p]:pair_offsets[p + 1]], in node order.
+        """
+        degree = np.diff(self.offsets)
+        firsts, seconds, nodes = [], [], []
+        for d in np.unique(degree[degree >= 2]):
+            node_rows = np.flatnonzero(degree == d)
+            rows = self.members[self.offsets[node_rows][:, None] + np.arange(d)]
+            i, j = np.triu_indices(int(d), 1)
+            firsts.append(rows[:, i].ravel())
+            seconds.append(rows[:, j].ravel())
+            nodes.append(np.repeat(node_rows, len(i)))
+        if not nodes:
+            return np.empty((0, 2), dtype=np.int32), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        firsts, seconds, nodes = np.concatenate(firsts), np.concatenate(seconds), np.concatenate(nodes)
+        order = np.lexsort((nodes, seconds, firsts))
+        firsts, seconds, nodes = firsts[order], seconds[order], nodes[order]
+        starts = np.flatnonzero(np.r_[True, (firsts[1:] != firsts[:-1]) | (seconds[1:] != seconds[:-1])])
+        pairs = np.stack([firsts[starts], seconds[starts]], axis=1)
+        pair_offsets = np.r_[starts, len(nodes)].astype(np.int64)
+        return pairs, pair_offsets, nodes
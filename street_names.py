@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Street-name normalization and "same street, different spelling" checks.
+
+Each name is normalized to its token set once (lowercased, common Hebrew
+street-type prefixes stripped, split on whitespace), and NameIndex answers
+similarity for a whole city's street pairs at once. It uses an inverted
+token index, so only names that share a token are ever compared.
+"""
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+PREFIXES = ['רחוב ', 'שדרות ', 'דרך ', 'רח\' ', 'שד\' ']
+SIMILARITY_THRESHOLD = 0.7
+
+@lru_cache(maxsize=1 << 16)
+def name_tokens(name):
+    name = name.lower()
+    # Remove common prefixes (in order, so "רחוב שדרות X" loses both)
+    for prefix in PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    return frozenset(name.split())
+
+def tokens_similar(words1, words2):
+    # If one set is subset of the other, they're similar
+    if words1 <= words2 or words2 <= words1:
+        return True
+
+    # If they share most words (>70%), they're similar
+    if words1 and words2:
+        similarity = len(words1 & words2) / max(len(words1), len(words2))
+        if similarity > SIMILARITY_THRESHOLD:
+            return True
+
+    return False
+
+class NameIndex:
+    """Similarity lookups over a fixed list of street names (ids = list positions)"""
+    def __init__(self, names):
+        self.names = names
+        self.tokens = [name_tokens(n) for n in names]
+        self.postings = defaultdict(list)
+        self.empty = []
+        for street_id, words in enumerate(self.tokens):
+            if not words:
+                self.empty.append(street_id)
+            for word in words:
+                self.postings[word].append(street_id)
+        self._similar = None
+
+    def _candidate_count(self):
+        n = len(self.names)
+        shared = sum(len(p) * (len(p) - 1) // 2 for p in self.postings.values())
+        return shared + len(self.empty) * n
+
+    def similar_pairs(self):
+        """Set of (a, b), a < b, of all similar name pairs.
+
+        Two names can only be similar if they share a token, or if one of
+        them has no tokens at all (the empty set is a subset of anything).
+        """
+        if self._similar is None:
+            similar = set()
+            checked = set()
+            for ids in self.postings.values():
+                for x in range(len(ids)):
+                    for y in range(x + 1, len(ids)):
+                        pair = (ids[x], ids[y]) if ids[x] < ids[y] else (ids[y], ids[x])
+                        if pair in checked:
+                            continue
+                        checked.add(pair)
+                        if tokens_similar(self.tokens[pair[0]], self.tokens[pair[1]]):
+                            similar.add(pair)
+            for a in self.empty:
+                for b in range(len(self.names)):
+                    if a != b:
+                        similar.add((min(a, b), max(a, b)))
+            self._similar = similar
+        return self._similar
+
+    def similar_mask(self, pairs):
+        """Boolean mask over an (P, 2) array of street id pairs (a < b)"""
+        if len(pairs) == 0:
+            return np.zeros(0, dtype=bool)
+        # Precomputing every similar pair only pays off when it is cheaper
+        # than checking the pairs actually asked about
+        if self._similar is not None or self._candidate_count() <= len(pairs):
+            n = len(self.names)
+            keys = pairs[:, 0].astype(np.int64) * n + pairs[:, 1]
+            similar = np.fromiter((a * n + b for a, b in self.similar_pairs()), dtype=np.int64)
+            return np.isin(keys, similar)
+        tokens = self.tokens
+        return np.fromiter((tokens_similar(tokens[a], tokens[b]) for a, b in pairs.tolist()),
+                           dtype=bool, count=len(pairs))